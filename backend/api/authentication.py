@@ -0,0 +1,95 @@
+"""
+Аутентификация по токену с кэшированием.
+
+Пользователь, найденный по токену, хранится в небольшом LRU-кэше
+процесса с коротким временем жизни и в общем кэше. Записи общего кэша
+удаляются при удалении токена (выход из системы), а также при любом
+сохранении пользователя: смене пароля, деактивации, изменении профиля.
+Записи других процессов устаревают не позднее чем через
+AUTH_TOKEN_LOCAL_TIMEOUT секунд. Каждый запрос получает свою копию
+пользователя и токена, поэтому изменения объектов в одном запросе
+не видны другим.
+
+QuerySet.update() и bulk_update() не отправляют сигналов: после
+массового изменения пользователей (например, деактивации через
+update(is_active=False)) нужно вызвать invalidate_user_tokens, иначе
+их токены действуют до истечения AUTH_TOKEN_CACHE_TIMEOUT.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+TOKEN_CACHE_KEY = 'auth_token:{}'
+
+
+class LocalLRUCache:
+    """Потокобезопасный LRU-кэш с временем жизни записей."""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.timeout, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+
+local_cache = LocalLRUCache(
+    settings.AUTH_TOKEN_LOCAL_CACHE_SIZE, settings.AUTH_TOKEN_LOCAL_TIMEOUT)
+
+
+def invalidate_tokens(keys):
+    """Удаляет токены из кэшей."""
+    keys = list(keys)
+    for key in keys:
+        local_cache.delete(key)
+    cache.delete_many([TOKEN_CACHE_KEY.format(key) for key in keys])
+
+
+def invalidate_user_tokens(user_ids):
+    """Удаляет из кэшей все токены пользователей."""
+    invalidate_tokens(Token.objects.filter(
+        user_id__in=user_ids).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе для известных токенов."""
+
+    def authenticate_credentials(self, key):
+        credentials = local_cache.get(key)
+        if credentials is None:
+            credentials = cache.get(TOKEN_CACHE_KEY.format(key))
+            if credentials is None:
+                credentials = super().authenticate_credentials(key)
+                cache.set(TOKEN_CACHE_KEY.format(key), credentials,
+                          settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            local_cache.set(key, credentials)
+        return copy.deepcopy(credentials)
@@ -0,0 +1,171 @@
+"""
+Поток событий о новых рецептах авторов, на которых подписан пользователь.
+
+Отдаётся в формате Server-Sent Events приложением ASGI напрямую,
+без обработчика запросов Django: открытое соединение стоит одной
+очереди и двух задач asyncio. Сообщения брокера читает одна задача
+процесса (EventHub) и раздаёт их очередям подключённых подписчиков.
+Токен передаётся в заголовке Authorization или параметром token,
+так как EventSource в браузере не умеет задавать заголовки.
+"""
+
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework import exceptions
+
+from recipes.events import get_broker
+from .authentication import CachedTokenAuthentication
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = '/api/events/'
+KEEPALIVE = b': keepalive\n\n'
+# Пауза перед повторным подключением к брокеру после сбоя, в секундах.
+RECONNECT_DELAY = 1
+
+
+class EventHub:
+    """Раздаёт сообщения брокера соединениям текущего процесса."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.connections = defaultdict(set)
+        self.task = None
+
+    def connect(self, user_id):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(
+                self.dispatch())
+        queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.connections[user_id].add(queue)
+        return queue
+
+    def disconnect(self, user_id, queue):
+        queues = self.connections.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.connections[user_id]
+
+    def deliver(self, message):
+        for user_id in message['users']:
+            for queue in self.connections.get(user_id, ()):
+                # Медленный клиент теряет события, а не память сервера:
+                # пропущенное он заберёт через /api/sync/.
+                if not queue.full():
+                    queue.put_nowait(message['event'])
+
+    async def dispatch(self):
+        while True:
+            try:
+                async for message in self.broker.listen():
+                    self.deliver(message)
+            except Exception:
+                logger.exception('Потеряно соединение с брокером событий')
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+hub = EventHub(get_broker())
+
+
+def get_token(scope):
+    """Достаёт токен из заголовка Authorization или параметра token."""
+    headers = dict(scope['headers'])
+    auth = headers.get(b'authorization', b'').split()
+    if len(auth) == 2 and auth[0].lower() == b'token':
+        return auth[1].decode('latin-1')
+    tokens = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    return tokens[0] if tokens else None
+
+
+@sync_to_async
+def authenticate(key):
+    """Возвращает пользователя по токену или None."""
+    close_old_connections()
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+    except exceptions.AuthenticationFailed:
+        return None
+    finally:
+        close_old_connections()
+    return user
+
+
+def format_event(event):
+    return (
+        f'id: {event["id"]}\nevent: recipe\n'
+        f'data: {json.dumps(event, ensure_ascii=False)}\n\n'
+    ).encode()
+
+
+async def send_error(send, status, detail):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': detail}, ensure_ascii=False).encode(),
+    })
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_events(queue, send):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': KEEPALIVE,
+                'more_body': True})
+    while True:
+        try:
+            chunk = format_event(await asyncio.wait_for(
+                queue.get(), settings.EVENTS_KEEPALIVE_INTERVAL))
+        except asyncio.TimeoutError:
+            chunk = KEEPALIVE
+        await send({'type': 'http.response.body', 'body': chunk,
+                    'more_body': True})
+
+
+async def recipe_events(scope, receive, send):
+    """Приложение ASGI, отдающее поток событий пользователю."""
+    if scope['method'] != 'GET':
+        await send_error(send, 405, 'Метод не разрешен.')
+        return
+    key = get_token(scope)
+    if key is None:
+        await send_error(send, 401, 'Учетные данные не были предоставлены.')
+        return
+    user = await authenticate(key)
+    if user is None:
+        await send_error(send, 401, 'Недопустимый токен.')
+        return
+    queue = hub.connect(user.id)
+    tasks = (
+        asyncio.ensure_future(stream_events(queue, send)),
+        asyncio.ensure_future(wait_disconnect(receive)),
+    )
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        hub.disconnect(user.id, queue)
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,102 @@
+"""
+Быстрое чтение списков без полей сериализаторов.
+
+Строки загружаются через values()/values_list(), связанные данные
+страницы загружаются пачками, а словари ответа собираются напрямую.
+Результат совпадает с ответом TagSerializer, IngredientSerializer
+и RecipeSerializer, поэтому при изменении этих сериализаторов функции
+ниже нужно менять вместе с ними.
+"""
+
+from collections import defaultdict
+
+from recipes.models import (
+    Favorite, Recipe, RecipeIngredients, ShoppingCart, Subscription, Tag, User
+)
+
+# Поля values(), которые сами по себе совпадают с ответом сериализатора
+TAG_FIELDS = ('id', 'name', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+RECIPE_FIELDS = ('id', 'author_id', 'image', 'name', 'text', 'cooking_time')
+AUTHOR_FIELDS = (
+    'username', 'first_name', 'last_name', 'id', 'email', 'avatar'
+)
+
+
+def file_url_builder(model, field, request):
+    """
+    Возвращает функцию, строящую ссылку на файл так же,
+    как ImageField сериализатора.
+    """
+    storage = model._meta.get_field(field).storage
+
+    def file_url(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+    return file_url
+
+
+def build_recipes(rows, request):
+    """
+    Список рецептов в формате RecipeSerializer.
+    rows - словари с полями RECIPE_FIELDS, например страница
+    queryset.values(*RECIPE_FIELDS).
+    """
+    rows = list(rows)
+    recipe_ids = [row['id'] for row in rows]
+    author_ids = {row['author_id'] for row in rows}
+    user = request.user
+    image_url = file_url_builder(Recipe, 'image', request)
+    avatar_url = file_url_builder(User, 'avatar', request)
+
+    tags = {tag['id']: tag for tag in Tag.objects.values(*TAG_FIELDS)}
+    # Теги рецепта выводятся в порядке сортировки модели Tag.
+    positions = {tag_id: index for index, tag_id in enumerate(tags)}
+    recipe_tags = defaultdict(list)
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'tag_id'):
+        recipe_tags[recipe_id].append(tag_id)
+
+    ingredients = defaultdict(list)
+    for recipe_id, *ingredient in RecipeIngredients.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id', 'ingredient__name',
+                  'ingredient__measurement_unit', 'amount'):
+        ingredients[recipe_id].append(dict(zip(
+            ('id', 'name', 'measurement_unit', 'amount'), ingredient)))
+
+    favorited = subscribed = in_cart = ()
+    if user.is_authenticated:
+        favorited = set(Favorite.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        in_cart = set(ShoppingCart.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        subscribed = set(Subscription.objects.filter(
+            subscriber=user, author_id__in=author_ids
+        ).values_list('author_id', flat=True))
+
+    authors = {}
+    for author in User.objects.filter(
+            id__in=author_ids).values(*AUTHOR_FIELDS):
+        author['avatar'] = avatar_url(author['avatar'])
+        author['is_subscribed'] = author['id'] in subscribed
+        authors[author['id']] = author
+
+    return [{
+        'id': row['id'],
+        'tags': [tags[tag_id] for tag_id in sorted(
+            recipe_tags[row['id']], key=positions.__getitem__)],
+        'author': authors[row['author_id']],
+        'ingredients': ingredients[row['id']],
+        'image': image_url(row['image']),
+        'is_favorited': row['id'] in favorited,
+        'is_in_shopping_cart': row['id'] in in_cart,
+        'name': row['name'],
+        'text': row['text'],
+        'cooking_time': row['cooking_time'],
+    } for row in rows]
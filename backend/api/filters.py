@@ -16,10 +16,34 @@ class IngredientFilter(BaseFilterBackend):
         return queryset
 
 
+class RecipeOrderingFilter(filters.OrderingFilter):
+    """Сортировка рецептов с устойчивым порядком при равных значениях."""
+
+    def filter(self, qs, value):
+        qs = super().filter(qs, value)
+        if value:
+            # Порядок при равных значениях нужен для стабильной пагинации.
+            qs = qs.order_by(*qs.query.order_by, '-id')
+        return qs
+
+
 class RecipeFilter(filters.FilterSet):
     """Фильтр для рецептов."""
 
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
+    cooking_time_min = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='gte'
+    )
+    cooking_time_max = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='lte'
+    )
+    ordering = RecipeOrderingFilter(
+        fields=(
+            ('created_at', 'created_at'),
+            ('cooking_time', 'cooking_time'),
+            ('favorites_count', 'popularity'),
+        )
+    )
     tags = filters.CharFilter(method='filter_tags')
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited'
@@ -0,0 +1,210 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Value
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from recipes.models import Favorite, ShoppingCart, Subscription, Tag
+
+
+def user_state_version(user):
+    """
+    Версия избранного, списка покупок и подписок пользователя.
+    Количество и максимальный id меняются при любом добавлении
+    или удалении, поэтому их достаточно для ETag.
+    """
+    if not user.is_authenticated:
+        return None
+    parts = [
+        model.objects.filter(**{field: user}).values(field).annotate(
+            kind=Value(kind), count=Count('id'), last=Max('id')
+        ).values_list('kind', 'count', 'last')
+        for kind, (model, field) in enumerate((
+            (Favorite, 'user'),
+            (ShoppingCart, 'user'),
+            (Subscription, 'subscriber'),
+        ))
+    ]
+    return user.id, sorted(parts[0].union(*parts[1:], all=True))
+
+
+def tag_version():
+    """
+    Версия тегов для ответов, в которые они вложены.
+    Тегов немного, поэтому версией служат сами данные.
+    """
+    return list(Tag.objects.values_list('id', 'name', 'slug'))
+
+
+class ConditionalGetMixin:
+    """
+    Миксин для условных GET-запросов по ETag.
+    Версия данных вычисляется лёгким запросом до сериализации,
+    и при совпадении с If-None-Match сразу возвращается 304.
+    """
+
+    # Зависит ли ответ от избранного, покупок и подписок пользователя
+    etag_per_user = True
+
+    def get_list_version(self, queryset):
+        """
+        Версия списка: время последнего изменения и количество.
+        None означает, что список отдаётся без ETag.
+        """
+        return queryset.aggregate(Max('updated_at'), Count('id'))
+
+    def get_object_version(self, queryset):
+        """Версия объекта: время его последнего изменения."""
+        return list(queryset.values_list('updated_at', flat=True))
+
+    def get_etag(self, version):
+        request = self.request
+        return quote_etag(hashlib.md5(repr((
+            version,
+            self.etag_per_user and user_state_version(request.user),
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT'),
+        )).encode()).hexdigest())
+
+    def conditional_response(self, version, handler, *args, **kwargs):
+        etag = self.get_etag(version)
+        # Сравнение слабое: после сжатия ответа ETag становится W/"..."
+        if etag in (tag.removeprefix('W/') for tag in parse_etags(
+            self.request.META.get('HTTP_IF_NONE_MATCH', '')
+        )):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(self.request, *args, **kwargs)
+        if response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        ):
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        version = self.get_list_version(
+            self.filter_queryset(self.get_queryset()))
+        if version is None:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            version, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg not in self.kwargs:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            self.get_object_version(self.filter_queryset(
+                self.get_queryset()
+            ).filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})),
+            super().retrieve, *args, **kwargs
+        )
+
+
+class PublicCacheMixin:
+    """
+    Миксин заголовков кэширования для чтения API.
+    Ответы анонимным пользователям разрешено кэшировать nginx и
+    браузерам, ответы с авторизацией только перепроверяются по ETag.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if (
+            request.method in ('GET', 'HEAD')
+            and response.status_code in (200, 304)
+            and not response.has_header('Cache-Control')
+        ):
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(
+                    response, public=True,
+                    max_age=settings.API_CACHE_MAX_AGE)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+def query_list(request, name):
+    """Значения параметра запроса, перечисленные через запятую."""
+    values = request.query_params.get(name, '').split(',')
+    return {value.strip() for value in values if value.strip()}
+
+
+def requested_fields(request):
+    """
+    Поля, запрошенные параметрами ?fields= и ?expand=.
+    Если ?fields= не задан или запрос не на чтение, нужны все поля
+    и вместо множества полей возвращается None.
+    """
+    if (request is None or request.method != 'GET'
+            or 'fields' not in request.query_params):
+        return None, set()
+    return query_list(request, 'fields'), query_list(request, 'expand')
+
+
+class SparseFieldsMixin:
+    """
+    Миксин сериализатора для выбора полей параметрами запроса.
+    ?fields= оставляет перечисленные поля, вложенные объекты из
+    compact_fields при этом выводятся кратко, если их нет в ?expand=.
+    Действует только на сериализатор ответа: корневой или элемент
+    корневого списка, но не на вложенные в него сериализаторы.
+    """
+
+    # Имя поля -> функция, создающая его краткое представление
+    compact_fields = {}
+    compacted = frozenset()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not (self is self.root or (
+            self.parent is self.root
+            and isinstance(self.root, serializers.ListSerializer)
+        )):
+            return fields
+        requested, expand = requested_fields(self.context.get('request'))
+        if requested is None:
+            return fields
+        self.compacted = {
+            name for name in self.compact_fields
+            if name in requested and name not in expand
+        }
+        return {
+            name: (self.compact_fields[name]() if name in self.compacted
+                   else field)
+            for name, field in fields.items() if name in requested
+        }
+
+    def is_full(self, name):
+        """Проверяет, что поле выводится целиком."""
+        return name in self.fields and name not in self.compacted
+
+
+class ValuesListMixin:
+    """
+    Миксин быстрого чтения списка.
+    Строки загружаются через values(list_values) и превращаются в ответ
+    методом build_list_data без полей сериализатора. Ответ совпадает
+    с ответом serializer_class. Запросы с ?fields= обрабатываются
+    сериализатором.
+    """
+
+    list_values = ()
+
+    def build_list_data(self, rows):
+        return list(rows)
+
+    def list(self, request, *args, **kwargs):
+        if 'fields' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(
+            None).values(*self.list_values)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.build_list_data(page))
+        return Response(self.build_list_data(queryset))
@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class PageLimitPagination(PageNumberPagination):
@@ -7,3 +7,11 @@ class PageLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_query_param = 'page'
     max_page_size = 6
+
+
+class FeedPagination(CursorPagination):
+    """Курсорная пагинация для ленты подписок."""
+
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'limit'
+    max_page_size = 6
@@ -1,22 +1,57 @@
 from collections import Counter
 
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.urls import reverse
 from django.core.validators import MinValueValidator
-from djoser.serializers import UserSerializer as DjoserUserSerializer
+from djoser.serializers import (
+    UserCreateSerializer as DjoserUserCreateSerializer,
+    UserSerializer as DjoserUserSerializer
+)
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 
 from recipes.constants import (
     AMOUNT_OF_INGREDIENT_CREATE_ERROR, AMOUNT_OF_TAG_CREATE_ERROR,
-    AMOUNT_MIN, RECIPES_LIMIT
+    AMOUNT_MIN, BULK_MAX_SIZE, RECIPES_LIMIT
 )
 from recipes.models import (
     Ingredient, RecipeIngredients,
-    Tag, Recipe, User
+    Tag, Task, Recipe, User, delete_rows
 )
-from .utils import Base64ImageField
+from recipes.shopping_list import refresh_recipe_in_shopping_lists
+from .mixins import SparseFieldsMixin
+from .utils import Base64ImageField, BulkPrimaryKeyRelatedField, resolve_pks
+
+
+class AllUsersUniqueMixin:
+    """
+    Проверяет уникальность полей пользователя среди всех пользователей,
+    включая удалённых: их логин и почта заняты до полной очистки.
+    """
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, field_kwargs = super().build_standard_field(
+            field_name, model_field)
+        if 'validators' in field_kwargs:
+            field_kwargs['validators'] = [
+                UniqueValidator(User.all_objects.all(), validator.message,
+                                validator.lookup)
+                if isinstance(validator, UniqueValidator) else validator
+                for validator in field_kwargs['validators']
+            ]
+        return field_class, field_kwargs
+
+
+class UserCreateSerializer(AllUsersUniqueMixin, DjoserUserCreateSerializer):
+    """Сериалайзер для регистрации пользователя."""
+
+    class Meta(DjoserUserCreateSerializer.Meta):
+        model = User
 
 
-class BaseUserSerializer(DjoserUserSerializer):
+class BaseUserSerializer(AllUsersUniqueMixin, SparseFieldsMixin,
+                         DjoserUserSerializer):
     """Сериалайзер под текущего пользователя."""
 
     avatar = Base64ImageField(required=False, allow_null=True)
@@ -40,12 +75,31 @@ class BaseUserSerializer(DjoserUserSerializer):
         )
 
 
+class UserShortSerializer(serializers.ModelSerializer):
+    """Сериализатор для краткого представления пользователя."""
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name')
+        read_only_fields = fields
+
+
 class AvatarSerializer(serializers.Serializer):
     """Сериалайзер для аватара."""
 
     avatar = Base64ImageField(required=False)
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    """Сериалайзер для списка идентификаторов пакетной операции."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_SIZE
+    )
+
+
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор для короткого отображения рецептов у подписчиков."""
 
@@ -55,6 +109,37 @@ class RecipeShortSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+class RecipeCoverageSerializer(RecipeShortSerializer):
+    """Сериализатор рецепта с покрытием имеющимися продуктами."""
+
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = (*RecipeShortSerializer.Meta.fields, 'coverage', 'missing')
+        read_only_fields = fields
+
+
+class PopularRecipeSerializer(RecipeShortSerializer):
+    """Сериализатор рецепта с текущей оценкой популярности."""
+
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = (*RecipeShortSerializer.Meta.fields, 'score')
+        read_only_fields = fields
+
+
+class AvailableIngredientsSerializer(serializers.Serializer):
+    """Сериалайзер для набора имеющихся продуктов."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_SIZE
+    )
+
+
 class SubscriberReadSerializer(BaseUserSerializer):
     """Сериалайзер для подписчиков."""
 
@@ -97,12 +182,22 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RecipeIngredientsListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта, загружаемых одним запросом."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = resolve_pks(
+            Ingredient.objects.all(), [item['id'] for item in items])
+        for item, ingredient in zip(items, ingredients):
+            item['id'] = ingredient
+        return items
+
+
 class RecipeIngredientsSetSerializer(serializers.ModelSerializer):
     """Сериализатор для установки ингредиентов к рецепту."""
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(
         validators=[
             MinValueValidator(AMOUNT_MIN)
@@ -112,6 +207,7 @@ class RecipeIngredientsSetSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredients
         fields = ('id', 'amount')
+        list_serializer_class = RecipeIngredientsListSerializer
 
 
 class RecipeIngredientsGetSerializer(serializers.ModelSerializer):
@@ -129,11 +225,45 @@ class RecipeIngredientsGetSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeIngredientsShortSerializer(serializers.ModelSerializer):
+    """Сериализатор для краткого представления ингредиентов."""
+
+    id = serializers.ReadOnlyField(source='ingredient_id')
+
+    class Meta:
+        model = RecipeIngredients
+        fields = ('id', 'amount')
+        read_only_fields = fields
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """
+    Сериализатор для продуктов списка покупок в базовых единицах.
+    Строка может объединять несколько продуктов с одним названием,
+    поэтому id продукта не выводится.
+    """
+
+    name = serializers.SerializerMethodField()
+    measurement_unit = serializers.CharField(read_only=True)
+    amount = serializers.IntegerField(read_only=True)
+
+    def get_name(self, item):
+        return item['name'].capitalize()
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для создания рецептов."""
 
+    compact_fields = {
+        'author': lambda: UserShortSerializer(read_only=True),
+        'tags': lambda: serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+        'ingredients': lambda: RecipeIngredientsShortSerializer(
+            many=True, read_only=True, source='recipe_ingredients'),
+    }
+
     image = Base64ImageField()
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all()
     )
     author = BaseUserSerializer(read_only=True)
@@ -187,6 +317,11 @@ class RecipeSerializer(serializers.ModelSerializer):
             ingredient=ingredient['id'],
             amount=ingredient['amount']
         ) for ingredient in ingredients)
+        # Продукты для ответа загружаются одним запросом.
+        prefetch_related_objects([recipe], Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredients.objects.select_related('ingredient')
+        ))
 
     @transaction.atomic()
     def create(self, validated_data):
@@ -198,21 +333,31 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic()
     def update(self, instance, validated_data):
         """Метод для обновления рецептов."""
         ingredients = validated_data.pop('recipe_ingredients')
+        ingredient_ids = set(RecipeIngredients.objects.filter(
+            recipe=instance).values_list('ingredient_id', flat=True))
+        # Продукты удаляются и создаются без построчных сигналов: списки
+        # покупок пересчитываются один раз, а журнал и индекс продуктов
+        # обновляет сигнал сохранения рецепта.
+        delete_rows(RecipeIngredients, recipe=[instance.id])
         self.create_ingredients(instance, ingredients)
+        refresh_recipe_in_shopping_lists(instance.id, ingredient_ids | {
+            ingredient['id'].id for ingredient in ingredients})
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         """Метод для представления данных."""
         recipe = super().to_representation(instance)
-        recipe.update({
-            'tags': TagSerializer(instance.tags.all(), many=True).data,
-            'ingredients': RecipeIngredientsGetSerializer(
+        if self.is_full('tags'):
+            recipe['tags'] = TagSerializer(
+                instance.tags.all(), many=True).data
+        if self.is_full('ingredients'):
+            recipe['ingredients'] = RecipeIngredientsGetSerializer(
                 instance.recipe_ingredients.all(), many=True
             ).data
-        })
         return recipe
 
     def get_is_favorited(self, favorites):
@@ -225,3 +370,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         if request.user.is_authenticated:
             return obj.shoppingcarts.filter(user=request.user).exists()
         return False
+
+
+class TaskSerializer(serializers.ModelSerializer):
+    """Сериализатор для фоновых задач."""
+
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Task
+        fields = (
+            'id', 'name', 'status', 'attempts', 'progress', 'created_at',
+            'updated_at', 'download'
+        )
+        read_only_fields = fields
+
+    def get_download(self, task):
+        if task.status != Task.Status.DONE or not task.result_name:
+            return None
+        return self.context['request'].build_absolute_uri(
+            reverse('api:task-download', args=[task.id]))
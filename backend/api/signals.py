@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import User
+from .authentication import invalidate_tokens, invalidate_user_tokens
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Сбрасывает кэш удалённого токена (выход из системы)."""
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """Сбрасывает кэш токенов пользователя при изменении его данных."""
+    if not created:
+        invalidate_user_tokens([instance.id])
@@ -0,0 +1,11 @@
+from django.core.files.base import ContentFile
+
+from recipes.queue import task
+from .utils import make_shopping_list
+
+
+@task
+def export_shopping_list(task):
+    """Фоновое формирование списка покупок пользователя."""
+    return ContentFile(make_shopping_list(task.user),
+                       name=f'{task.user.username}_shopping_list.txt')
@@ -0,0 +1,1183 @@
+import asyncio
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from backend.warmup import WARMUP_URLS, warm_up
+from recipes.models import (
+    ChangeLog, Favorite, Ingredient, Recipe, RecipeIngredients,
+    RecipePopularity,
+    ShoppingCart, ShoppingListItem, Subscription, Tag, User
+)
+from recipes.changelog import compact_changelog
+from recipes.constants import SHOPPING_LIST_THROTTLE_COST
+from recipes.events import check_events_broker, get_broker, publish_recipe
+from recipes.feed import FEED_CACHE_KEY
+from recipes.purge import soft_delete_recipes, soft_delete_users
+from recipes.units import aggregate_in_base_units
+from .authentication import (
+    CachedTokenAuthentication, invalidate_user_tokens, local_cache
+)
+from .events import EVENTS_PATH, hub, recipe_events
+from .fast_serializers import RECIPE_FIELDS, build_recipes
+from .serializers import RecipeSerializer
+from .throttling import SlidingWindowCostThrottle
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAQMAAAAl21bKAAAAA'
+    '1BMVEUAAACnej3aAAAAAXRSTlMAQObYZgAAAApJREFUCNdjYAAAAAIAAeIhvDMAAAAASUVO'
+    'RK5CYII='
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeCreateTest(TestCase):
+    """Создание рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(5)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г')
+            for number in range(5)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def recipe_data(self, tags, ingredients, amount=10):
+        return {
+            'name': 'Рецепт',
+            'text': 'Текст',
+            'cooking_time': 10,
+            'image': PNG,
+            'tags': tags,
+            'ingredients': [
+                {'id': ingredient, 'amount': amount}
+                for ingredient in ingredients
+            ],
+        }
+
+    def create_recipe(self, tags, ingredients):
+        return self.client.post(
+            '/api/recipes/', self.recipe_data(tags, ingredients),
+            format='json')
+
+    def test_create_queries_do_not_depend_on_size(self):
+        # Теги и продукты проверяются и сохраняются одним запросом каждые.
+        for size in (1, 5):
+            with self.subTest(size=size), self.assertNumQueries(16):
+                response = self.create_recipe(
+                    [tag.id for tag in self.tags[:size]],
+                    [ingredient.id for ingredient in self.ingredients[:size]]
+                )
+            self.assertEqual(response.status_code, 201, response.data)
+
+    def test_create_rejects_non_integer_tag_ids(self):
+        ingredients = [self.ingredients[0].id]
+        for value in (True, 1.9, 'tag', None):
+            with self.subTest(value=value):
+                response = self.create_recipe([value], ingredients)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(
+                    response.data['tags'][0].code, 'incorrect_type')
+
+    def test_update_replaces_ingredients_in_shopping_lists(self):
+        first, second, third = (
+            ingredient.id for ingredient in self.ingredients[:3])
+        recipe_id = self.create_recipe(
+            [self.tags[0].id], [first, second]).data['id']
+        ShoppingCart.objects.create(user=self.author, recipe_id=recipe_id)
+        response = self.client.patch(
+            f'/api/recipes/{recipe_id}/',
+            self.recipe_data([self.tags[0].id], [second, third], amount=5),
+            format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            set(RecipeIngredients.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', 'amount')),
+            {(second, 5), (third, 5)})
+        self.assertEqual(
+            set(ShoppingListItem.objects.filter(
+                user=self.author).values_list('ingredient_id', 'amount')),
+            {(second, 5), (third, 5)})
+
+
+class BuildRecipesTest(TestCase):
+    """build_recipes отдаёт то же, что и RecipeSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com', password='author',
+                first_name='Автор', last_name='Авторов', avatar=avatar)
+            for number, avatar in enumerate(('', 'users/images/avatar.png'))
+        ]
+        # Теги создаются не в порядке сортировки модели.
+        tags = [
+            Tag.objects.create(name=name, slug=name)
+            for name in ('ужин', 'завтрак', 'обед')
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г')
+            for number in range(3)
+        ]
+        for number in range(4):
+            recipe = Recipe.objects.create(
+                author=authors[number % 2], name=f'Рецепт {number}',
+                text='Текст', cooking_time=number + 1,
+                image=f'recipes/images/recipe{number}.png')
+            recipe.tags.set(tags[number % 3:])
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(recipe=recipe, ingredient=ingredient,
+                                  amount=number + 10)
+                for ingredient in ingredients[number % 2:]
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number < 2:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscription.objects.create(subscriber=cls.user, author=authors[1])
+
+    def test_matches_recipe_serializer(self):
+        for user in (AnonymousUser(), self.user):
+            with self.subTest(user=user):
+                request = Request(APIRequestFactory().get('/api/recipes/'))
+                request.user = user
+                recipes = Recipe.objects.all()
+                self.assertEqual(
+                    JSONRenderer().render(build_recipes(
+                        recipes.values(*RECIPE_FIELDS), request)),
+                    JSONRenderer().render(RecipeSerializer(
+                        recipes, many=True, context={'request': request}
+                    ).data)
+                )
+
+
+class SparseFieldsTest(TestCase):
+    """Выбор полей параметрами ?fields= и ?expand=."""
+
+    AUTHOR_SHORT = {'id', 'username', 'first_name', 'last_name'}
+    AUTHOR_FULL = {
+        'id', 'username', 'first_name', 'last_name', 'email', 'avatar',
+        'is_subscribed'
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/images/recipe.png')
+        cls.recipe.tags.add(Tag.objects.create(name='Ужин', slug='dinner'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_recipe_list_and_detail_trim_only_recipe_fields(self):
+        urls = {
+            'list': '/api/recipes/',
+            'detail': f'/api/recipes/{self.recipe.id}/',
+        }
+        for name, url in urls.items():
+            for expand, author_fields in (
+                ('', self.AUTHOR_SHORT), ('author', self.AUTHOR_FULL)
+            ):
+                with self.subTest(url=name, expand=expand):
+                    data = self.get(url, fields='id,author', expand=expand)
+                    if name == 'list':
+                        data = data['results'][0]
+                    self.assertEqual(set(data), {'id', 'author'})
+                    self.assertEqual(set(data['author']), author_fields)
+
+    def test_compact_tags_and_ingredients(self):
+        data = self.get(f'/api/recipes/{self.recipe.id}/',
+                        fields='tags,ingredients')
+        self.assertEqual(data, {
+            'tags': [tag.id for tag in self.recipe.tags.all()],
+            'ingredients': [],
+        })
+
+    def test_user_list_and_detail(self):
+        for url in ('/api/users/', f'/api/users/{self.author.id}/'):
+            with self.subTest(url=url):
+                data = self.get(url, fields='id,username')
+                if 'results' in data:
+                    data = data['results'][0]
+                self.assertEqual(data, {
+                    'id': self.author.id, 'username': 'author'})
+
+
+class PopularRecipesTest(TestCase):
+    """Популярные рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=5, image='recipes/images/recipe.png')
+            for number in range(3)
+        ]
+        now = timezone.now()
+        RecipePopularity.objects.bulk_create(
+            RecipePopularity(
+                recipe=recipe,
+                log_score=RecipePopularity.log_weight(number, now),
+                updated_at=now)
+            for number, recipe in enumerate(cls.recipes, start=1)
+        )
+
+    def test_soft_deleted_recipes_are_hidden(self):
+        soft_delete_recipes(Recipe.objects.filter(pk=self.recipes[2].pk))
+        response = APIClient().get('/api/recipes/popular/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe['id'] for recipe in response.data],
+                         [self.recipes[1].id, self.recipes[0].id])
+
+
+class DeletedUserUniquenessTest(TestCase):
+    """Почта и логин удалённого пользователя заняты до его очистки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.deleted = User.objects.create_user(
+            username='deleted', email='deleted@example.com',
+            password='deleted', first_name='Имя', last_name='Фамилия')
+        soft_delete_users(User.objects.filter(pk=cls.deleted.pk))
+
+    def test_register_with_taken_email_and_username(self):
+        response = APIClient().post('/api/users/', {
+            'email': 'deleted@example.com',
+            'username': 'deleted',
+            'first_name': 'Имя',
+            'last_name': 'Фамилия',
+            'password': 'Sup3r-secret!',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'email', 'username'})
+
+    def test_update_to_taken_email(self):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.patch(
+            '/api/users/me/', {'email': 'deleted@example.com'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+
+
+class ConditionalGetTest(TestCase):
+    """Ответы 304 на условные запросы по ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.tag = Tag.objects.create(name='Ужин', slug='dinner')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/images/recipe.png')
+        cls.recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url, etag=None):
+        headers = {} if etag is None else {'If-None-Match': etag}
+        return self.client.get(url, headers=headers)
+
+    def assert_not_modified(self, url, etag):
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag.removeprefix('W/'))
+        self.assertFalse(response.content)
+
+    def assert_modified(self, url, etag):
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_list_and_detail(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(url=url):
+                etag = self.get(url)['ETag']
+                self.assert_not_modified(url, etag)
+                # Сжатый ответ приходит со слабым ETag.
+                self.assert_not_modified(url, f'W/{etag}')
+                self.recipe.save()
+                etag = self.assert_modified(url, etag)
+                self.tag.name = f'Тег {url}'
+                self.tag.save()
+                etag = self.assert_modified(url, etag)
+                self.author.save()
+                self.assert_modified(url, etag)
+
+    def test_user_state_changes_etag(self):
+        url = '/api/recipes/'
+        self.client.force_authenticate(self.author)
+        etag = self.get(url)['ETag']
+        self.assert_not_modified(url, etag)
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+
+    def test_popularity_ordering_has_no_etag(self):
+        response = self.get('/api/recipes/?ordering=-popularity', '"any"')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class RecipeFilterTest(TestCase):
+    """Фильтры, сортировка и фасеты списка рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{number}', email=f'reader{number}@ex.com',
+                password='reader', first_name='Читатель', last_name='Читов')
+            for number in range(3)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {time}', text='Текст',
+                cooking_time=time, image='recipes/images/recipe.png')
+            for time in (10, 45, 45, 90)
+        ]
+        for recipe, tag in zip(cls.recipes, cls.tags):
+            recipe.tags.add(tag)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def ids(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_cooking_time_range(self):
+        first, second, third, fourth = (recipe.id for recipe in self.recipes)
+        for params, expected in (
+            ({'cooking_time_min': 45}, {second, third, fourth}),
+            ({'cooking_time_max': 45}, {first, second, third}),
+            ({'cooking_time_min': 20, 'cooking_time_max': 60},
+             {second, third}),
+            ({'cooking_time_min': 100}, set()),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(set(self.ids(**params)), expected)
+
+    def test_ordering_breaks_ties_by_id(self):
+        first, second, third, fourth = (recipe.id for recipe in self.recipes)
+        self.assertEqual(self.ids(ordering='cooking_time'),
+                         [first, third, second, fourth])
+        self.assertEqual(self.ids(ordering='-cooking_time'),
+                         [fourth, third, second, first])
+
+    def test_popularity_ordering_uses_favorites_count(self):
+        first, second, third, fourth = (recipe.id for recipe in self.recipes)
+        for reader in self.readers:
+            self.client.force_authenticate(reader)
+            response = self.client.post(f'/api/recipes/{second}/favorite/')
+            self.assertEqual(response.status_code, 201, response.data)
+        response = self.client.post(
+            '/api/recipes/favorite/bulk/', {'ids': [first, fourth]},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.client.force_authenticate(self.readers[0])
+        response = self.client.post(
+            '/api/recipes/favorite/bulk/', {'ids': [second, fourth]},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.ids(ordering='-popularity'),
+                         [second, fourth, first, third])
+        self.client.delete(f'/api/recipes/{second}/favorite/')
+        self.client.delete('/api/recipes/favorite/bulk/',
+                           {'ids': [fourth]}, format='json')
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', 'favorites_count')),
+            {first: 1, second: 2, third: 0, fourth: 1})
+        self.assertEqual(self.ids(ordering='-popularity'),
+                         [second, fourth, first, third])
+        self.assertEqual(self.ids(ordering='popularity'),
+                         [third, fourth, first, second])
+
+    def test_facets_use_one_query(self):
+        for params in ({}, {'cooking_time_max': 45, 'tags': 'tag1'}):
+            with self.subTest(params=params), self.assertNumQueries(2):
+                response = self.client.get('/api/recipes/facets/', params)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['tags'],
+                         {'tag0': 0, 'tag1': 1, 'tag2': 0})
+        self.assertEqual(response.data['cooking_time'],
+                         {'0-30': 0, '30-60': 1, '60+': 0})
+        response = self.client.get('/api/recipes/facets/')
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(response.data['cooking_time'],
+                         {'0-30': 1, '30-60': 2, '60+': 1})
+
+
+class TokenCacheTest(TestCase):
+    """Кэширование пользователей, найденных по токену."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        local_cache.items.clear()
+        self.authentication = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.authentication.authenticate_credentials(self.token.key)
+
+    def assert_rejected(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_cache_hit_returns_copy(self):
+        user, token = self.authenticate()
+        user.first_name = 'Изменено'
+        with self.assertNumQueries(0):
+            cached_user, cached_token = self.authenticate()
+        self.assertEqual(cached_user, self.user)
+        self.assertEqual(cached_user.first_name, 'Имя')
+        self.assertIsNot(cached_user, user)
+        self.assertIs(cached_token.user, cached_user)
+        # Другой процесс берёт запись из общего кэша.
+        local_cache.items.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate()[0], self.user)
+
+    def test_token_delete_revokes(self):
+        self.authenticate()
+        self.token.delete()
+        self.assert_rejected()
+
+    def test_user_deactivation_revokes(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        self.assert_rejected()
+
+    def test_bulk_deactivation_needs_invalidation(self):
+        self.authenticate()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.authenticate()[0], self.user)
+        invalidate_user_tokens([self.user.pk])
+        self.assert_rejected()
+
+
+# Закрытие соединения в тесте откатило бы транзакцию TestCase.
+@mock.patch('api.events.close_old_connections', mock.Mock())
+class EventsStreamTest(TestCase):
+    """Поток событий /api/events/ через LocalBroker."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.subscriber = User.objects.create_user(
+            username='subscriber', email='subscriber@example.com',
+            password='subscriber', first_name='Имя', last_name='Фамилия')
+        Subscription.objects.create(subscriber=cls.subscriber,
+                                    author=cls.author)
+        cls.token = Token.objects.create(user=cls.subscriber)
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/images/recipe.png')
+
+    async def open_stream(self, method='GET', query_string=b'',
+                          headers=()):
+        """Запускает приложение, возвращает задачу и очереди обмена."""
+        received, sent = asyncio.Queue(), asyncio.Queue()
+        task = asyncio.ensure_future(recipe_events({
+            'type': 'http', 'method': method, 'path': EVENTS_PATH,
+            'headers': list(headers), 'query_string': query_string,
+        }, received.get, sent.put))
+        return task, received, sent
+
+    async def next_message(self, sent):
+        return await asyncio.wait_for(sent.get(), 5)
+
+    async def hub_subscribed(self):
+        while not get_broker().listeners:
+            await asyncio.sleep(0.01)
+
+    async def test_rejects_bad_requests(self):
+        for method, headers, status in (
+            ('POST', (), 405),
+            ('GET', (), 401),
+            ('GET', ((b'authorization', b'Token wrong'),), 401),
+        ):
+            with self.subTest(method=method, headers=headers):
+                task, _, sent = await self.open_stream(method,
+                                                       headers=headers)
+                await task
+                start = await self.next_message(sent)
+                self.assertEqual(start['status'], status)
+
+    async def test_subscriber_receives_new_recipe(self):
+        task, received, sent = await self.open_stream(
+            query_string=f'token={self.token.key}'.encode())
+        try:
+            start = await self.next_message(sent)
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'content-type',
+                           b'text/event-stream; charset=utf-8'),
+                          start['headers'])
+            await self.next_message(sent)
+            # Сообщение уйдёт, когда задача хаба подпишется на брокер.
+            await asyncio.wait_for(self.hub_subscribed(), 5)
+            await sync_to_async(publish_recipe)(self.recipe)
+            body = (await self.next_message(sent))['body'].decode()
+            self.assertTrue(body.startswith(
+                f'id: {self.recipe.id}\nevent: recipe\n'))
+            self.assertEqual(
+                json.loads(body.split('data: ', 1)[1]),
+                {'id': self.recipe.id, 'name': 'Рецепт',
+                 'author': self.author.id})
+            await received.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(task, 5)
+            self.assertFalse(hub.connections)
+        finally:
+            task.cancel()
+            hub.task.cancel()
+
+    @override_settings(EVENTS_BROKER='')
+    def test_broker_is_required_without_debug(self):
+        # Брокер процесса закэширован, поэтому настройка проверяется
+        # в обход кэша.
+        with self.assertRaises(ImproperlyConfigured):
+            get_broker.__wrapped__()
+        self.assertEqual(
+            [error.id for error in check_events_broker(None)],
+            ['recipes.E001'])
+
+
+class SyncTest(TestCase):
+    """Синхронизация клиента по журналу изменений /api/sync/."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=5, image='recipes/images/recipe.png')
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since=None):
+        response = self.client.get(
+            '/api/sync/', {} if since is None else {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def updated(self, data):
+        return {recipe['id'] for recipe in data['recipes']['updated']}
+
+    def test_reset_without_cursor(self):
+        data = self.sync()
+        self.assertEqual(data, {
+            'reset': True,
+            'cursor': ChangeLog.objects.latest('id').id})
+        self.assertTrue(self.sync('bad')['reset'])
+
+    def test_delta_after_cursor(self):
+        first, second, third = self.recipes
+        cursor = self.sync()['cursor']
+        Favorite.objects.create(user=self.user, recipe=first)
+        Favorite.objects.create(user=self.user, recipe=second)
+        Favorite.objects.filter(user=self.user, recipe=first).delete()
+        data = self.sync(cursor)
+        self.assertEqual(data['favorites'],
+                         {'added': [second.id], 'removed': [first.id]})
+        self.assertEqual(self.updated(data), {second.id})
+        self.assertFalse(data['more'])
+        cursor = data['cursor']
+        data = self.sync(cursor)
+        self.assertEqual(data['cursor'], cursor)
+        self.assertEqual(data['favorites'], {'added': [], 'removed': []})
+        # Подписка приносит рецепты автора, их изменения видны дальше.
+        Subscription.objects.create(subscriber=self.user, author=self.author)
+        data = self.sync(cursor)
+        self.assertEqual(data['subscriptions']['added'], [self.author.id])
+        self.assertEqual(self.updated(data),
+                         {recipe.id for recipe in self.recipes})
+        cursor = data['cursor']
+        soft_delete_recipes(Recipe.objects.filter(pk=third.pk))
+        third.refresh_from_db()
+        data = self.sync(cursor)
+        self.assertEqual(data['recipes']['deleted'], [third.id])
+        self.assertEqual(self.updated(data), set())
+
+    def test_other_users_changes_are_hidden(self):
+        cursor = self.sync()['cursor']
+        Favorite.objects.create(user=self.author, recipe=self.recipes[0])
+        self.recipes[1].save()
+        data = self.sync(cursor)
+        self.assertEqual(data['favorites'], {'added': [], 'removed': []})
+        self.assertEqual(self.updated(data), set())
+        self.assertEqual(data['cursor'], cursor)
+
+    @mock.patch('api.views.SYNC_BATCH_SIZE', 2)
+    def test_batches(self):
+        cursor = self.sync()['cursor']
+        for recipe in self.recipes:
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        data = self.sync(cursor)
+        self.assertTrue(data['more'])
+        added = data['favorites']['added']
+        data = self.sync(data['cursor'])
+        self.assertFalse(data['more'])
+        self.assertEqual(added + data['favorites']['added'],
+                         [recipe.id for recipe in self.recipes])
+
+    def test_compaction(self):
+        first, second, _ = self.recipes
+        cursor = self.sync()['cursor']
+        for _ in range(2):
+            Favorite.objects.create(user=self.user, recipe=first)
+            Favorite.objects.filter(user=self.user, recipe=first).delete()
+        Favorite.objects.create(user=self.user, recipe=second)
+        log = ChangeLog.objects.filter(
+            user=self.user, kind=ChangeLog.Kind.FAVORITE)
+        self.assertEqual(log.count(), 5)
+        compact_changelog()
+        self.assertEqual(
+            list(log.values_list('object_id', 'action')),
+            [(first.id, ChangeLog.Action.DELETE),
+             (second.id, ChangeLog.Action.UPSERT)])
+        data = self.sync(cursor)
+        self.assertEqual(data['favorites'],
+                         {'added': [second.id], 'removed': [first.id]})
+        # Записи старше срока хранения заменяет граница журнала.
+        ChangeLog.objects.filter(id__lte=data['cursor']).update(
+            created_at=timezone.now() - timedelta(days=1))
+        compact_changelog(retention_days=0)
+        self.assertEqual(
+            list(ChangeLog.objects.values_list('kind', flat=True)),
+            [ChangeLog.Kind.HORIZON])
+        self.assertTrue(self.sync(cursor)['reset'])
+        self.assertNotIn('reset', self.sync(data['cursor']))
+
+
+class ProfilerTest(TestCase):
+    """Профилирование запросов доступно только сотрудникам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='staff',
+            first_name='Имя', last_name='Фамилия', is_staff=True)
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.tokens = {
+            user: Token.objects.create(user=user).key
+            for user in (cls.staff, cls.user)
+        }
+
+    def setUp(self):
+        cache.clear()
+        local_cache.items.clear()
+        self.client = APIClient()
+
+    def get(self, user=None, url='/api/tags/', **params):
+        headers = {'X-Profile': '1'}
+        if user is not None:
+            headers['Authorization'] = f'Token {self.tokens[user]}'
+        return self.client.get(url, params, headers=headers)
+
+    def test_disabled_by_default(self):
+        self.assertFalse(self.get(self.staff).has_header('X-Profile-Id'))
+
+    @override_settings(PROFILER_ENABLED=True)
+    def test_only_staff_is_profiled(self):
+        for user in (None, self.user):
+            with self.subTest(user=user):
+                response = self.get(user)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('X-Profile-Id'))
+        response = self.get(self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        url = f'/api/profiles/{response["X-Profile-Id"]}/'
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.tokens[self.user]}')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.tokens[self.staff]}')
+        report = self.client.get(url).data
+        self.assertEqual(report['path'], '/api/tags/')
+        self.assertEqual(len(report['queries']),
+                         int(response['X-Profile-Queries']))
+
+    @override_settings(PROFILER_ENABLED=True)
+    def test_inline_report(self):
+        response = self.client.get(
+            '/api/tags/', {'_profile': 'inline'},
+            headers={'Authorization': f'Token {self.tokens[self.staff]}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['path'],
+                         '/api/tags/?_profile=inline')
+
+
+class BulkTest(TestCase):
+    """Пакетное изменение избранного, покупок и подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}', email=f'author{number}@ex.com',
+                password='author', first_name='Автор', last_name='Авторов')
+            for number in range(3)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г')
+        cls.recipes = []
+        for author in cls.authors:
+            recipe = Recipe.objects.create(
+                author=author, name='Рецепт', text='Текст', cooking_time=5,
+                image='recipes/images/recipe.png')
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100)
+            cls.recipes.append(recipe)
+        cls.missing = max(recipe.id for recipe in cls.recipes) + 100
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk(self, url, method, ids):
+        response = getattr(self.client, method)(
+            url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return {item['id']: item['status']
+                for item in response.data['results']}
+
+    def test_partial_duplicates_and_missing_ids(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+        url = '/api/recipes/favorite/bulk/'
+        Favorite.objects.create(user=self.user, recipe_id=first)
+        self.assertEqual(
+            self.bulk(url, 'post', [first, second, second, self.missing]),
+            {first: 'exists', second: 'created', self.missing: 'not_found'})
+        self.assertEqual(
+            self.bulk(url, 'delete', [second, third, self.missing]),
+            {second: 'deleted', third: 'absent', self.missing: 'not_found'})
+        self.assertEqual(
+            list(self.user.favorites.values_list('recipe', flat=True)),
+            [first])
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', 'favorites_count')),
+            {first: 1, second: 0, third: 0})
+        self.assertEqual(
+            list(ChangeLog.objects.filter(
+                user=self.user, kind=ChangeLog.Kind.FAVORITE
+            ).values_list('object_id', 'action')),
+            [(first, ChangeLog.Action.UPSERT),
+             (second, ChangeLog.Action.UPSERT),
+             (second, ChangeLog.Action.DELETE)])
+
+    def test_subscribe_self(self):
+        self.assertEqual(
+            self.bulk('/api/users/subscribe/bulk/', 'post',
+                      [self.user.id, self.authors[0].id]),
+            {self.user.id: 'self', self.authors[0].id: 'created'})
+
+    def test_shopping_list_follows_bulk_changes(self):
+        ids = [recipe.id for recipe in self.recipes]
+        url = '/api/recipes/shopping_cart/bulk/'
+        amounts = ShoppingListItem.objects.filter(user=self.user)
+        self.bulk(url, 'post', ids)
+        self.assertEqual(list(amounts.values_list('amount', flat=True)),
+                         [300])
+        self.bulk(url, 'delete', ids[:2])
+        self.assertEqual(list(amounts.values_list('amount', flat=True)),
+                         [100])
+
+    def test_queries_do_not_depend_on_size(self):
+        for url, targets in (
+            ('/api/recipes/favorite/bulk/', self.recipes),
+            ('/api/recipes/shopping_cart/bulk/', self.recipes),
+            ('/api/users/subscribe/bulk/', self.authors),
+        ):
+            queries = {}
+            for size in (1, 3):
+                for method in ('post', 'delete'):
+                    ids = [target.id for target in targets[:size]]
+                    with CaptureQueriesContext(connection) as context:
+                        statuses = self.bulk(url, method, ids)
+                    self.assertEqual(
+                        set(statuses.values()),
+                        {'created' if method == 'post' else 'deleted'})
+                    queries.setdefault(method, set()).add(
+                        len(context.captured_queries))
+            with self.subTest(url=url):
+                self.assertEqual(
+                    {method: len(counts) for method, counts in
+                     queries.items()},
+                    {'post': 1, 'delete': 1}, queries)
+
+
+class FeedTest(TestCase):
+    """Лента подписок и её кэш."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.recipes = [cls.create_recipe() for _ in range(2)]
+
+    @classmethod
+    def create_recipe(cls):
+        return Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/images/recipe.png')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.key = FEED_CACHE_KEY.format(self.user.id)
+
+    def feed(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_subscription_changes_reset_feed(self):
+        self.assertEqual(self.feed(), [])
+        self.assertEqual(cache.get(self.key), [])
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(cache.get(self.key))
+        expected = [recipe.id for recipe in reversed(self.recipes)]
+        self.assertEqual(self.feed(), expected)
+        self.assertEqual(cache.get(self.key), expected)
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(self.feed(), [])
+
+    def test_new_recipe_is_pushed_to_cached_feed(self):
+        Subscription.objects.create(subscriber=self.user, author=self.author)
+        self.feed()
+        recipe = self.create_recipe()
+        self.assertEqual(cache.get(self.key)[0], recipe.id)
+        self.assertEqual(self.feed()[0], recipe.id)
+
+    def test_deleted_recipe_resets_feed(self):
+        Subscription.objects.create(subscriber=self.user, author=self.author)
+        self.feed()
+        soft_delete_recipes(Recipe.objects.filter(pk=self.recipes[1].pk))
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(self.feed(), [self.recipes[0].id])
+
+
+class WhatToCookTest(TestCase):
+    """Подбор рецептов по имеющимся продуктам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г')
+            for number in range(4)
+        ]
+        first, second, third, fourth = cls.ingredients
+        cls.recipes = []
+        for ingredients in (
+            (first, second),
+            (first, second, third),
+            (first,),
+            (third, fourth),
+            (first, third, fourth),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.author, name='Рецепт', text='Текст',
+                cooking_time=5, image='recipes/images/recipe.png')
+            for ingredient in ingredients:
+                RecipeIngredients.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=100)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def what_to_cook(self, *ingredients, **params):
+        response = self.client.get('/api/recipes/what_to_cook/', {
+            'ingredients': ','.join(map(str, ingredients)), **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(recipe['id'], round(recipe['coverage'], 2),
+                 recipe['missing'])
+                for recipe in response.data['results']]
+
+    def test_ranking(self):
+        first, second, third, _, fifth = (
+            recipe.id for recipe in self.recipes)
+        # Неизвестные продукты не мешают подбору.
+        self.assertEqual(
+            self.what_to_cook(self.ingredients[0].id,
+                              self.ingredients[1].id, 9999),
+            [(first, 1.0, 0), (third, 1.0, 0), (second, 0.67, 1),
+             (fifth, 0.33, 2)])
+        self.assertEqual(
+            self.what_to_cook(self.ingredients[0].id, limit=2),
+            [(third, 1.0, 0), (first, 0.5, 1)])
+
+    def test_index_follows_recipe_changes(self):
+        first, second, third, _, fifth = (
+            recipe.id for recipe in self.recipes)
+        available = (self.ingredients[0].id, self.ingredients[1].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredients.objects.create(
+                recipe_id=first, ingredient=self.ingredients[2], amount=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            soft_delete_recipes(Recipe.objects.filter(pk=third))
+        self.assertEqual(
+            self.what_to_cook(*available),
+            [(first, 0.67, 1), (second, 0.67, 1), (fifth, 0.33, 2)])
+
+    def test_invalid_ingredients(self):
+        for params in ({}, {'ingredients': 'мука'}, {'ingredients': '0'}):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    '/api/recipes/what_to_cook/', params)
+                self.assertEqual(response.status_code, 400)
+
+
+@mock.patch.object(SlidingWindowCostThrottle, 'THROTTLE_RATES',
+                   {'anon': '5/minute', 'user': '100/minute'})
+class ThrottleTest(TestCase):
+    """Ограничение частоты со скользящим окном и стоимостью запросов."""
+
+    # Начало минутного интервала.
+    START = 60 * 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.now = self.START
+        patcher = mock.patch.object(
+            SlidingWindowCostThrottle, 'timer', lambda throttle: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, url='/api/tags/'):
+        return self.client.get(url)
+
+    def test_headers_and_limit(self):
+        for remaining in (4, 3, 2, 1, 0):
+            response = self.get()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-RateLimit-Limit'], '5')
+            self.assertEqual(response['X-RateLimit-Remaining'],
+                             str(remaining))
+            self.assertEqual(response['X-RateLimit-Reset'], '60')
+        self.now += 15
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '45')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+
+    def test_sliding_window(self):
+        for _ in range(5):
+            self.get()
+        # Половина прошлого интервала ещё в окне: использовано 2.5.
+        self.now = self.START + 90
+        self.assertEqual(self.get()['X-RateLimit-Remaining'], '1')
+        self.assertEqual(self.get()['X-RateLimit-Remaining'], '0')
+        self.assertEqual(self.get().status_code, 429)
+        # Отклонённые запросы не расходуют лимит.
+        self.now = self.START + 120
+        self.assertEqual(self.get()['X-RateLimit-Remaining'], '2')
+
+    def test_cost(self):
+        self.client.force_authenticate(self.user)
+        response = self.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response['X-RateLimit-Limit'], '100')
+        self.assertEqual(response['X-RateLimit-Remaining'],
+                         str(100 - SHOPPING_LIST_THROTTLE_COST))
+        self.assertEqual(self.get()['X-RateLimit-Remaining'],
+                         str(99 - SHOPPING_LIST_THROTTLE_COST))
+
+
+class ShoppingListUnitsTest(TestCase):
+    """Перевод количеств списка покупок в базовые единицы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        for name, unit, amount in (
+            ('Мука', 'кг.', 2),
+            ('Сахар', 'г', 150),
+            ('Молоко', 'ст.л.', 3),
+            ('Вода', 'стакан', 2),
+            ('Ванилин', 'ч л', 1),
+            ('Соль', 'щепотка', 1),
+        ):
+            ShoppingListItem.objects.create(
+                user=cls.user, amount=amount,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit=unit))
+
+    def test_shopping_list(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/recipes/shopping_list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(
+                (item['name'], item['measurement_unit'], item['amount'])
+                for item in response.json()
+            ),
+            [
+                ('Ванилин', 'мл', 5),
+                ('Вода', 'мл', 400),
+                ('Молоко', 'мл', 45),
+                ('Мука', 'г', 2000),
+                ('Сахар', 'г', 150),
+                # Единица без перевода остаётся как есть.
+                ('Соль', 'щепотка', 1),
+            ])
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            items = list(aggregate_in_base_units(
+                self.user.shopping_list.all()))
+        self.assertEqual(len(items), 6)
+
+
+@mock.patch('backend.warmup.connections')
+class WarmUpTest(TestCase):
+    """Прогрев приложения не прерывается ошибками отдельных этапов."""
+
+    STAGES = {'imports', 'urls', 'ingredient_index', *WARMUP_URLS}
+
+    def test_stages(self, connections):
+        self.assertEqual(set(warm_up()), self.STAGES)
+        connections.close_all.assert_called_once_with()
+
+    def test_failed_stage_is_skipped(self, connections):
+        with mock.patch('recipes.ingredient_index.get_ingredient_index',
+                        side_effect=RuntimeError):
+            with self.assertLogs('backend.warmup', 'WARNING'):
+                timings = warm_up()
+        self.assertEqual(set(timings), self.STAGES - {'ingredient_index'})
+        connections.close_all.assert_called_once_with()
+
+    def test_server_error_is_skipped(self, connections):
+        with mock.patch('api.views.TagViewSet.list',
+                        side_effect=RuntimeError):
+            with self.assertLogs('django.request', 'ERROR'):
+                with self.assertLogs('backend.warmup', 'WARNING'):
+                    timings = warm_up()
+        self.assertEqual(set(timings), self.STAGES - {'/api/tags/'})
+        connections.close_all.assert_called_once_with()
@@ -0,0 +1,86 @@
+"""
+Ограничение частоты запросов со взвешенной стоимостью.
+
+Используется счётчик скользящего окна: в кэше хранятся суммы стоимостей
+запросов за текущий и предыдущий интервалы, а нагрузка оценивается как
+текущая сумма плюс доля предыдущей, ещё попадающая в окно. Счётчики
+увеличиваются атомарным incr, поэтому ограничение общее для всех
+процессов при общем кэше (Redis).
+
+Стоимость запроса задаётся словарём throttle_costs вьюсета по имени
+действия, по умолчанию запрос стоит 1.
+"""
+
+from rest_framework.throttling import SimpleRateThrottle
+
+DEFAULT_COST = 1
+
+
+class SlidingWindowCostThrottle(SimpleRateThrottle):
+    """Базовый класс ограничения частоты со скользящим окном."""
+
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def get_cost(self, view):
+        return getattr(view, 'throttle_costs', {}).get(
+            getattr(view, 'action', None), DEFAULT_COST)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        self.now = self.timer()
+        window, offset = divmod(self.now, self.duration)
+        current_key = f'{key}:{int(window)}'
+        cost = self.get_cost(view)
+        self.cache.add(current_key, 0, self.duration * 2)
+        try:
+            current = self.cache.incr(current_key, cost)
+        except ValueError:
+            # Ключ истёк между add и incr
+            self.cache.set(current_key, cost, self.duration * 2)
+            current = cost
+        previous = self.cache.get(f'{key}:{int(window) - 1}', 0)
+        used = previous * (1 - offset / self.duration) + current
+        self.reset = self.duration - offset
+        self.remaining = max(int(self.num_requests - used), 0)
+        # Заголовки добавляет RateLimitHeadersMiddleware
+        request._request.rate_limit = (
+            self.num_requests, self.remaining, self.reset)
+        if used > self.num_requests:
+            self.cache.decr(current_key, cost)
+            return False
+        return True
+
+    def wait(self):
+        return self.reset
+
+
+class AnonCostRateThrottle(SlidingWindowCostThrottle):
+    """Ограничение для анонимных пользователей по IP-адресу."""
+
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
+
+
+class UserCostRateThrottle(SlidingWindowCostThrottle):
+    """Ограничение для авторизованных пользователей по id."""
+
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': request.user.pk
+        }
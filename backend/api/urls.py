@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+    IngredientViewSet, ProfileViewSet, RecipeViewSet, SyncViewSet, TagViewSet,
+    TaskViewSet, UserViewSet
 )
 
 
@@ -11,8 +12,11 @@ app_name = 'api'
 api = DefaultRouter()
 
 api.register('ingredients', IngredientViewSet, basename='ingredient')
+api.register('profiles', ProfileViewSet, basename='profile')
 api.register('recipes', RecipeViewSet, basename='recipe')
+api.register('sync', SyncViewSet, basename='sync')
 api.register('tags', TagViewSet, basename='tag')
+api.register('tasks', TaskViewSet, basename='task')
 api.register('users', UserViewSet, basename='users')
 
 
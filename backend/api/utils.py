@@ -3,10 +3,16 @@ from datetime import datetime
 
 from django.core.files.base import ContentFile
 from rest_framework import serializers
+from rest_framework.relations import (
+    MANY_RELATION_KWARGS, PrimaryKeyRelatedField
+)
 
 from recipes.constants import (
-    INGREDIENT_FORMAT, SHOPPING_LIST_HEADER, MONTH_NAMES
+    INGREDIENT_FORMAT, SHOPPING_LIST_HEADER, MONTH_NAMES,
+    UNEXIST_OBJECTS_ERROR
 )
+from recipes.models import Recipe
+from recipes.units import aggregate_in_base_units
 
 
 class Base64ImageField(serializers.ImageField):
@@ -21,6 +27,61 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+def resolve_pks(queryset, pks):
+    """
+    Загружает объекты по списку идентификаторов одним запросом.
+    Все отсутствующие идентификаторы перечисляются в одной ошибке.
+    Логические значения и нецелые числа не приводятся к целым,
+    а отклоняются той же ошибкой, что и в PrimaryKeyRelatedField.
+    """
+    ids = []
+    for pk in pks:
+        try:
+            if isinstance(pk, bool) or (
+                    isinstance(pk, float) and not pk.is_integer()):
+                raise TypeError
+            ids.append(int(pk))
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                PrimaryKeyRelatedField.default_error_messages[
+                    'incorrect_type'].format(data_type=type(pk).__name__),
+                code='incorrect_type'
+            )
+    pks = ids
+    objects = queryset.in_bulk(set(pks))
+    missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+    if missing:
+        raise serializers.ValidationError(UNEXIST_OBJECTS_ERROR.format(
+            ids=', '.join(map(str, missing))))
+    return [objects[pk] for pk in pks]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список связанных объектов, загружаемых одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return resolve_pks(self.child_relation.get_queryset(), data)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который при many=True проверяет
+    все идентификаторы одним запросом вместо запроса на каждый.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
 def create_report_of_shopping_list(user, ingredients, recipes):
     """Функция для генерации отчета списка покупок для скачивания."""
 
@@ -32,8 +93,8 @@ def create_report_of_shopping_list(user, ingredients, recipes):
     # Формирование списка ингредиентов
     shopping_list_ingredients = '\n'.join(
         INGREDIENT_FORMAT.format(
-            i, ingredient['ingredient__name'].capitalize(),
-            ingredient['ingredient__measurement_unit'], ingredient['amount'])
+            i, ingredient['name'].capitalize(),
+            ingredient['measurement_unit'], ingredient['amount'])
         for i, ingredient in enumerate(ingredients, start=1)
     )
     # Формирование списка рецептов
@@ -50,3 +111,11 @@ def create_report_of_shopping_list(user, ingredients, recipes):
         shopping_list_recipes,
         '\n\nFoodgram'
     ])
+
+
+def make_shopping_list(user):
+    """Функция для формирования списка покупок пользователя."""
+    ingredients = aggregate_in_base_units(user.shopping_list.all())
+    recipes = Recipe.objects.filter(
+        shoppingcarts__user=user).select_related('author')
+    return create_report_of_shopping_list(user, ingredients, recipes)
@@ -1,54 +1,146 @@
-from django.db.models import Sum
-from django.core.exceptions import ValidationError
-from django.http import HttpResponse, JsonResponse, FileResponse
+import io
+
+from django.db import transaction
+from django.db.models import (
+    Count, Exists, Max, OuterRef, Prefetch, Q, Sum
+)
+from django.http import Http404, HttpResponse, JsonResponse, FileResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
+from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from djoser import views as DjoserViewSets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import status, viewsets
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
     IsAuthenticatedOrReadOnly,
     IsAuthenticated,
 )
 
 from recipes.constants import (
     DUPLICATE_OF_RECIPE_ADD_CART,
-    UNEXIST_SHOPPING_CART_ERROR,
+    UNEXIST_SHOPPING_CART_ERROR, TASK_NOT_READY_ERROR, TASK_NO_FILE_ERROR,
     AVATAR_ERROR, SUBSCRIBE_ERROR,
-    SUBSCRIBE_SELF_ERROR
-
+    SUBSCRIBE_SELF_ERROR, RECOMMENDED_RECIPES_LIMIT, COOKING_TIME_BUCKETS,
+    POPULAR_CACHE_MAX_AGE, POPULAR_RECIPES_LIMIT,
+    BULK_CREATED, BULK_EXISTS, BULK_DELETED, BULK_ABSENT,
+    BULK_NOT_FOUND, BULK_SELF,
+    SHOPPING_LIST_THROTTLE_COST, SUBSCRIPTIONS_THROTTLE_COST,
+    SYNC_BATCH_SIZE
 )
 from .filters import RecipeFilter, IngredientFilter
 from recipes.models import (
-    Ingredient, Favorite, Recipe, RecipeIngredients,
-    ShoppingCart, Tag, Subscription, User
-
+    ChangeLog, Ingredient, Favorite, Recipe, RecipeIngredients,
+    RecipePopularity, ShoppingCart, Tag, Subscription, Task, User,
+    cooking_time_q, delete_rows
 )
+from recipes.queue import enqueue
 from .serializers import (
     IngredientSerializer,
+    PopularRecipeSerializer,
+    RecipeCoverageSerializer,
     RecipeSerializer,
     RecipeShortSerializer,
     TagSerializer,
+    TaskSerializer,
     SubscriberReadSerializer,
     AvatarSerializer,
-    BaseUserSerializer
+    AvailableIngredientsSerializer,
+    BaseUserSerializer,
+    BulkIdsSerializer,
+    ShoppingListItemSerializer
 )
 from .permissions import (
     IsAuthor
 )
-from .utils import create_report_of_shopping_list
-from .pagination import PageLimitPagination
+from .mixins import (
+    ConditionalGetMixin, PublicCacheMixin, ValuesListMixin, requested_fields,
+    tag_version
+)
+from .fast_serializers import (
+    INGREDIENT_FIELDS, RECIPE_FIELDS, TAG_FIELDS, build_recipes
+)
+from backend.middleware import get_profile
+from recipes.changelog import (
+    CHANGE_KINDS, changes_since, latest_cursor, log_changes, needs_reset
+)
+from recipes.feed import filter_feed, get_feed_ids, invalidate_feeds
+from recipes.ingredient_index import get_ingredient_index
+from recipes.popularity import change_favorites_count
+from recipes.purge import soft_delete_recipes, soft_delete_users
+from recipes.shopping_list import (
+    add_to_shopping_list, clear_shopping_cart, remove_from_shopping_list
+)
+from recipes.units import aggregate_in_base_units
+from .utils import make_shopping_list
+from .pagination import FeedPagination, PageLimitPagination
 
 
-class UserViewSet(DjoserViewSets.UserViewSet):
+def apply_bulk(request, targets, model, owner_field, target_field):
+    """
+    Общая функция для пакетного добавления/удаления связей.
+    Все идентификаторы проверяются одним запросом с IN,
+    изменения применяются одним bulk_create или одним DELETE.
+    """
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    user = request.user
+    found = dict(targets.filter(id__in=ids).annotate(
+        present=Exists(model.objects.filter(**{
+            owner_field: user, target_field: OuterRef('pk')}))
+    ).values_list('id', 'present'))
+    adding = request.method == 'POST'
+    results, changed = [], []
+    for pk in ids:
+        if pk not in found:
+            result = BULK_NOT_FOUND
+        elif target_field == 'author' and pk == user.id:
+            result = BULK_SELF
+        elif adding:
+            result = BULK_EXISTS if found[pk] else BULK_CREATED
+        else:
+            result = BULK_DELETED if found[pk] else BULK_ABSENT
+        if result in (BULK_CREATED, BULK_DELETED):
+            changed.append(pk)
+        results.append({'id': pk, 'status': result})
+    # bulk_create и delete_rows не отправляют сигналы: журнал пополняется
+    # здесь, остальное обновляют вызывающие методы по результатам.
+    if changed and adding:
+        model.objects.bulk_create(
+            [model(**{owner_field: user, f'{target_field}_id': pk})
+             for pk in changed],
+            ignore_conflicts=True
+        )
+        log_changes(CHANGE_KINDS[model], user.id, changed)
+    elif changed:
+        delete_rows(model, **{owner_field: [user.id], target_field: changed})
+        log_changes(CHANGE_KINDS[model], user.id, changed,
+                    ChangeLog.Action.DELETE)
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+def bulk_results(response, result):
+    """Идентификаторы из ответа apply_bulk с заданным результатом."""
+    return [item['id'] for item in response.data['results']
+            if item['status'] == result]
+
+
+class UserViewSet(ConditionalGetMixin, DjoserViewSets.UserViewSet):
     """Общий вьюсет для пользователя."""
 
     queryset = User.objects.all()
     serializer_class = BaseUserSerializer
     pagination_class = PageLimitPagination
+    throttle_costs = {
+        'subscriptions': SUBSCRIPTIONS_THROTTLE_COST,
+    }
 
     @action(
         ["get", "put", "patch", "delete"],
@@ -64,6 +156,13 @@ class UserViewSet(DjoserViewSets.UserViewSet):
             return [IsAuthenticated()]
         return super().get_permissions()
 
+    def perform_destroy(self, instance):
+        """
+        Пользователь скрывается сразу, его рецепты и связи
+        удаляет фоновая задача.
+        """
+        soft_delete_users(User.objects.filter(pk=instance.pk))
+
     @action(
         ['PUT', 'DELETE'],
         detail=False,
@@ -74,11 +173,10 @@ class UserViewSet(DjoserViewSets.UserViewSet):
         user = self.request.user
         if request.method == 'DELETE':
             if user.avatar:
-                # Удаление файла с диска
-                user.avatar.delete(save=True)
-                # Удаление ссылки на аватар в базе данных
-                self.request.user.avatar = None
-                self.request.user.save()
+                # Файл может использоваться другими объектами,
+                # неиспользуемые файлы удаляет команда gc_media
+                user.avatar = None
+                user.save()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         if 'avatar' not in request.data:
@@ -89,8 +187,7 @@ class UserViewSet(DjoserViewSets.UserViewSet):
         avatar_data = serializer.validated_data.get('avatar')
         user.avatar = avatar_data
         user.save()
-        image_url = request.build_absolute_uri(
-            f'/media/users/{avatar_data.name}')
+        image_url = request.build_absolute_uri(user.avatar.url)
         return Response(
             {'avatar': str(image_url)}, status=status.HTTP_200_OK
         )
@@ -133,26 +230,53 @@ class UserViewSet(DjoserViewSets.UserViewSet):
                 Subscription, author=author, subscriber=user).delete()
         return HttpResponse(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=('POST', 'DELETE'),
+            url_path='subscribe/bulk', url_name='subscribe-bulk',
+            permission_classes=[IsAuthenticated])
+    def subscribe_bulk(self, request):
+        """Метод для пакетного управления подписками."""
+        response = apply_bulk(
+            request, User.objects.all(), Subscription, 'subscriber', 'author')
+        invalidate_feeds([request.user.id])
+        return response
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(
+    PublicCacheMixin, ConditionalGetMixin, ValuesListMixin,
+    viewsets.ReadOnlyModelViewSet
+):
     """Вьюсет для Тэгов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    list_values = TAG_FIELDS
     permission_classes = [AllowAny]
     pagination_class = None
+    etag_per_user = False
 
+    def get_list_version(self, queryset):
+        # Тегов немного, поэтому версией служат сами данные
+        return list(queryset.values_list('id', 'name', 'slug'))
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+    get_object_version = get_list_version
+
+
+class IngredientViewSet(
+    PublicCacheMixin, ValuesListMixin, viewsets.ReadOnlyModelViewSet
+):
     """Вьюсет для Ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    list_values = INGREDIENT_FIELDS
     filter_backends = [IngredientFilter, ]
     permission_classes = [AllowAny]
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    PublicCacheMixin, ConditionalGetMixin, ValuesListMixin,
+    viewsets.ModelViewSet
+):
     """Вьюсет для Рецептов."""
 
     queryset = Recipe.objects.all()
@@ -160,14 +284,62 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
     serializer_class = RecipeSerializer
+    list_values = RECIPE_FIELDS
+    throttle_costs = {
+        'download_shopping_cart': SHOPPING_LIST_THROTTLE_COST,
+        'shopping_list_export': SHOPPING_LIST_THROTTLE_COST,
+    }
 
     def get_queryset(self):
         queryset = super().get_queryset()
         user = self.request.user
-        if user.is_authenticated:
+        fields, expand = requested_fields(self.request)
+
+        def wanted(*names):
+            return fields is None or not fields.isdisjoint(names)
+
+        if user.is_authenticated and wanted(
+                'is_favorited', 'is_in_shopping_cart'):
             queryset = queryset.prefetch_related('favorites', 'shoppingcarts')
+        if self.request.method != 'GET':
+            return queryset
+        # Для чтения загружаются только запрошенные поля и связи.
+        if not wanted('text'):
+            queryset = queryset.defer('text')
+        if wanted('author'):
+            queryset = queryset.select_related('author')
+        if wanted('tags'):
+            queryset = queryset.prefetch_related('tags')
+        if wanted('ingredients'):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'recipe_ingredients',
+                    queryset=RecipeIngredients.objects.select_related(
+                        'ingredient')
+                ) if fields is None or 'ingredients' in expand
+                else 'recipe_ingredients'
+            )
         return queryset
 
+    def build_list_data(self, rows):
+        return build_recipes(rows, self.request)
+
+    def get_list_version(self, queryset):
+        # Порядок по популярности меняет избранное любых пользователей,
+        # поэтому такой список отдаётся без ETag.
+        if 'popularity' in {
+            param.strip().lstrip('-') for param in
+            self.request.query_params.get('ordering', '').split(',')
+        }:
+            return None
+        return queryset.aggregate(
+            Max('updated_at'), Max('author__updated_at'), Count('id')
+        ), tag_version()
+
+    def get_object_version(self, queryset):
+        return list(queryset.values_list(
+            'updated_at', 'author__updated_at')), tag_version()
+
     def get_permissions(self):
         """Метод для прав доступа, в зависимости от метода."""
         if self.request.method in ("PATCH", "DELETE"):
@@ -178,6 +350,118 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Метод для создания рецепта."""
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        """Рецепт скрывается сразу, связи удаляет фоновая задача."""
+        soft_delete_recipes(Recipe.objects.filter(pk=instance.pk))
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=[IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        queryset = self.get_queryset()
+        if self.paginator.cursor_query_param in request.query_params:
+            queryset = filter_feed(queryset, request.user)
+        else:
+            queryset = queryset.filter(id__in=get_feed_ids(request.user))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'], permission_classes=[AllowAny])
+    def facets(self, request):
+        """
+        Количество отфильтрованных рецептов по тегам и интервалам
+        времени приготовления, посчитанное одним агрегирующим запросом.
+        """
+        tags = list(Tag.objects.values_list('id', 'slug'))
+        counts = Recipe.objects.filter(
+            id__in=self.filter_queryset(self.get_queryset()).values('id')
+        ).aggregate(
+            total=Count('id', distinct=True),
+            **{f'tag_{tag_id}': Count('id', filter=Q(tags=tag_id),
+                                      distinct=True)
+               for tag_id, _ in tags},
+            **{f'time_{index}': Count('id', filter=cooking_time_q(low, high),
+                                      distinct=True)
+               for index, (_, _, low, high) in enumerate(
+                   COOKING_TIME_BUCKETS)}
+        )
+        return Response({
+            'count': counts['total'],
+            'tags': {slug: counts[f'tag_{tag_id}'] for tag_id, slug in tags},
+            'cooking_time': {
+                key: counts[f'time_{index}']
+                for index, (key, *_) in enumerate(COOKING_TIME_BUCKETS)
+            },
+        })
+
+    @action(detail=False, methods=['GET'], permission_classes=[AllowAny])
+    def popular(self, request):
+        """Популярные рецепты по заранее рассчитанной оценке."""
+        now = timezone.now()
+        recipes = []
+        # select_related не применяет менеджер Recipe, поэтому
+        # удалённые рецепты исключаются явно.
+        for popularity in RecipePopularity.objects.filter(
+            recipe__deleted_at__isnull=True
+        ).select_related('recipe')[:POPULAR_RECIPES_LIMIT]:
+            popularity.recipe.score = popularity.decayed_score(now)
+            recipes.append(popularity.recipe)
+        response = Response(PopularRecipeSerializer(
+            recipes, many=True, context={'request': request}).data)
+        patch_cache_control(
+            response, public=True, max_age=POPULAR_CACHE_MAX_AGE)
+        return response
+
+    @action(detail=True, methods=['GET'], permission_classes=[AllowAny])
+    def similar(self, request, pk):
+        """Похожие рецепты, рассчитанные командой build_recommendations."""
+        recipe = get_object_or_404(Recipe, pk=pk)
+        recipes = Recipe.objects.filter(
+            similar_to__recipe=recipe).order_by('-similar_to__score')
+        return Response(RecipeShortSerializer(
+            recipes, many=True, context={'request': request}).data)
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=[IsAuthenticated])
+    def recommended(self, request):
+        """Рекомендации по рецептам, похожим на избранные."""
+        user = request.user
+        recipes = Recipe.objects.filter(
+            similar_to__recipe__favorites__user=user
+        ).exclude(
+            favorites__user=user
+        ).annotate(
+            rank=Sum('similar_to__score')
+        ).order_by('-rank')[:RECOMMENDED_RECIPES_LIMIT]
+        return Response(RecipeShortSerializer(
+            recipes, many=True, context={'request': request}).data)
+
+    @action(detail=False, methods=['GET'], permission_classes=[AllowAny],
+            pagination_class=PageLimitPagination)
+    def what_to_cook(self, request):
+        """Рецепты, отсортированные по покрытию имеющимися продуктами."""
+        serializer = AvailableIngredientsSerializer(data={
+            'ingredients': [
+                value for param in request.query_params.getlist(
+                    'ingredients') for value in param.split(',') if value
+            ]
+        })
+        serializer.is_valid(raise_exception=True)
+        matches = self.paginate_queryset(get_ingredient_index().match(
+            serializer.validated_data['ingredients']))
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, *_ in matches])
+        page = []
+        for recipe_id, coverage, missing in matches:
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.coverage, recipe.missing = coverage, missing
+                page.append(recipe)
+        return self.get_paginated_response(RecipeCoverageSerializer(
+            page, many=True, context={'request': request}).data)
+
     @action(detail=True,
             methods=['GET'], url_path='get-link', url_name='get-link')
     def get_short_link(self, request, pk):
@@ -185,8 +469,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
             raise ValidationError(
                 {'status':
                  f'Рецепт с ID {pk} не найден'})
-        return JsonResponse({'short-link': request.build_absolute_uri(
+        response = JsonResponse({'short-link': request.build_absolute_uri(
             reverse('recipe-redirect', args=[pk]))})
+        patch_cache_control(
+            response, public=True, max_age=settings.SHORT_LINK_CACHE_MAX_AGE)
+        return response
 
     @action(detail=True, methods=['POST', 'DELETE'])
     def shopping_cart(self, request, pk):
@@ -202,11 +489,44 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.common_add_to(Favorite, request.user, pk)
         return self.common_delete_from(Favorite, request.user, pk)
 
+    @action(detail=False, methods=['POST', 'DELETE'],
+            url_path='shopping_cart/bulk', url_name='shopping-cart-bulk',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_bulk(self, request):
+        """Метод для пакетного изменения списка покупок."""
+        with transaction.atomic():
+            response = apply_bulk(
+                request, Recipe.objects.all(), ShoppingCart, 'user', 'recipe')
+            add_to_shopping_list(
+                request.user.id, bulk_results(response, BULK_CREATED))
+            remove_from_shopping_list(
+                request.user.id, bulk_results(response, BULK_DELETED))
+        return response
+
+    @action(detail=False, methods=['DELETE'],
+            url_path='shopping_cart', url_name='shopping-cart-clear',
+            permission_classes=[IsAuthenticated])
+    def clear_shopping_cart(self, request):
+        """Метод для очистки списка покупок одним запросом."""
+        clear_shopping_cart(request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['POST', 'DELETE'],
+            url_path='favorite/bulk', url_name='favorite-bulk',
+            permission_classes=[IsAuthenticated])
+    def favorite_bulk(self, request):
+        """Метод для пакетного изменения избранного."""
+        with transaction.atomic():
+            response = apply_bulk(
+                request, Recipe.objects.all(), Favorite, 'user', 'recipe')
+            change_favorites_count(bulk_results(response, BULK_CREATED), 1)
+            change_favorites_count(bulk_results(response, BULK_DELETED), -1)
+        return response
+
     def common_add_to(self, model, user, pk):
         """Общий метод для добавления рецепта в список"""
         recipe = get_object_or_404(Recipe, id=pk)
-        obj, created = model.objects.get_or_create(
-            user=user, recipe=get_object_or_404(Recipe, id=pk))
+        obj, created = model.objects.get_or_create(user=user, recipe=recipe)
         if not created:
             raise ValidationError({'error': DUPLICATE_OF_RECIPE_ADD_CART})
         return Response(
@@ -226,15 +546,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         user = request.user
         if not user.shoppingcarts.exists():
             raise ValidationError({'error': UNEXIST_SHOPPING_CART_ERROR})
-        ingredients = RecipeIngredients.objects.filter(
-            recipe__shoppingcarts__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
-        recipes = Recipe.objects.filter(shoppingcarts__user=user)
-        shopping_list = create_report_of_shopping_list(
-            user, ingredients, recipes)
+        shopping_list = make_shopping_list(user)
         # Формирование имени файла
         filename = f'{user.username}_shopping_list.txt'
         # Возвращаем файл для скачивания
@@ -244,3 +556,118 @@ class RecipeViewSet(viewsets.ModelViewSet):
             filename=filename,
             content_type='text/plain'
         )
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=[IsAuthenticated])
+    def shopping_list(self, request):
+        """Метод для получения списка покупок с суммарными количествами."""
+        # Количества приводятся к базовым единицам, как в скачиваемом списке.
+        return Response(ShoppingListItemSerializer(
+            aggregate_in_base_units(request.user.shopping_list.all()),
+            many=True
+        ).data)
+
+    @action(detail=False, methods=['POST'],
+            permission_classes=[IsAuthenticated])
+    def shopping_list_export(self, request):
+        """
+        Метод для формирования списка покупок в фоне.
+        Готовый файл скачивается по ссылке download задачи.
+        """
+        if not request.user.shoppingcarts.exists():
+            raise ValidationError({'error': UNEXIST_SHOPPING_CART_ERROR})
+        task = enqueue('export_shopping_list', user=request.user)
+        return Response(
+            TaskSerializer(task, context={'request': request}).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class TaskViewSet(viewsets.ReadOnlyModelViewSet):
+    """Вьюсет для фоновых задач пользователя."""
+
+    serializer_class = TaskSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Task.objects.filter(user=self.request.user)
+
+    @action(detail=True, methods=['GET'])
+    def download(self, request, pk):
+        """Метод для скачивания результата задачи."""
+        task = self.get_object()
+        if task.status != Task.Status.DONE:
+            return Response({'error': TASK_NOT_READY_ERROR},
+                            status=status.HTTP_409_CONFLICT)
+        if not task.result_name:
+            return Response({'error': TASK_NO_FILE_ERROR},
+                            status=status.HTTP_404_NOT_FOUND)
+        # Тип содержимого FileResponse определяет по имени файла.
+        return FileResponse(
+            io.BytesIO(task.result.encode()),
+            as_attachment=True,
+            filename=task.result_name
+        )
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    Вьюсет для синхронизации клиентов по журналу изменений.
+    Клиент передаёт курсор прошлого ответа в ?since= и получает
+    изменения после него. Если курсора нет или журнал после него
+    сжат, ответ содержит reset: клиенту нужна полная загрузка данных,
+    после которой синхронизация продолжается с выданного курсора.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        since = request.query_params.get('since', '')
+        since = int(since) if since.isdigit() else None
+        if needs_reset(since):
+            return Response({'reset': True, 'cursor': latest_cursor()})
+        actions, cursor, more = changes_since(
+            request.user, since, SYNC_BATCH_SIZE)
+        changes = {kind: {'added': [], 'removed': []} for kind in (
+            ChangeLog.Kind.RECIPE, ChangeLog.Kind.FAVORITE,
+            ChangeLog.Kind.SHOPPING_CART, ChangeLog.Kind.SUBSCRIPTION
+        )}
+        for (kind, object_id), change in actions.items():
+            changes[kind][
+                'added' if change == ChangeLog.Action.UPSERT else 'removed'
+            ].append(object_id)
+        # Рецепты новых подписок, избранного и покупок клиенту ещё
+        # неизвестны, поэтому передаются вместе с изменёнными.
+        recipes = Recipe.objects.filter(
+            Q(id__in=changes[ChangeLog.Kind.RECIPE]['added'])
+            | Q(id__in=changes[ChangeLog.Kind.FAVORITE]['added'])
+            | Q(id__in=changes[ChangeLog.Kind.SHOPPING_CART]['added'])
+            | Q(author__in=changes[ChangeLog.Kind.SUBSCRIPTION]['added'])
+        ).values(*RECIPE_FIELDS)
+        return Response({
+            'cursor': cursor,
+            'more': more,
+            'recipes': {
+                'updated': build_recipes(recipes, request),
+                'deleted': changes[ChangeLog.Kind.RECIPE]['removed'],
+            },
+            'favorites': changes[ChangeLog.Kind.FAVORITE],
+            'shopping_cart': changes[ChangeLog.Kind.SHOPPING_CART],
+            'subscriptions': changes[ChangeLog.Kind.SUBSCRIPTION],
+        })
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """
+    Вьюсет для отчётов профилировщика запросов.
+    Идентификатор отчёта возвращается в заголовке X-Profile-Id
+    ответа на запрос с X-Profile или ?_profile=1.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def retrieve(self, request, pk):
+        report = get_profile(pk)
+        if report is None:
+            raise Http404
+        return Response(report)
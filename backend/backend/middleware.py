@@ -0,0 +1,220 @@
+import cProfile
+import pstats
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import JsonResponse
+from django.utils.cache import add_never_cache_headers, patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.authentication import CachedTokenAuthentication
+from recipes.slow_queries import capture_slow_queries
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+class BrotliMiddleware(MiddlewareMixin):
+    """
+    Сжатие ответов в Brotli, если клиент его поддерживает.
+    Ответы без поддержки Brotli сжимает gzip в nginx.
+    """
+
+    min_length = 200
+    quality = 5
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or len(response.content) < self.min_length
+            or response.has_header('Content-Encoding')
+        ):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not re_accepts_brotli.search(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        ):
+            return response
+        compressed_content = brotli.compress(
+            response.content, quality=self.quality)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+        # Сильный ETag после сжатия становится слабым, как в GZipMiddleware
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class RateLimitHeadersMiddleware:
+    """Добавляет к ответу заголовки с состоянием ограничения частоты."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response['X-RateLimit-Limit'] = str(limit)
+            response['X-RateLimit-Remaining'] = str(remaining)
+            response['X-RateLimit-Reset'] = str(int(reset))
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Записывает медленные SQL-запросы с указанием вьюсета и действия,
+    обработавших запрос (например, api:recipe-list).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with capture_slow_queries(
+            f'{request.method} {request.path}'
+        ) as collector:
+            response = self.get_response(request)
+            if request.resolver_match is not None:
+                collector.origin = (
+                    f'{request.method} {request.resolver_match.view_name}')
+        return response
+
+
+PROFILE_CACHE_KEY = 'profile:{}'
+
+
+def get_profile(profile_id):
+    """Возвращает сохранённый отчёт профилировщика или None."""
+    return cache.get(PROFILE_CACHE_KEY.format(profile_id))
+
+
+class QueryLog:
+    """Обёртка execute_wrapper, записывающая SQL-запросы и их время."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params),
+                'many': many,
+                'time_ms': round((time.perf_counter() - start) * 1000, 3),
+                'database': context['connection'].alias,
+            })
+
+
+class ProfilerMiddleware:
+    """
+    Профилирование запроса по требованию сотрудника.
+    Включается заголовком X-Profile или параметром _profile: запрос
+    выполняется под cProfile с записью SQL-запросов, отчёт сохраняется
+    в кэше, а его идентификатор возвращается в заголовке X-Profile-Id
+    (отчёт отдаёт /api/profiles/<id>/). Со значением inline отчёт
+    возвращается вместо ответа. Запросы без флага не замедляются.
+    """
+
+    header = 'HTTP_X_PROFILE'
+    query_param = '_profile'
+    top_functions = 50
+    # cProfile в Python 3.12+ нельзя запустить в двух потоках сразу.
+    lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = (
+            request.META.get(self.header)
+            or request.GET.get(self.query_param)
+        )
+        if not mode or not settings.PROFILER_ENABLED:
+            return self.get_response(request)
+        if not self.is_staff(request):
+            return self.get_response(request)
+        if self.query_param in request.GET:
+            # Списки админки перенаправляют на ?e=1 при неизвестных параметрах.
+            request.GET = request.GET.copy()
+            del request.GET[self.query_param]
+        query_log = QueryLog()
+        profiler = cProfile.Profile()
+        with self.lock, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            total = time.perf_counter() - start
+        report = self.build_report(
+            request, response, profiler, query_log.queries, total)
+        if mode == 'inline':
+            response = JsonResponse(report, json_dumps_params={
+                'ensure_ascii': False})
+        else:
+            profile_id = uuid.uuid4().hex
+            cache.set(PROFILE_CACHE_KEY.format(profile_id), report,
+                      settings.PROFILER_CACHE_TIMEOUT)
+            response['X-Profile-Id'] = profile_id
+        response['X-Profile-Time'] = f'{report["total_ms"]:.1f}'
+        response['X-Profile-Queries'] = str(len(report['queries']))
+        add_never_cache_headers(response)
+        return response
+
+    @staticmethod
+    def is_staff(request):
+        """
+        Проверяет пользователя по сессии (админка) или по токену (API):
+        токен DRF проверяет только во вьюсете, уже после middleware.
+        """
+        if request.user.is_staff:
+            return True
+        try:
+            credentials = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return credentials is not None and credentials[0].is_staff
+
+    def build_report(self, request, response, profiler, queries, total):
+        stats = pstats.Stats(profiler).stats
+        functions = sorted(
+            stats.items(), key=lambda item: item[1][3], reverse=True
+        )[:self.top_functions]
+        return {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 3),
+            'sql_ms': round(sum(query['time_ms'] for query in queries), 3),
+            'queries': queries,
+            'functions': [
+                {
+                    'function': pstats.func_std_string(function),
+                    'calls': calls,
+                    'primitive_calls': primitive_calls,
+                    'own_ms': round(own * 1000, 3),
+                    'cumulative_ms': round(cumulative * 1000, 3),
+                }
+                for function, (primitive_calls, calls, own, cumulative, _)
+                in functions
+            ],
+        }
@@ -53,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.middleware.BrotliMiddleware',
+    'backend.middleware.RateLimitHeadersMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -62,6 +64,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.middleware.SlowQueryMiddleware',
+    'backend.middleware.ProfilerMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -108,6 +112,10 @@ else:
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
             'HOST': os.getenv('DB_HOST', 'db'),
             'PORT': os.getenv('DB_PORT', '5432'),
+            # Соединение переживает запрос, чтобы рабочий процесс
+            # не подключался к базе заново (см. gunicorn.conf.py).
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
         }
     }
 
@@ -146,17 +154,96 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+STORAGES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'MEDIA_STORAGE', 'recipes.storage.ContentAddressedStorage'),
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Настройки для MEDIA_STORAGE=recipes.storage.ContentAddressedS3Storage
+AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME', 'media')
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL')
+AWS_S3_CUSTOM_DOMAIN = os.getenv('AWS_S3_CUSTOM_DOMAIN')
+AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
+AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
+AWS_QUERYSTRING_AUTH = False
+AWS_S3_OBJECT_PARAMETERS = {
+    'CacheControl': 'public, max-age=31536000, immutable',
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Время кэширования ответов API для анонимных пользователей, в секундах
+API_CACHE_MAX_AGE = int(os.getenv('API_CACHE_MAX_AGE', 60))
+SHORT_LINK_CACHE_MAX_AGE = int(os.getenv('SHORT_LINK_CACHE_MAX_AGE', 60 * 60 * 24))
+
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 5 * 60))
+AUTH_TOKEN_LOCAL_TIMEOUT = int(os.getenv('AUTH_TOKEN_LOCAL_TIMEOUT', 5))
+AUTH_TOKEN_LOCAL_CACHE_SIZE = 1024
+
+FEED_CACHE_SIZE = int(os.getenv('FEED_CACHE_SIZE', 50))
+FEED_CACHE_TIMEOUT = int(os.getenv('FEED_CACHE_TIMEOUT', 60 * 60))
+
+# Поток событий о новых рецептах (api.events).
+# LocalBroker работает только внутри одного процесса, поэтому без Redis
+# он выбирается лишь в режиме отладки: иначе события, опубликованные
+# процессами gunicorn, не дошли бы до процесса потока событий.
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', (
+    'recipes.events.RedisBroker' if REDIS_URL
+    else 'recipes.events.LocalBroker' if DEBUG
+    else ''
+))
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+EVENTS_KEEPALIVE_INTERVAL = int(os.getenv('EVENTS_KEEPALIVE_INTERVAL', 15))
+
+# Профилирование запросов сотрудников (backend.middleware.ProfilerMiddleware)
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'False').lower() == 'true'
+PROFILER_CACHE_TIMEOUT = int(os.getenv('PROFILER_CACHE_TIMEOUT', 60 * 60))
+
+# Запросы к базе дольше порога записываются в SlowQuery, 0 - отключено
+SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', 500))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.AnonCostRateThrottle',
+        'api.throttling.UserCostRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.getenv('THROTTLE_ANON_RATE', '300/minute'),
+        'user': os.getenv('THROTTLE_USER_RATE', '1200/minute'),
+    },
+    # Число прокси перед приложением: адрес клиента для ограничения
+    # частоты берётся из X-Forwarded-For, который дописывает nginx.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageLimitPagination',
     'PAGE_SIZE': 6,
 }
@@ -170,6 +257,7 @@ SPECTACULAR_SETTINGS = {
 
 DJOSER = {
     'SERIALIZERS': {
+        'user_create': 'api.serializers.UserCreateSerializer',
         'user': 'api.serializers.BaseUserSerializer',
         'current_user': 'api.serializers.BaseUserSerializer',
     },
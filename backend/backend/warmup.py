@@ -0,0 +1,81 @@
+"""
+Прогрев приложения перед приёмом запросов.
+
+Вызывается из gunicorn.conf.py в главном процессе после загрузки
+приложения (preload_app) и до запуска рабочих процессов: всё, что
+загружено здесь, рабочие процессы получают готовым при fork.
+Прогрев импортирует модули API, собирает маршруты, строит индекс
+продуктов и выполняет внутренние запросы к спискам тегов, продуктов
+и рецептов, чтобы загрузить сериализаторы, фильтры и рендереры.
+Ошибка этапа только записывается в журнал: прогрев ускоряет первые
+запросы, но не должен мешать запуску. Соединения с базой в конце
+закрываются: рабочие процессы не должны делить сокет главного процесса.
+"""
+
+import logging
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MODULES = (
+    'api.serializers', 'api.fast_serializers', 'api.filters', 'api.views',
+    'djoser.serializers', 'djoser.urls.authtoken',
+    'django_filters.rest_framework', 'rest_framework.authtoken.views',
+)
+WARMUP_URLS = ('/api/tags/', '/api/ingredients/', '/api/recipes/')
+
+
+def warmup_host():
+    """Имя хоста из ALLOWED_HOSTS для внутренних запросов."""
+    return next((
+        host for host in settings.ALLOWED_HOSTS
+        if '*' not in host and not host.startswith('.')
+    ), 'localhost')
+
+
+def warm_up(urls=WARMUP_URLS):
+    """
+    Прогревает приложение и возвращает длительность этапов в мс.
+    Этапы, завершившиеся ошибкой, пропускаются.
+    """
+    timings = {}
+
+    def stage(name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            logger.warning('Этап прогрева %s не выполнен', name,
+                           exc_info=True)
+            return
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    stage('imports', lambda: [import_module(name) for name in WARMUP_MODULES])
+    # Сборка шаблонов маршрутов и обратного словаря для reverse().
+    stage('urls', lambda: get_resolver().reverse_dict)
+
+    def ingredient_index():
+        from recipes.ingredient_index import get_ingredient_index
+        get_ingredient_index()
+    stage('ingredient_index', ingredient_index)
+
+    # Исключения вьюх превращаются в ответы 500, а не пробрасываются.
+    client = Client(raise_request_exception=False, HTTP_HOST=warmup_host())
+
+    def request(url):
+        status = client.get(url).status_code
+        if status >= 500:
+            raise RuntimeError(f'Ответ {status}')
+
+    try:
+        for url in urls:
+            stage(url, lambda: request(url))
+    finally:
+        connections.close_all()
+    return timings
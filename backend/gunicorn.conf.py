@@ -0,0 +1,45 @@
+"""
+Настройки gunicorn.
+
+Приложение загружается и прогревается в главном процессе до запуска
+рабочих (preload_app), поэтому рабочие процессы стартуют с уже
+импортированными модулями и собранными маршрутами, а первые запросы
+после выкладки не ждут ленивой загрузки. Каждый рабочий процесс
+открывает соединение с базой до приёма запросов. Ошибки прогрева
+только записываются в журнал и не останавливают запуск.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+preload_app = True
+wsgi_app = 'backend.wsgi:application'
+
+
+def when_ready(server):
+    """Прогревает приложение перед запуском рабочих процессов."""
+    from backend.warmup import warm_up
+
+    try:
+        timings = warm_up()
+    except Exception:
+        server.log.exception('Прогрев не выполнен')
+    else:
+        server.log.info('Прогрев завершён: %s', timings)
+
+
+def post_worker_init(worker):
+    """Открывает соединения с базой до приёма запросов."""
+    from django.db import DatabaseError, connections
+
+    for connection in connections.all():
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            # Соединение откроется при первом запросе.
+            worker.log.exception('Не удалось подключиться к базе %s',
+                                 connection.alias)
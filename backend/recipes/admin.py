@@ -1,15 +1,122 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.safestring import mark_safe
 from django.contrib.auth.models import Group
 
-from .models import (Favorite, Ingredient, RecipeIngredients, Recipe,
-                     ShoppingCart, Tag, User, Subscription)
+from .constants import COOKING_TIME_BUCKETS
+from .purge import soft_delete_recipes, soft_delete_users
+from .models import (ArchivedShoppingCart, Favorite, Ingredient,
+                     RecipeIngredients, Recipe, ShoppingCart, SlowQuery, Tag,
+                     Task, User, Subscription, cooking_time_q)
 
 # Убираем стандартные модели
 admin.site.unregister(Group)
 
 
+def count_of(model, field):
+    """Подзапрос с количеством связанных объектов для аннотации."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+class SoftDeleteAdminMixin:
+    """
+    Удаление из админки помечает объекты и ставит их очистку в очередь.
+    Связанные объекты на странице подтверждения не собираются:
+    для активных пользователей это само по себе долго.
+    """
+
+    soft_delete = None
+
+    def get_deleted_objects(self, objs, request):
+        return (
+            [str(obj) for obj in objs],
+            {self.model._meta.verbose_name_plural: len(objs)},
+            set(), []
+        )
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, self.model.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        task = self.soft_delete(queryset)
+        if task is not None:
+            self.message_user(
+                request, f'Связанные объекты удаляются фоновой задачей '
+                         f'№{task.id}.')
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Фильтр по связанному объекту в виде поля с автодополнением.
+    Варианты запрашиваются при вводе через автодополнение админки,
+    поэтому список всех объектов при открытии страницы не загружается.
+    Скрипты виджета подключает AutocompleteFilterMixin модели.
+    """
+    template = 'admin/autocomplete_filter.html'
+    field_name = ''
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.field_name)
+        self.form_field = forms.ModelChoiceField(
+            field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(field, model_admin.admin_site, attrs={
+                'id': f'filter_{self.parameter_name}',
+                'onchange': 'this.form.submit()',
+                'style': 'width: 100%',
+            })
+        )
+
+    def lookups(self, request, model_admin):
+        # Фильтр отображается только при непустом списке вариантов.
+        return (('', self.title),)
+
+    def choices(self, changelist):
+        query_parts = changelist.params.copy()
+        query_parts.pop(self.parameter_name, None)
+        yield {
+            'query_parts': query_parts.items(),
+            'widget': self.form_field.widget.render(
+                self.parameter_name, self.value()),
+        }
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        if not self.value().isdigit():
+            raise IncorrectLookupParameters
+        return queryset.filter(**{self.field_name: self.value()})
+
+
+class AutocompleteFilterMixin:
+    """Подключает скрипты и стили фильтров с автодополнением."""
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
+class AuthorFilter(AutocompleteFilter):
+    title = ('Автор')
+    parameter_name = 'author'
+    field_name = 'author'
+
+
+class SubscriberFilter(AutocompleteFilter):
+    title = ('Подписчик')
+    parameter_name = 'subscriber'
+    field_name = 'subscriber'
+
+
 class RelatedObjectFilter(admin.SimpleListFilter):
     """
     Фильтр для проверки наличия связанных объектов.
@@ -54,7 +161,8 @@ class HasFollowersFilter(RelatedObjectFilter):
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(SoftDeleteAdminMixin, BaseUserAdmin):
+    soft_delete = staticmethod(soft_delete_users)
     list_display = (
         'username', 'email', 'full_name', 'avatar_preview',
         'recipe_count', 'subscription_count', 'follower_count'
@@ -81,6 +189,13 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=count_of(Recipe, 'author'),
+            subscriptions_count=count_of(Subscription, 'subscriber'),
+            followers_count=count_of(Subscription, 'author'),
+        )
+
     @admin.display(description=('ФИО'))
     def full_name(self, user):
         return f'{user.first_name} {user.last_name}'
@@ -92,21 +207,21 @@ class UserAdmin(BaseUserAdmin):
                              f'style="max-height: 50px; max-width: 50px;" />')
         return ("Нет аватара")
 
-    @admin.display(description=('Рецепты'))
+    @admin.display(description=('Рецепты'), ordering='recipes_count')
     def recipe_count(self, user):
-        return user.recipes.count()
+        return user.recipes_count
 
-    @admin.display(description=('Подписки'))
+    @admin.display(description=('Подписки'), ordering='subscriptions_count')
     def subscription_count(self, user):
-        return user.followers.count()
+        return user.subscriptions_count
 
-    @admin.display(description=('Подписчики'))
+    @admin.display(description=('Подписчики'), ordering='followers_count')
     def follower_count(self, user):
-        return user.authors.count()
+        return user.followers_count
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ('author', 'subscriber')
     search_fields = (
         'subscriber__username',
@@ -114,7 +229,9 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'subscriber__email',
         'author__email'
     )
-    list_filter = ('author', 'subscriber')
+    list_filter = (AuthorFilter, SubscriberFilter)
+    list_select_related = ('author', 'subscriber')
+    autocomplete_fields = ('author', 'subscriber')
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -125,6 +242,10 @@ class RecipeIngredientInline(admin.TabularInline):
     verbose_name_plural = ('Продукты')
     fields = ('ingredient', 'get_measurement_unit', 'amount')
     readonly_fields = ('get_measurement_unit',)
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
 
     @admin.display(description=('Ед. изм.'))
     def get_measurement_unit(self, obj):
@@ -136,40 +257,51 @@ class CookingTimeFilter(admin.SimpleListFilter):
     parameter_name = "cooking_time"
 
     def lookups(self, request, model_admin):
-        # Применяем одноразовые переменные для соблюдения PEP8
-        light = Recipe.objects.filter(cooking_time__lte=30).count()
-        medium = Recipe.objects.filter(
-            cooking_time__gt=30, cooking_time__lte=60).count()
-        though = Recipe.objects.filter(cooking_time__gt=60).count()
+        # Количество рецептов во всех интервалах считается одним запросом
+        counts = Recipe.objects.aggregate(**{
+            f'bucket_{index}': Count('id', filter=cooking_time_q(low, high))
+            for index, (_, _, low, high) in enumerate(COOKING_TIME_BUCKETS)
+        })
         return [
-            ('0-30', f'До 30 мин ({light})'),
-            ('30-60', f'30-60 мин ({medium})'),
-            ('60+', f'Более 60 мин ({though})'),
+            (key, f'{title} ({counts[f"bucket_{index}"]})')
+            for index, (key, title, _, _) in enumerate(COOKING_TIME_BUCKETS)
         ]
 
     def queryset(self, request, queryset):
-        if self.value() == '0-30':
-            return queryset.filter(cooking_time__lte=30)
-        if self.value() == '30-60':
-            return queryset.filter(cooking_time__gt=30, cooking_time__lte=60)
-        if self.value() == '60+':
-            return queryset.filter(cooking_time__gt=60)
+        for key, _, low, high in COOKING_TIME_BUCKETS:
+            if self.value() == key:
+                return queryset.filter(cooking_time_q(low, high))
         return queryset
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(SoftDeleteAdminMixin, AutocompleteFilterMixin,
+                  admin.ModelAdmin):
+    soft_delete = staticmethod(soft_delete_recipes)
     list_display = (
         'id', 'name', 'author', 'cooking_time_display',
         'tags_display', 'added_in_favorites',
         'ingredients_list', 'image_preview'
     )
-    list_filter = (CookingTimeFilter, 'author', 'tags')
+    list_filter = (CookingTimeFilter, AuthorFilter, 'tags')
     search_fields = ('name', 'author__username', 'tags__name')
+    autocomplete_fields = ('author',)
     inlines = [RecipeIngredientInline]
     verbose_name = ('Рецепт')
     verbose_name_plural = ('Рецепты')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient')
+            )
+        )
+
     @admin.display(description=('Теги'))
     def tags_display(self, obj):
         return mark_safe('<br>'.join(tag.name for tag in obj.tags.all()))
@@ -188,9 +320,9 @@ class RecipeAdmin(admin.ModelAdmin):
                 f'<img src="{obj.image.url}" style="max-height: 50px;" />')
         return ('')
 
-    @admin.display(description=('В избранном'))
+    @admin.display(description=('В избранном'), ordering='favorites_count')
     def added_in_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     @admin.display(description=('Время (мин)'))
     def cooking_time_display(self, obj):
@@ -203,9 +335,13 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name', 'measurement_unit')
     list_filter = ('measurement_unit',)
 
-    @admin.display(description=('Рецептов'))
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=count_of(RecipeIngredients, 'ingredient'))
+
+    @admin.display(description=('Рецептов'), ordering='recipes_count')
     def recipe_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 @admin.register(Tag)
@@ -213,16 +349,71 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug', 'recipe_count')
     search_fields = ('name', 'slug')
 
-    @admin.display(description=('Рецептов'))
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=count_of(Recipe.tags.through, 'tag'))
+
+    @admin.display(description=('Рецептов'), ordering='recipes_count')
     def recipe_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 @admin.register(ShoppingCart, Favorite)
 class FavouriteAndShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe',)
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+
+
+@admin.register(ArchivedShoppingCart)
+class ArchivedShoppingCartAdmin(admin.ModelAdmin):
+    list_display = ('user', 'recipe', 'created_at', 'archived_at')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(RecipeIngredients)
 class IngredientInRecipe(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount',)
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'user', 'status', 'attempts',
+                    'progress', 'run_after', 'updated_at')
+    list_filter = ('status', 'name')
+    list_select_related = ('user',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    """Медленные запросы, самые затратные по общему времени - первыми."""
+
+    list_display = ('short_sql', 'origin', 'count', 'average_time',
+                    'max_time', 'total_time', 'last_seen')
+    list_filter = ('origin',)
+    search_fields = ('sql', 'origin')
+    readonly_fields = ('fingerprint', 'sql', 'example', 'params', 'origin',
+                       'stack', 'plan', 'count', 'total_time', 'max_time',
+                       'first_seen', 'last_seen')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            average=F('total_time') / F('count'))
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Запрос')
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+    @admin.display(description='Среднее время, мс', ordering='average')
+    def average_time(self, obj):
+        return round(obj.average, 1)
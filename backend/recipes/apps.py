@@ -6,3 +6,10 @@ class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
     verbose_name = _('Рецепты')
+
+    def ready(self):
+        from django.utils.module_loading import autodiscover_modules
+
+        from . import signals  # noqa: F401
+        # Регистрация обработчиков фоновых задач из tasks.py приложений
+        autodiscover_modules('tasks')
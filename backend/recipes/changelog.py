@@ -0,0 +1,123 @@
+"""
+Журнал изменений для синхронизации клиентов.
+
+Сигналы записывают в ChangeLog изменения рецептов, избранного, списка
+покупок и подписок, а клиент запрашивает записи после своего курсора.
+Сжатие журнала удаляет записи, перекрытые более поздними записями
+о том же объекте, и записи старше срока хранения. На месте последней
+удалённой по сроку записи остаётся граница: клиенту с курсором до неё
+нужна полная загрузка.
+"""
+
+from datetime import timedelta
+
+from django.db.models import Exists, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .constants import CHANGELOG_RETENTION_DAYS
+from .models import ChangeLog, Favorite, Recipe, ShoppingCart, Subscription
+
+# Модели связей пользователя и соответствующие им типы записей
+CHANGE_KINDS = {
+    Favorite: ChangeLog.Kind.FAVORITE,
+    ShoppingCart: ChangeLog.Kind.SHOPPING_CART,
+    Subscription: ChangeLog.Kind.SUBSCRIPTION,
+}
+
+
+def log_changes(kind, user_id, object_ids, action=ChangeLog.Action.UPSERT):
+    """Добавляет в журнал записи об изменении объектов."""
+    ChangeLog.objects.bulk_create(
+        ChangeLog(kind=kind, user_id=user_id, object_id=object_id,
+                  action=action)
+        for object_id in object_ids
+    )
+
+
+def log_relation(instance, action):
+    """Записывает в журнал изменение избранного, покупок или подписки."""
+    if isinstance(instance, Subscription):
+        user_id, object_id = instance.subscriber_id, instance.author_id
+    else:
+        user_id, object_id = instance.user_id, instance.recipe_id
+    log_changes(CHANGE_KINDS[type(instance)], user_id, [object_id], action)
+
+
+def recipe_author(recipe_id):
+    """
+    Автор рецепта в виде подзапроса: он выполняется внутри вставки
+    записи журнала, без отдельного запроса.
+    """
+    return Subquery(Recipe.all_objects.filter(
+        id=recipe_id).values('author_id'))
+
+
+def log_recipe(recipe, action=ChangeLog.Action.UPSERT):
+    """Записывает в журнал изменение рецепта."""
+    log_changes(ChangeLog.Kind.RECIPE, recipe.author_id, [recipe.id], action)
+
+
+def latest_cursor():
+    """Курсор последней записи журнала."""
+    return ChangeLog.objects.aggregate(cursor=Max('id'))['cursor'] or 0
+
+
+def needs_reset(since):
+    """
+    Проверяет, что клиенту нужна полная загрузка: курсора нет
+    или записи после него могли быть удалены сжатием.
+    """
+    return since is None or ChangeLog.objects.filter(
+        kind=ChangeLog.Kind.HORIZON, id__gt=since).exists()
+
+
+def changes_since(user, since, limit):
+    """
+    Возвращает последние действия по объектам, изменённым после курсора,
+    курсор последней прочитанной записи и признак наличия следующих.
+    Пользователь получает свои изменения и изменения рецептов авторов,
+    на которых подписан, а также рецептов из избранного и покупок.
+    """
+    recipes = (
+        Q(user__in=Subscription.objects.filter(
+            subscriber=user).values('author'))
+        | Q(object_id__in=Favorite.objects.filter(
+            user=user).values('recipe'))
+        | Q(object_id__in=ShoppingCart.objects.filter(
+            user=user).values('recipe'))
+    )
+    entries = list(ChangeLog.objects.filter(
+        Q(user=user) | Q(recipes, kind=ChangeLog.Kind.RECIPE),
+        id__gt=since
+    ).values_list('id', 'kind', 'object_id', 'action')[:limit + 1])
+    more = len(entries) > limit
+    entries = entries[:limit]
+    actions = {}
+    for _, kind, object_id, action in entries:
+        actions[kind, object_id] = action
+    return actions, (entries[-1][0] if entries else since), more
+
+
+def compact_changelog(retention_days=CHANGELOG_RETENTION_DAYS):
+    """
+    Сжимает журнал и возвращает количество удалённых записей.
+    Перекрытые записи удаляются всегда, устаревшие - вместе с прежней
+    границей журнала.
+    """
+    log = ChangeLog.objects.all()
+    deleted, _ = log.exclude(kind=ChangeLog.Kind.HORIZON).filter(Exists(
+        ChangeLog.objects.filter(
+            user_id=OuterRef('user_id'), kind=OuterRef('kind'),
+            object_id=OuterRef('object_id'), id__gt=OuterRef('id')
+        )
+    )).delete()
+    horizon = log.filter(
+        created_at__lt=timezone.now() - timedelta(days=retention_days)
+    ).aggregate(horizon=Max('id'))['horizon']
+    if horizon:
+        deleted += log.filter(id__lt=horizon).delete()[0]
+        log.filter(id=horizon).update(
+            kind=ChangeLog.Kind.HORIZON, user=None, object_id=0,
+            action=ChangeLog.Action.DELETE
+        )
+    return deleted
@@ -32,6 +32,7 @@ DUPLICATE_OF_RECIPE_ADD_CART = (
 UNEXIST_RECIPE_CREATE_ERROR = (
     '{recipe} не существует или удален.'
 )
+UNEXIST_OBJECTS_ERROR = 'Объекты не существуют: {ids}.'
 UNEXIST_SHOPPING_CART_ERROR = (
     'Данный список рецептов не существует или удален.'
 )
@@ -47,3 +48,73 @@ MONTH_NAMES = [
     "января", "февраля", "марта", "апреля", "мая", "июня",
     "июля", "августа", "сентября", "октября", "ноября", "декабря"
 ]
+BULK_MAX_SIZE = 100
+BULK_CREATED = 'created'
+BULK_EXISTS = 'exists'
+BULK_DELETED = 'deleted'
+BULK_ABSENT = 'absent'
+BULK_NOT_FOUND = 'not_found'
+BULK_SELF = 'self'
+SIMILAR_RECIPES_TOP_K = 10
+RECOMMENDED_RECIPES_LIMIT = 20
+SIMILARITY_INTERACTIONS_WEIGHT = 0.6
+SIMILARITY_INGREDIENTS_WEIGHT = 0.3
+SIMILARITY_TAGS_WEIGHT = 0.1
+# Интервалы времени приготовления: (ключ, название, от (не включая), до).
+COOKING_TIME_BUCKETS = (
+    ('0-30', 'До 30 мин', None, 30),
+    ('30-60', '30-60 мин', 30, 60),
+    ('60+', 'Более 60 мин', 60, None),
+)
+# Перевод единиц измерения: единица -> (базовая единица, множитель).
+# Единицы без перевода (щепотка, по вкусу и т.п.) остаются как есть.
+UNIT_CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('мл', 5),
+    'ст. л.': ('мл', 15),
+    'стакан': ('мл', 200),
+    'шт.': ('шт.', 1),
+}
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_FAVORITE_WEIGHT = 1.0
+POPULARITY_SHOPPING_CART_WEIGHT = 0.5
+# Задержка, чтобы не пропустить события из ещё не завершённых транзакций.
+POPULARITY_LAG_SECONDS = 60
+# Интервал фонового обновления популярности, в секундах
+POPULARITY_UPDATE_INTERVAL = 5 * 60
+POPULAR_RECIPES_LIMIT = 20
+POPULAR_CACHE_MAX_AGE = 300
+TASK_NAME_MAX_LENGTH = 64
+TASK_RESULT_NAME_MAX_LENGTH = 255
+TASK_MAX_ATTEMPTS = 3
+# Задержка перед повтором удваивается с каждой попыткой, в секундах.
+TASK_RETRY_DELAY = 30
+# Задача, выполняющаяся дольше, считается зависшей и запускается снова.
+TASK_TIMEOUT = 10 * 60
+TASK_NOT_READY_ERROR = 'Задача ещё не выполнена.'
+TASK_NO_FILE_ERROR = 'Результат задачи не является файлом.'
+TASK_TIMEOUT_ERROR = 'Задача зависла и исчерпала попытки.'
+# Как часто обработчик проверяет, что периодические задачи в очереди.
+TASK_SCHEDULE_INTERVAL = 60
+# Стоимость тяжёлых запросов для ограничения частоты.
+SHOPPING_LIST_THROTTLE_COST = 20
+SUBSCRIPTIONS_THROTTLE_COST = 5
+# Количество записей журнала изменений, отдаваемых за один запрос
+SYNC_BATCH_SIZE = 500
+CHANGELOG_RETENTION_DAYS = 30
+# Медленные SQL-запросы
+SLOW_QUERY_ORIGIN_MAX_LENGTH = 255
+# Количество кадров стека кода проекта, сохраняемых для запроса.
+SLOW_QUERY_STACK_DEPTH = 8
+# Число хеш-секций таблиц избранного и списков покупок в PostgreSQL
+USER_RECIPE_PARTITIONS = 8
+# Список покупок без добавлений за это число дней переносится в архив
+SHOPPING_CART_ARCHIVE_DAYS = 60
+SHOPPING_CART_ARCHIVE_BATCH_SIZE = 500
+# Количество объектов, удаляемых фоновой очисткой за одну транзакцию
+PURGE_BATCH_SIZE = 500
+# Файлы моложе этого числа часов не удаляются очисткой медиафайлов
+MEDIA_GC_GRACE_HOURS = 24
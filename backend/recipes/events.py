@@ -0,0 +1,134 @@
+"""
+Рассылка событий о новых рецептах.
+
+При публикации рецепта в брокер отправляется одно сообщение со списком
+подписчиков автора. Каждый процесс, обслуживающий поток событий
+(api.events), читает сообщения брокера одной задачей и раздаёт их
+своим открытым соединениям. Брокер выбирается настройкой EVENTS_BROKER:
+LocalBroker работает в пределах одного процесса и подходит для
+разработки и тестов, RedisBroker связывает процессы через Redis Pub/Sub.
+Без настроенного брокера процесс потока событий не запускается,
+а проверки Django (check, migrate) сообщают об ошибке.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.checks import Error, register
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .models import Subscription
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = 'recipe_events'
+BROKER_NOT_CONFIGURED = (
+    'Не задан брокер событий: укажите REDIS_URL или EVENTS_BROKER. '
+    'LocalBroker не связывает процессы и подходит только для отладки.'
+)
+
+
+class LocalBroker:
+    """Брокер в памяти процесса."""
+
+    def __init__(self):
+        self.listeners = set()
+        self.lock = threading.Lock()
+
+    def publish(self, message):
+        # Публикация идёт из потока запроса, а слушатели живут
+        # в цикле событий, поэтому сообщение передаётся через него.
+        with self.lock:
+            listeners = list(self.listeners)
+        for loop, queue in listeners:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # Цикл событий уже закрыт.
+                pass
+
+    async def listen(self):
+        listener = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            self.listeners.add(listener)
+        try:
+            while True:
+                yield await listener[1].get()
+        finally:
+            with self.lock:
+                self.listeners.discard(listener)
+
+
+class RedisBroker:
+    """Брокер на Redis Pub/Sub для нескольких процессов и серверов."""
+
+    def __init__(self, url=None):
+        self.url = url or settings.REDIS_URL
+        self.client = None
+
+    def publish(self, message):
+        import redis
+
+        if self.client is None:
+            self.client = redis.Redis.from_url(self.url)
+        self.client.publish(EVENTS_CHANNEL, json.dumps(message))
+
+    async def listen(self):
+        from redis import asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(EVENTS_CHANNEL)
+        try:
+            async for item in pubsub.listen():
+                yield json.loads(item['data'])
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """Возвращает брокер, заданный настройкой EVENTS_BROKER."""
+    if not settings.EVENTS_BROKER:
+        raise ImproperlyConfigured(BROKER_NOT_CONFIGURED)
+    return import_string(settings.EVENTS_BROKER)()
+
+
+@register()
+def check_events_broker(app_configs, **kwargs):
+    """Проверка Django: брокер событий должен быть задан."""
+    if settings.EVENTS_BROKER:
+        return []
+    return [Error(BROKER_NOT_CONFIGURED, id='recipes.E001')]
+
+
+def recipe_event(recipe):
+    """Описание нового рецепта, отправляемое подписчикам."""
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'author': recipe.author_id,
+    }
+
+
+def publish_recipe(recipe):
+    """Отправляет подписчикам автора событие о новом рецепте."""
+    user_ids = list(Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('subscriber_id', flat=True))
+    if not user_ids:
+        return
+    # Рецепт уже сохранён, поэтому сбой брокера не должен ломать запрос:
+    # клиент получит пропущенное через /api/sync/.
+    try:
+        get_broker().publish(
+            {'users': user_ids, 'event': recipe_event(recipe)})
+    except Exception:
+        logger.exception('Не удалось отправить событие о рецепте %s',
+                         recipe.id)
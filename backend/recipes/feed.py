@@ -0,0 +1,51 @@
+"""
+Кэш ленты подписок.
+
+Для каждого пользователя хранится список идентификаторов последних
+рецептов авторов, на которых он подписан. Первая страница ленты
+отдаётся из этого списка, а при публикации нового рецепта он
+добавляется в начало уже закэшированных лент подписчиков.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Recipe, Subscription
+
+FEED_CACHE_KEY = 'feed:{}'
+
+
+def filter_feed(recipes, user):
+    """Оставляет рецепты авторов, на которых подписан пользователь."""
+    return recipes.filter(author__authors__subscriber=user)
+
+
+def get_feed_ids(user):
+    """Возвращает закэшированное начало ленты, заполняя кэш при промахе."""
+    key = FEED_CACHE_KEY.format(user.id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(filter_feed(Recipe.objects, user).order_by(
+            '-created_at', '-id'
+        ).values_list('id', flat=True)[:settings.FEED_CACHE_SIZE])
+        cache.set(key, ids, settings.FEED_CACHE_TIMEOUT)
+    return ids
+
+
+def push_recipe(recipe):
+    """Добавляет новый рецепт в закэшированные ленты подписчиков автора."""
+    subscriber_ids = Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('subscriber_id', flat=True)
+    keys = [FEED_CACHE_KEY.format(pk) for pk in subscriber_ids]
+    if not keys:
+        return
+    cache.set_many({
+        key: [recipe.id, *ids][:settings.FEED_CACHE_SIZE]
+        for key, ids in cache.get_many(keys).items()
+    }, settings.FEED_CACHE_TIMEOUT)
+
+
+def invalidate_feeds(user_ids):
+    """Сбрасывает кэш лент указанных пользователей."""
+    cache.delete_many([FEED_CACHE_KEY.format(pk) for pk in user_ids])
@@ -0,0 +1,81 @@
+"""
+Индекс продуктов рецептов для поиска «что приготовить».
+
+Состав всех рецептов хранится в памяти процесса как разреженная
+матрица рецепты x продукты. Покрытие набора продуктов пользователя
+считается одним умножением матрицы на вектор. Индекс перестраивается
+при первом обращении после изменения состава какого-либо рецепта:
+изменения отмечаются новой версией в общем кэше.
+"""
+
+import time
+
+import numpy as np
+from django.core.cache import cache
+from scipy import sparse
+
+from .models import RecipeIngredients
+
+INDEX_VERSION_KEY = 'ingredient_index:version'
+
+_index = None
+
+
+class IngredientIndex:
+    """Матрица рецепты x продукты с количеством продуктов в рецепте."""
+
+    def __init__(self, version):
+        self.version = version
+        links = np.array(list(RecipeIngredients.objects.filter(
+            recipe__deleted_at__isnull=True
+        ).values_list('recipe_id', 'ingredient_id')),
+            dtype=np.int64).reshape(-1, 2)
+        self.recipe_ids, rows = np.unique(links[:, 0], return_inverse=True)
+        self.ingredient_ids, columns = np.unique(
+            links[:, 1], return_inverse=True)
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(links), dtype=np.float32), (rows, columns)),
+            shape=(len(self.recipe_ids), len(self.ingredient_ids))
+        )
+        self.matrix.sum_duplicates()
+        self.matrix.data[:] = 1
+        self.required = np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def match(self, ingredient_ids):
+        """
+        Возвращает рецепты, в которых есть хотя бы один из продуктов,
+        в виде списка (id рецепта, доля имеющихся продуктов,
+        количество недостающих), по убыванию покрытия.
+        """
+        ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ingredient_ids, ingredient_ids)
+        known = positions < len(self.ingredient_ids)
+        positions = positions[known]
+        available = np.zeros(len(self.ingredient_ids), dtype=np.float32)
+        available[positions[
+            self.ingredient_ids[positions] == ingredient_ids[known]]] = 1
+        matched = (self.matrix @ available).astype(np.float64)
+        found = np.flatnonzero(matched)
+        coverage = matched[found] / self.required[found]
+        missing = (self.required[found] - matched[found]).astype(np.int64)
+        order = np.lexsort((self.recipe_ids[found], missing, -coverage))
+        return list(zip(
+            self.recipe_ids[found][order].tolist(),
+            coverage[order].tolist(),
+            missing[order].tolist()
+        ))
+
+
+def get_ingredient_index():
+    """Возвращает актуальный индекс, перестраивая его при необходимости."""
+    global _index
+    cache.add(INDEX_VERSION_KEY, time.time(), None)
+    version = cache.get(INDEX_VERSION_KEY)
+    if _index is None or _index.version != version:
+        _index = IngredientIndex(version)
+    return _index
+
+
+def invalidate_ingredient_index():
+    """Отмечает индекс устаревшим во всех процессах."""
+    cache.set(INDEX_VERSION_KEY, time.time(), None)
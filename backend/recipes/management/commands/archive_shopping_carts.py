@@ -0,0 +1,28 @@
+"""
+Команда для архивации заброшенных списков покупок.
+
+Её удобно запускать по расписанию или фоновой задачей
+archive_shopping_carts.
+"""
+
+from django.core.management.base import BaseCommand
+
+from recipes.constants import SHOPPING_CART_ARCHIVE_DAYS
+from recipes.shopping_list import archive_stale_shopping_carts
+
+
+class Command(BaseCommand):
+    """Команда для архивации заброшенных списков покупок."""
+
+    help = 'Перенос давно не менявшихся списков покупок в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-days', type=int, default=SHOPPING_CART_ARCHIVE_DAYS,
+            help='Через сколько дней без добавлений список архивируется'
+        )
+
+    def handle(self, *args, **options):
+        archived = archive_stale_shopping_carts(options['stale_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок архивированы. Перенесено строк: {archived}'))
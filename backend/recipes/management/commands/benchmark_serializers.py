@@ -0,0 +1,84 @@
+"""
+Команда для замера сборки списка рецептов.
+
+Страница рецептов из базы собирается RecipeSerializer (с теми же
+select_related и prefetch_related, что и во вьюсете) и функцией
+build_recipes из values(). Замер повторяется для анонимного
+пользователя и пользователя с данными избранного и покупок.
+Показываются медианы времени сборки одной страницы.
+"""
+
+import time
+from statistics import median
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import RECIPE_FIELDS, build_recipes
+from api.serializers import RecipeSerializer
+from recipes.models import Recipe, RecipeIngredients, User
+
+
+def serialize(recipes, request):
+    recipes = recipes.select_related('author').prefetch_related(
+        'tags', 'favorites', 'shoppingcarts',
+        Prefetch('recipe_ingredients',
+                 queryset=RecipeIngredients.objects.select_related(
+                     'ingredient'))
+    )
+    return RecipeSerializer(
+        recipes, many=True, context={'request': request}).data
+
+
+def build(recipes, request):
+    return build_recipes(recipes.values(*RECIPE_FIELDS), request)
+
+
+class Command(BaseCommand):
+    """Команда для замера сборки списка рецептов."""
+
+    help = 'Замер сборки страницы рецептов сериализатором и build_recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size', type=int, default=6,
+            help='Количество рецептов на странице'
+        )
+        parser.add_argument(
+            '--rounds', type=int, default=200,
+            help='Количество сборок страницы для каждого способа'
+        )
+        parser.add_argument(
+            '--email', help='Почта пользователя для замера с авторизацией'
+        )
+
+    def measure(self, func, recipes, request, rounds):
+        func(recipes, request)
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            func(recipes, request)
+            timings.append((time.perf_counter() - start) * 1000)
+        return median(timings)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()[:options['page_size']]
+        if not recipes.exists():
+            raise CommandError('В базе нет рецептов.')
+        user = (User.objects.filter(email=options['email']).first()
+                if options['email'] else User.objects.first())
+        self.stdout.write(
+            f'{"":<15}{"сериализатор":>15}{"build_recipes":>15}')
+        for title, current in (('Аноним', AnonymousUser()),
+                               ('Пользователь', user)):
+            request = Request(APIRequestFactory().get('/api/recipes/'))
+            request.user = current
+            slow, fast = (
+                self.measure(func, recipes, request, options['rounds'])
+                for func in (serialize, build)
+            )
+            self.stdout.write(
+                f'{title:<15}{slow:>12.2f} мс{fast:>12.2f} мс')
@@ -0,0 +1,81 @@
+"""
+Команда для замера холодного старта.
+
+Запускает отдельные процессы, как будто это только что запущенные
+рабочие процессы gunicorn, и измеряет время первых запросов к API
+без прогрева и после прогрева backend.warmup. Показывает медианы
+по нескольким запускам.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from backend.warmup import WARMUP_URLS, warm_up, warmup_host
+
+
+class Command(BaseCommand):
+    """Команда для замера холодного старта."""
+
+    help = 'Замер первых запросов после запуска процесса с прогревом и без'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rounds', type=int, default=3,
+            help='Количество запусков процесса для каждого режима'
+        )
+        # Режим дочернего процесса, выполняющего один замер.
+        parser.add_argument(
+            '--probe', choices=('cold', 'warm'), help=argparse.SUPPRESS)
+
+    def probe(self, mode):
+        warm_up_ms = sum(warm_up().values()) if mode == 'warm' else 0
+        client = Client(HTTP_HOST=warmup_host())
+        first_requests = {}
+        for url in WARMUP_URLS:
+            start = time.perf_counter()
+            client.get(url)
+            first_requests[url] = (time.perf_counter() - start) * 1000
+        self.stdout.write(json.dumps(
+            {'warm_up': warm_up_ms, 'requests': first_requests}))
+
+    def run_probe(self, mode):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, str(settings.BASE_DIR / 'manage.py'),
+             'benchmark_startup', '--probe', mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process'] = (time.perf_counter() - start) * 1000
+        return result
+
+    def handle(self, *args, **options):
+        if options['probe']:
+            self.probe(options['probe'])
+            return
+        results = {
+            mode: [self.run_probe(mode) for _ in range(options['rounds'])]
+            for mode in ('cold', 'warm')
+        }
+        rows = [('Прогрев', 'warm_up'), *((url, url) for url in WARMUP_URLS),
+                ('Весь процесс', 'process')]
+        self.stdout.write(f'{"":<20}{"без прогрева":>15}{"с прогревом":>15}')
+        for title, key in rows:
+            values = [
+                median(
+                    result['requests'][key] if key in result['requests']
+                    else result[key]
+                    for result in results[mode]
+                )
+                for mode in ('cold', 'warm')
+            ]
+            self.stdout.write(
+                f'{title:<20}{values[0]:>12.1f} мс{values[1]:>12.1f} мс')
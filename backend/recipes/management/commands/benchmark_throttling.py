@@ -0,0 +1,93 @@
+"""
+Команда для замера накладных расходов ограничения частоты запросов.
+
+Один и тот же простой вьюсет вызывается через APIRequestFactory
+без ограничения и с классами AnonCostRateThrottle
+и UserCostRateThrottle, счётчики которых хранятся в настроенном кэше
+(Redis в продакшене). Для замера используется отдельная область
+счётчиков с лимитом, который не достигается, поэтому настоящие
+счётчики клиентов не затрагиваются. Показываются медианы времени
+одного запроса по нескольким запускам и их разница.
+"""
+
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from api.throttling import AnonCostRateThrottle, UserCostRateThrottle
+from recipes.models import User
+
+UNLIMITED_RATE = f'{10 ** 9}/minute'
+
+
+def benchmark_throttle(throttle_class):
+    """Класс ограничения с отдельной областью счётчиков и без лимита."""
+    return type(throttle_class.__name__, (throttle_class,), {
+        'scope': f'benchmark_{throttle_class.scope}',
+        'rate': UNLIMITED_RATE,
+    })
+
+
+class BenchmarkView(APIView):
+    permission_classes = (AllowAny,)
+    throttle_classes = ()
+
+    def get(self, request):
+        return Response()
+
+
+class Command(BaseCommand):
+    """Команда для замера накладных расходов ограничения частоты."""
+
+    help = 'Замер времени запроса с ограничением частоты и без него'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=2000,
+            help='Количество запросов в одном запуске'
+        )
+        parser.add_argument(
+            '--rounds', type=int, default=5,
+            help='Количество запусков для каждого режима'
+        )
+
+    def measure(self, view, user, requests):
+        factory = APIRequestFactory()
+        batch = [factory.get('/', REMOTE_ADDR='192.0.2.1')
+                 for _ in range(requests)]
+        if user is not None:
+            for request in batch:
+                force_authenticate(request, user)
+        start = time.perf_counter()
+        for request in batch:
+            view(request)
+        return (time.perf_counter() - start) / requests * 1_000_000
+
+    def handle(self, *args, **options):
+        plain = BenchmarkView.as_view()
+        throttled = BenchmarkView.as_view(throttle_classes=[
+            benchmark_throttle(AnonCostRateThrottle),
+            benchmark_throttle(UserCostRateThrottle),
+        ])
+        # Пользователь не сохраняется: ограничению нужен только id.
+        users = (('Аноним', None),
+                 ('Пользователь', User(pk=0, username='benchmark')))
+        self.stdout.write(
+            f'{"":<15}{"без ограничения":>18}{"с ограничением":>18}'
+            f'{"разница":>14}')
+        for title, user in users:
+            plain_us, throttled_us = (
+                median(
+                    self.measure(view, user, options['requests'])
+                    for _ in range(options['rounds'])
+                )
+                for view in (plain, throttled)
+            )
+            self.stdout.write(
+                f'{title:<15}{plain_us:>14.1f} мкс{throttled_us:>14.1f} мкс'
+                f'{throttled_us - plain_us:>10.1f} мкс')
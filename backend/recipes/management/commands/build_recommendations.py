@@ -0,0 +1,121 @@
+"""
+Команда для расчёта похожих рецептов.
+
+Каждый рецепт описывается разреженным вектором из трёх блоков:
+пользователи, добавившие его в избранное или список покупок,
+его продукты и его теги. Блоки нормируются и взвешиваются, после чего
+косинусная близость считается одним матричным произведением по пачкам
+рецептов. Для каждого рецепта сохраняются top-K ближайших соседей.
+"""
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from scipy import sparse
+
+from recipes.constants import (
+    SIMILAR_RECIPES_TOP_K, SIMILARITY_INGREDIENTS_WEIGHT,
+    SIMILARITY_INTERACTIONS_WEIGHT, SIMILARITY_TAGS_WEIGHT
+)
+from recipes.models import (
+    Favorite, Recipe, RecipeIngredients, RecipeSimilarity, ShoppingCart
+)
+
+
+def pairs(queryset, *fields):
+    """Загружает пары идентификаторов неудалённых рецептов в массив NumPy."""
+    return np.array(list(queryset.filter(
+        recipe__deleted_at__isnull=True
+    ).values_list(*fields)), dtype=np.int64).reshape(-1, 2)
+
+
+def normalized_block(recipe_ids, links, weight):
+    """
+    Строит матрицу рецепты x признаки с единичными строками,
+    умноженными на корень из веса блока.
+    """
+    # Рецепты, добавленные после загрузки recipe_ids, пропускаются.
+    links = links[np.isin(links[:, 0], recipe_ids)]
+    columns, column_index = np.unique(links[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(links), dtype=np.float32),
+         (np.searchsorted(recipe_ids, links[:, 0]), column_index)),
+        shape=(len(recipe_ids), len(columns))
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    norms = np.sqrt(np.asarray(matrix.sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(np.sqrt(weight) / norms) @ matrix
+
+
+class Command(BaseCommand):
+    """Команда для расчёта похожих рецептов."""
+
+    help = 'Расчёт похожих рецептов по избранному, продуктам и тегам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k', type=int, default=SIMILAR_RECIPES_TOP_K,
+            help='Количество похожих рецептов для каждого рецепта'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=256,
+            help='Количество рецептов, обрабатываемых за один шаг'
+        )
+
+    def handle(self, *args, **options):
+        recipe_ids = np.fromiter(
+            Recipe.objects.order_by('id').values_list('id', flat=True),
+            dtype=np.int64
+        )
+        top_k = min(options['top_k'], len(recipe_ids) - 1)
+        if top_k < 1:
+            self.stdout.write('Недостаточно рецептов для расчёта.')
+            return
+        # Пользователь и рецепт меняются местами, чтобы рецепт был строкой.
+        interactions = np.concatenate([
+            pairs(Favorite.objects, 'recipe_id', 'user_id'),
+            pairs(ShoppingCart.objects, 'recipe_id', 'user_id'),
+        ])
+        features = sparse.hstack([
+            normalized_block(
+                recipe_ids, interactions, SIMILARITY_INTERACTIONS_WEIGHT),
+            normalized_block(
+                recipe_ids,
+                pairs(RecipeIngredients.objects, 'recipe_id', 'ingredient_id'),
+                SIMILARITY_INGREDIENTS_WEIGHT),
+            normalized_block(
+                recipe_ids,
+                pairs(Recipe.tags.through.objects, 'recipe_id', 'tag_id'),
+                SIMILARITY_TAGS_WEIGHT),
+        ]).tocsr()
+        transposed = features.T.tocsc()
+        created = 0
+        with transaction.atomic():
+            RecipeSimilarity.objects.all().delete()
+            for start in range(0, len(recipe_ids), options['batch_size']):
+                stop = min(start + options['batch_size'], len(recipe_ids))
+                scores = (features[start:stop] @ transposed).toarray()
+                rows = np.arange(stop - start)
+                # Рецепт не должен попадать в список похожих на себя.
+                scores[rows, rows + start] = 0
+                neighbours = np.argpartition(
+                    -scores, top_k - 1, axis=1)[:, :top_k]
+                neighbour_scores = np.take_along_axis(
+                    scores, neighbours, axis=1)
+                created += len(RecipeSimilarity.objects.bulk_create(
+                    RecipeSimilarity(
+                        recipe_id=int(recipe_ids[start + row]),
+                        similar_id=int(recipe_ids[column]),
+                        score=float(score)
+                    )
+                    for row, column, score in zip(
+                        np.repeat(rows, top_k),
+                        neighbours.ravel(),
+                        neighbour_scores.ravel()
+                    )
+                    if score > 0
+                ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты рассчитаны. Добавлено {created}'))
@@ -0,0 +1,28 @@
+"""
+Команда для сжатия журнала изменений.
+
+Её удобно запускать по расписанию или фоновой задачей
+compact_sync_log.
+"""
+
+from django.core.management.base import BaseCommand
+
+from recipes.changelog import compact_changelog
+from recipes.constants import CHANGELOG_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    """Команда для сжатия журнала изменений."""
+
+    help = 'Удаление перекрытых и устаревших записей журнала изменений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int, default=CHANGELOG_RETENTION_DAYS,
+            help='Срок хранения записей журнала в днях'
+        )
+
+    def handle(self, *args, **options):
+        deleted = compact_changelog(options['retention_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Журнал изменений сжат. Удалено записей: {deleted}'))
@@ -0,0 +1,73 @@
+"""
+Команда для удаления неиспользуемых медиафайлов.
+
+Файлы хранятся по хэшу содержимого и могут принадлежать нескольким
+объектам, поэтому удаляются не вместе с объектами, а этой командой.
+"""
+
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.constants import MEDIA_GC_GRACE_HOURS
+from recipes.models import Recipe, User
+
+MEDIA_FIELDS = ((Recipe, 'image'), (User, 'avatar'))
+
+
+def walk(storage, directory):
+    """Перечисляет все файлы каталога хранилища рекурсивно."""
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    """Команда для удаления неиспользуемых медиафайлов."""
+
+    help = 'Удаление медиафайлов, на которые не ссылается ни один объект'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=MEDIA_GC_GRACE_HOURS,
+            help='Не удалять файлы моложе указанного числа часов'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать файлы, которые будут удалены'
+        )
+
+    def handle(self, *args, **options):
+        referenced = set()
+        directories = set()
+        for model, field_name in MEDIA_FIELDS:
+            directories.add(
+                model._meta.get_field(field_name).upload_to.rstrip('/'))
+            referenced.update(model._base_manager.exclude(
+                **{field_name: ''}
+            ).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list(field_name, flat=True))
+        threshold = timezone.now() - timedelta(hours=options['min_age'])
+        removed = 0
+        for directory in sorted(directories):
+            if not default_storage.exists(directory):
+                continue
+            for name in walk(default_storage, directory):
+                if (
+                    name in referenced
+                    or default_storage.get_modified_time(name) > threshold
+                ):
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    default_storage.delete(name)
+                removed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Неиспользуемых файлов: {removed}'))
@@ -0,0 +1,106 @@
+"""
+Команда для секционирования таблиц избранного и списков покупок.
+
+В PostgreSQL таблицы recipes_favorite и recipes_shoppingcart
+пересоздаются секционированными по хешу пользователя: запросы
+пользователя затрагивают одну небольшую секцию, а VACUUM обрабатывает
+секции по отдельности. Первичный ключ секционированной таблицы обязан
+включать ключ секционирования, поэтому он становится (id, user_id);
+идентификаторы по-прежнему уникальны, их выдаёт последовательность.
+Остальные ограничения и индексы переносятся с прежними именами, так
+что Django работает с таблицами как раньше. Повторный запуск ничего
+не меняет, в других СУБД команда ничего не делает.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from recipes.constants import USER_RECIPE_PARTITIONS
+from recipes.models import Favorite, ShoppingCart
+
+
+def is_partitioned(cursor, table):
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass',
+                   [table])
+    return cursor.fetchone()[0] == 'p'
+
+
+def partition_table(cursor, table, partitions):
+    """Пересоздаёт таблицу секционированной по хешу user_id."""
+    quote = connection.ops.quote_name
+    cursor.execute(f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE')
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) "
+        "FROM pg_constraint WHERE conrelid = %s::regclass ORDER BY contype",
+        [table]
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        'SELECT pg_get_indexdef(indexrelid) FROM pg_index '
+        'WHERE indrelid = %s::regclass AND indexrelid NOT IN '
+        '(SELECT conindid FROM pg_constraint WHERE conrelid = %s::regclass)',
+        [table, table]
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    old = quote(f'{table}_unpartitioned')
+    sequence = quote(f'{table}_id_seq')
+    cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {old}')
+    # Столбцы идентификации у секционированных таблиц появились
+    # только в PostgreSQL 17, поэтому id получает обычную последовательность.
+    cursor.execute(
+        f'CREATE TABLE {quote(table)} (LIKE {old} INCLUDING DEFAULTS '
+        f'INCLUDING STORAGE) PARTITION BY HASH (user_id)'
+    )
+    for remainder in range(partitions):
+        cursor.execute(
+            f'CREATE TABLE {quote(f"{table}_p{remainder}")} '
+            f'PARTITION OF {quote(table)} '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+        )
+    cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {old}')
+    cursor.execute(f'DROP TABLE {old}')
+    cursor.execute(
+        f'CREATE SEQUENCE {sequence} OWNED BY {quote(table)}.id')
+    cursor.execute(
+        f'SELECT setval(%s, COALESCE(MAX(id), 0) + 1, false) '
+        f'FROM {quote(table)}', [f'{table}_id_seq']
+    )
+    cursor.execute(
+        f'ALTER TABLE {quote(table)} ALTER COLUMN id '
+        f'SET DEFAULT nextval(%s::regclass)', [f'{table}_id_seq']
+    )
+    for name, kind, definition in constraints:
+        if kind == 'p':
+            definition = 'PRIMARY KEY (id, user_id)'
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} '
+            f'ADD CONSTRAINT {quote(name)} {definition}'
+        )
+    for definition in indexes:
+        cursor.execute(definition)
+
+
+class Command(BaseCommand):
+    """Команда для секционирования таблиц избранного и списков покупок."""
+
+    help = 'Секционирование таблиц избранного и списков покупок (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--partitions', type=int, default=USER_RECIPE_PARTITIONS,
+            help='Количество хеш-секций каждой таблицы'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write('Секционирование доступно только в PostgreSQL.')
+            return
+        for model in (Favorite, ShoppingCart):
+            table = model._meta.db_table
+            with transaction.atomic(), connection.cursor() as cursor:
+                if is_partitioned(cursor, table):
+                    self.stdout.write(f'{table}: уже секционирована.')
+                    continue
+                partition_table(cursor, table, options['partitions'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{table}: создано секций {options["partitions"]}.'))
@@ -0,0 +1,25 @@
+"""
+Команда для очистки удалённых пользователей и рецептов.
+
+Обычно очистку выполняют фоновые задачи purge_users и purge_recipes,
+команда нужна, если задачи были потеряны или исчерпали попытки.
+"""
+
+from django.core.management.base import BaseCommand
+
+from recipes.purge import purge_recipes, purge_users
+
+
+class Command(BaseCommand):
+    """Команда для очистки удалённых пользователей и рецептов."""
+
+    help = 'Удаление помеченных на удаление пользователей и рецептов'
+
+    def report(self, stage, done, total):
+        self.stdout.write(f'{stage}: {done}/{total}')
+
+    def handle(self, *args, **options):
+        deleted = (purge_users(report=self.report)
+                   + purge_recipes(report=self.report))
+        self.stdout.write(self.style.SUCCESS(
+            f'Очистка завершена. Удалено объектов: {deleted}'))
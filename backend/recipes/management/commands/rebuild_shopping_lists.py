@@ -0,0 +1,20 @@
+"""
+Команда для пересчёта списков покупок.
+
+Заполняет таблицу списков покупок после её создания и исправляет
+расхождения, если корзины менялись в обход приложения.
+"""
+
+from django.core.management.base import BaseCommand
+
+from recipes.shopping_list import refresh_shopping_lists
+
+
+class Command(BaseCommand):
+    """Команда для пересчёта списков покупок."""
+
+    help = 'Пересчёт списков покупок всех пользователей'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны. Строк: {refresh_shopping_lists()}'))
@@ -0,0 +1,47 @@
+"""
+Команда для запуска обработчика фоновых задач.
+
+Для параллельной обработки запускается несколько процессов,
+задачи между ними распределяются через SELECT ... FOR UPDATE SKIP LOCKED.
+Обработчик также ставит в очередь периодические задачи.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recipes.constants import TASK_SCHEDULE_INTERVAL
+from recipes.queue import claim_next, run_task, schedule_periodic
+
+
+class Command(BaseCommand):
+    """Команда для запуска обработчика фоновых задач."""
+
+    help = 'Запуск обработчика фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sleep', type=float, default=1,
+            help='Пауза между проверками пустой очереди, в секундах'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить задачи из очереди и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        next_schedule = 0
+        while True:
+            close_old_connections()
+            if time.monotonic() >= next_schedule:
+                schedule_periodic()
+                next_schedule = time.monotonic() + TASK_SCHEDULE_INTERVAL
+            task = claim_next()
+            if task is not None:
+                run_task(task)
+                self.stdout.write(f'{task}: попытка {task.attempts}')
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,20 @@
+"""
+Команда для инкрементального обновления популярности рецептов.
+
+Обработчик фоновых задач выполняет то же обновление периодически
+(задача recalculate_popularity), команда нужна для ручного запуска.
+"""
+
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import update_popularity
+
+
+class Command(BaseCommand):
+    """Команда для обновления популярности рецептов."""
+
+    help = 'Инкрементальное обновление популярности рецептов'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность обновлена. Учтено событий: {update_popularity()}'))
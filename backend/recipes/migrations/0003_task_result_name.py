@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_soft_delete_and_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='result_name',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Имя файла результата'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:10
+
+import math
+
+from django.db import migrations, models
+
+
+def scores_to_logs(apps, schema_editor):
+    RecipePopularity = apps.get_model('recipes', 'RecipePopularity')
+    RecipePopularity.objects.filter(log_score__lte=0).delete()
+    for popularity in RecipePopularity.objects.iterator():
+        popularity.log_score = math.log2(popularity.log_score)
+        popularity.save(update_fields=['log_score'])
+
+
+def logs_to_scores(apps, schema_editor):
+    RecipePopularity = apps.get_model('recipes', 'RecipePopularity')
+    for popularity in RecipePopularity.objects.iterator():
+        popularity.log_score = 2 ** popularity.log_score
+        popularity.save(update_fields=['log_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_task_result_name'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipepopularity',
+            name='popularity_score_idx',
+        ),
+        migrations.RenameField(
+            model_name='recipepopularity',
+            old_name='score',
+            new_name='log_score',
+        ),
+        migrations.AlterModelOptions(
+            name='recipepopularity',
+            options={'ordering': ('-log_score',), 'verbose_name': 'Популярность рецепта', 'verbose_name_plural': 'Популярность рецептов'},
+        ),
+        migrations.RunPython(scores_to_logs, logs_to_scores),
+        migrations.AlterField(
+            model_name='recipepopularity',
+            name='log_score',
+            field=models.FloatField(verbose_name='Логарифм оценки'),
+        ),
+        migrations.AddIndex(
+            model_name='recipepopularity',
+            index=models.Index(fields=['-log_score'], name='popularity_log_score_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_popularity_log_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='periodic',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Периодическая'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('periodic', True), ('status__in', ['pending', 'running'])), fields=('name',), name='unique_queued_periodic_task'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changelog',
+            name='object_id',
+            field=models.PositiveBigIntegerField(verbose_name='Объект'),
+        ),
+    ]
@@ -1,18 +1,41 @@
-from django.contrib.auth.models import AbstractUser
+import math
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import (
     MinValueValidator, RegexValidator)
-from django.db import models
+from django.db import connections, models, router
 from django.urls import reverse
+from django.utils import timezone as django_timezone
 
 from .constants import (
     TAG_NAME_MAX_LENGTH, INGREDIENT_NAME_MAX_LENGTH,
     INGREDIENT_UNIT_MAX_LENGTH, RECIPE_NAME_MAX_LENGTH,
     COOKING_TIME_MIN,
     AMOUNT_MIN,
-    EMAIL_MAX_LENGTH, FIO_MAX_FIELD_LENGTH
+    EMAIL_MAX_LENGTH, FIO_MAX_FIELD_LENGTH,
+    POPULARITY_HALF_LIFE_DAYS, SLOW_QUERY_ORIGIN_MAX_LENGTH,
+    TASK_MAX_ATTEMPTS, TASK_NAME_MAX_LENGTH, TASK_RESULT_NAME_MAX_LENGTH
 )
 
 
+class ActiveManagerMixin:
+    """Скрывает объекты, помеченные на удаление (deleted_at)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class ActiveManager(ActiveManagerMixin, models.Manager):
+    """Менеджер неудалённых объектов."""
+
+
+class ActiveUserManager(ActiveManagerMixin, UserManager):
+    """Менеджер неудалённых пользователей."""
+
+    use_in_migrations = False
+
+
 class User(AbstractUser):
     """Кастомный класс для модели User."""
 
@@ -38,6 +61,17 @@ class User(AbstractUser):
         null=True,
         verbose_name='Аватар'
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
+    # Пользователь скрыт сразу, а удаляется фоновой задачей purge_users.
+    deleted_at = models.DateTimeField(
+        verbose_name='Дата удаления', null=True, blank=True, editable=False
+    )
+
+    objects = ActiveUserManager()
+    all_objects = UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -122,6 +156,46 @@ class Ingredient(models.Model):
         return f'{self.name} ({self.measurement_unit})'
 
 
+def cooking_time_q(low, high):
+    """Условие попадания времени приготовления в интервал (low, high]."""
+    condition = models.Q()
+    if low is not None:
+        condition &= models.Q(cooking_time__gt=low)
+    if high is not None:
+        condition &= models.Q(cooking_time__lte=high)
+    return condition
+
+
+def delete_rows(model, **values):
+    """
+    Удаляет строки модели одним DELETE, не загружая объекты. Условия
+    задаются списками значений полей: delete_rows(Model, user=[1],
+    recipe=[2, 3]). Сигналы не отправляются и каскад не выполняется:
+    подходит для моделей, на которые не ссылаются другие таблицы, а
+    зависящие данные (списки покупок, журнал) вызывающий код обновляет
+    сам. Возвращает число удалённых строк.
+    """
+    values = {field: list(field_values)
+              for field, field_values in values.items()}
+    # Пустой список значений или отсутствие условий ничего не удаляют.
+    if not values or not all(values.values()):
+        return 0
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    conditions = ' AND '.join(
+        f'{quote(model._meta.get_field(field).column)} '
+        f'IN ({", ".join(["%s"] * len(field_values))})'
+        for field, field_values in values.items()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {conditions}',
+            [value for field_values in values.values()
+             for value in field_values]
+        )
+        return cursor.rowcount
+
+
 class Recipe(models.Model):
     """Модель для рецептов."""
 
@@ -159,6 +233,23 @@ class Recipe(models.Model):
         auto_now_add=True,
         editable=False
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+    # Счётчик поддерживают сигналы избранного, по нему сортирует
+    # ordering=popularity.
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном', default=0, editable=False
+    )
+    # Рецепт скрыт сразу, а удаляется фоновой задачей purge_recipes.
+    deleted_at = models.DateTimeField(
+        verbose_name='Дата удаления', null=True, blank=True, editable=False
+    )
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
 
     def get_absolute_url(self):
         """Возвращает полный URL для просмотра рецепта."""
@@ -169,6 +260,24 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(
+                fields=['author', '-created_at'],
+                name='recipe_author_created_idx'
+            ),
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='recipe_created_idx'
+            ),
+            models.Index(
+                fields=['cooking_time', '-created_at'],
+                name='recipe_cooking_time_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -207,6 +316,11 @@ class BaseUserRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         abstract = True
@@ -240,3 +354,311 @@ class Favorite(BaseUserRecipe):
 
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+
+
+class ArchivedShoppingCart(models.Model):
+    """
+    Модель рецепта из заброшенного списка покупок.
+    Строки переносятся из ShoppingCart архивацией, чтобы рабочая
+    таблица содержала только активные списки.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='archived_carts',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='archived_carts',
+        verbose_name='Рецепт'
+    )
+    created_at = models.DateTimeField(verbose_name='Дата добавления')
+    archived_at = models.DateTimeField(
+        verbose_name='Дата архивации', auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = 'Архивный список покупок'
+        verbose_name_plural = 'Архивные списки покупок'
+
+    def __str__(self):
+        return f'{self.user} добавил {self.recipe} в архивный список покупок'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель продукта в списке покупок пользователя.
+    Хранит суммарное количество продукта по всем рецептам из списка
+    покупок, чтобы выгрузка списка не требовала агрегации.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items', verbose_name='Продукт'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Продукт списка покупок'
+        verbose_name_plural = 'Продукты списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} для {self.user}'
+
+
+class RecipeSimilarity(models.Model):
+    """Модель похожих рецептов, рассчитанных заранее."""
+
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='similarities',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Оценка')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', '-score')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_recipe_similarity'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similarity_recipe_score_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} похож на {self.similar}'
+
+
+class RecipePopularity(models.Model):
+    """
+    Модель популярности рецептов.
+    Каждое добавление в избранное или список покупок увеличивает оценку
+    на вес события, умноженный на 2 в степени числа периодов полураспада
+    от EPOCH до события. Поэтому сортировка по оценке совпадает
+    с сортировкой по оценке, затухающей со временем, и хранимые значения
+    не нужно пересчитывать. Оценка растёт экспоненциально, поэтому
+    хранится её двоичный логарифм: он растёт линейно и не переполняется.
+    """
+
+    EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, primary_key=True,
+        related_name='popularity', verbose_name='Рецепт'
+    )
+    log_score = models.FloatField(verbose_name='Логарифм оценки')
+    updated_at = models.DateTimeField(verbose_name='Учтены события до')
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        ordering = ('-log_score',)
+        indexes = [
+            models.Index(
+                fields=['-log_score'], name='popularity_log_score_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe}: {self.log_score}'
+
+    @classmethod
+    def half_lives(cls, moment):
+        """Число периодов полураспада от EPOCH до момента."""
+        return ((moment - cls.EPOCH).total_seconds()
+                / (POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60))
+
+    @classmethod
+    def log_weight(cls, weight, moment):
+        """Логарифм вклада события с весом weight в оценку."""
+        return math.log2(weight) + cls.half_lives(moment)
+
+    def decayed_score(self, moment):
+        """Оценка, приведённая к указанному моменту времени."""
+        return 2 ** (self.log_score - self.half_lives(moment))
+
+
+class Task(models.Model):
+    """Модель фоновой задачи."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Выполнена'
+        FAILED = 'failed', 'Ошибка'
+
+    name = models.CharField(
+        verbose_name='Задача', max_length=TASK_NAME_MAX_LENGTH
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='tasks', verbose_name='Пользователь'
+    )
+    payload = models.JSONField(verbose_name='Параметры', default=dict)
+    status = models.CharField(
+        verbose_name='Статус', max_length=16,
+        choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток', default=0
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        verbose_name='Максимум попыток', default=TASK_MAX_ATTEMPTS
+    )
+    # Периодическая задача после выполнения ставится в очередь снова.
+    periodic = models.BooleanField(
+        verbose_name='Периодическая', default=False, editable=False
+    )
+    run_after = models.DateTimeField(
+        verbose_name='Запустить после', default=django_timezone.now
+    )
+    progress = models.JSONField(
+        verbose_name='Прогресс', default=dict, blank=True
+    )
+    result = models.TextField(verbose_name='Результат', blank=True)
+    # Имя файла, если результат отдаётся для скачивания.
+    result_name = models.CharField(
+        verbose_name='Имя файла результата',
+        max_length=TASK_RESULT_NAME_MAX_LENGTH, blank=True
+    )
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания', auto_now_add=True
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения', auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(
+                fields=['status', 'run_after'], name='task_queue_idx'
+            )
+        ]
+        constraints = [
+            # В очереди не больше одного запуска периодической задачи.
+            models.UniqueConstraint(
+                fields=['name'],
+                condition=models.Q(periodic=True, status__in=[
+                    'pending', 'running']),
+                name='unique_queued_periodic_task'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
+
+
+class ChangeLog(models.Model):
+    """
+    Модель журнала изменений для синхронизации клиентов.
+    Идентификатор записи служит курсором синхронизации.
+    Пользователь записи - автор рецепта или владелец избранного,
+    списка покупок и подписки. Записи переживают удаление
+    пользователя, чтобы подписчики узнали об удалении его рецептов.
+    """
+
+    class Kind(models.TextChoices):
+        RECIPE = 'recipe', 'Рецепт'
+        FAVORITE = 'favorite', 'Избранное'
+        SHOPPING_CART = 'shopping_cart', 'Список покупок'
+        SUBSCRIPTION = 'subscription', 'Подписка'
+        # Граница сжатого журнала: более ранние записи удалены
+        HORIZON = 'horizon', 'Граница журнала'
+
+    class Action(models.TextChoices):
+        UPSERT = 'upsert', 'Добавление или изменение'
+        DELETE = 'delete', 'Удаление'
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+',
+        verbose_name='Пользователь'
+    )
+    kind = models.CharField(
+        verbose_name='Тип объекта', max_length=16, choices=Kind.choices
+    )
+    object_id = models.PositiveBigIntegerField(verbose_name='Объект')
+    action = models.CharField(
+        verbose_name='Действие', max_length=8, choices=Action.choices
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата изменения', auto_now_add=True, db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Запись журнала изменений'
+        verbose_name_plural = 'Журнал изменений'
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['user', 'id'], name='changelog_user_idx'),
+            models.Index(
+                fields=['user', 'kind', 'object_id'],
+                name='changelog_object_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return (f'{self.get_kind_display()} {self.object_id}: '
+                f'{self.get_action_display()}')
+
+
+class SlowQuery(models.Model):
+    """
+    Модель медленного SQL-запроса.
+    Запросы, отличающиеся только значениями параметров, объединяются
+    в одну запись по отпечатку нормализованного текста.
+    """
+
+    fingerprint = models.CharField(
+        verbose_name='Отпечаток', max_length=40, unique=True
+    )
+    sql = models.TextField(verbose_name='Нормализованный запрос')
+    example = models.TextField(verbose_name='Пример запроса')
+    params = models.TextField(verbose_name='Параметры примера', blank=True)
+    origin = models.CharField(
+        verbose_name='Источник', max_length=SLOW_QUERY_ORIGIN_MAX_LENGTH
+    )
+    stack = models.TextField(verbose_name='Стек вызовов', blank=True)
+    plan = models.TextField(verbose_name='План выполнения', blank=True)
+    count = models.PositiveIntegerField(verbose_name='Количество', default=1)
+    total_time = models.FloatField(verbose_name='Общее время, мс')
+    max_time = models.FloatField(verbose_name='Наибольшее время, мс')
+    first_seen = models.DateTimeField(
+        verbose_name='Впервые', auto_now_add=True
+    )
+    last_seen = models.DateTimeField(
+        verbose_name='Последний раз', default=django_timezone.now
+    )
+
+    class Meta:
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+        ordering = ('-total_time',)
+
+    def __str__(self):
+        return self.sql[:100]
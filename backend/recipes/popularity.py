@@ -0,0 +1,75 @@
+"""
+Инкрементальное обновление популярности рецептов.
+
+Учитываются только добавления в избранное и список покупок, сделанные
+после предыдущего обновления. Здесь же меняются счётчики избранного,
+по которым рецепты сортируются в выдаче.
+"""
+
+import math
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .constants import (
+    POPULARITY_FAVORITE_WEIGHT, POPULARITY_LAG_SECONDS,
+    POPULARITY_SHOPPING_CART_WEIGHT
+)
+from .models import Favorite, Recipe, RecipePopularity, ShoppingCart
+
+
+def add_log2(first, second):
+    """Возвращает log2(2 ** first + 2 ** second) без возведения в степень."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def update_popularity():
+    """Добавляет к оценкам рецептов новые события, возвращает их число."""
+    since = RecipePopularity.objects.aggregate(
+        Max('updated_at'))['updated_at__max'] or RecipePopularity.EPOCH
+    until = timezone.now() - timedelta(seconds=POPULARITY_LAG_SECONDS)
+    if until <= since:
+        return 0
+    # Логарифмы прибавок к оценкам рецептов.
+    increments = {}
+    events = 0
+    for model, weight in (
+        (Favorite, POPULARITY_FAVORITE_WEIGHT),
+        (ShoppingCart, POPULARITY_SHOPPING_CART_WEIGHT),
+    ):
+        for recipe_id, created_at in model.objects.filter(
+            created_at__gt=since, created_at__lte=until
+        ).values_list('recipe_id', 'created_at').iterator():
+            increments[recipe_id] = add_log2(
+                increments.get(recipe_id, -math.inf),
+                RecipePopularity.log_weight(weight, created_at))
+            events += 1
+    if not increments:
+        return 0
+    with transaction.atomic():
+        scores = dict(RecipePopularity.objects.filter(
+            recipe_id__in=increments
+        ).values_list('recipe_id', 'log_score'))
+        RecipePopularity.objects.bulk_create(
+            [RecipePopularity(
+                recipe_id=recipe_id,
+                log_score=add_log2(
+                    scores.get(recipe_id, -math.inf), increment),
+                updated_at=until
+            ) for recipe_id, increment in increments.items()],
+            update_conflicts=True,
+            unique_fields=['recipe'],
+            update_fields=['log_score', 'updated_at'],
+            batch_size=1000
+        )
+    return events
+
+
+def change_favorites_count(recipe_ids, delta):
+    """Изменяет счётчики избранного у рецептов одним запросом."""
+    Recipe.all_objects.filter(id__in=recipe_ids).update(
+        favorites_count=Greatest(F('favorites_count') + delta, 0))
@@ -0,0 +1,185 @@
+"""
+Мягкое удаление пользователей и рецептов с фоновой очисткой.
+
+Удаление через API или админку только помечает объекты (deleted_at):
+менеджеры по умолчанию сразу перестают их возвращать, а токены
+удалённых пользователей отзываются. Связанные объекты удаляет фоновая
+задача небольшими пачками, каждая в своей транзакции, чтобы не
+блокировать надолго популярные таблицы. Ход очистки сохраняется
+в прогрессе задачи. Изображения удаляются, если на них больше не
+ссылается ни один объект и они не загружались повторно в течение
+MEDIA_GC_GRACE_HOURS: хранилище адресует файлы по содержимому.
+"""
+
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .changelog import log_changes
+from .constants import MEDIA_GC_GRACE_HOURS, PURGE_BATCH_SIZE
+from .feed import invalidate_feeds
+from .ingredient_index import invalidate_ingredient_index
+from .models import (
+    ArchivedShoppingCart, ChangeLog, Favorite, Recipe, RecipeSimilarity,
+    ShoppingCart, ShoppingListItem, Subscription, User
+)
+from .queue import enqueue
+from .shopping_list import refresh_recipes_in_shopping_lists
+
+MEDIA_FIELDS = ((Recipe, 'image'), (User, 'avatar'))
+
+
+def soft_delete_recipes(recipes, purge=True):
+    """
+    Скрывает рецепты и ставит их очистку в очередь.
+    Возвращает задачу очистки или None, если удалять нечего.
+    """
+    rows = list(recipes.values_list('id', 'author_id'))
+    if not rows:
+        return None
+    recipe_ids = [recipe_id for recipe_id, _ in rows]
+    authors = {}
+    for recipe_id, author_id in rows:
+        authors.setdefault(author_id, []).append(recipe_id)
+    with transaction.atomic():
+        Recipe.all_objects.filter(id__in=recipe_ids).update(
+            deleted_at=timezone.now())
+        # Корзины очищает фоновая задача, а списки покупок
+        # пересчитываются сразу.
+        refresh_recipes_in_shopping_lists(recipe_ids)
+        for author_id, author_recipe_ids in authors.items():
+            log_changes(ChangeLog.Kind.RECIPE, author_id, author_recipe_ids,
+                        ChangeLog.Action.DELETE)
+        invalidate_feeds(Subscription.objects.filter(
+            author_id__in=authors).values_list('subscriber_id', flat=True))
+        transaction.on_commit(invalidate_ingredient_index)
+        if purge:
+            return enqueue('purge_recipes', recipe_ids=recipe_ids)
+    return None
+
+
+def soft_delete_users(users):
+    """
+    Скрывает пользователей вместе с их рецептами, отзывает токены
+    и ставит очистку в очередь. Возвращает задачу очистки или None.
+    """
+    user_ids = list(users.values_list('id', flat=True))
+    if not user_ids:
+        return None
+    with transaction.atomic():
+        User.all_objects.filter(id__in=user_ids).update(
+            deleted_at=timezone.now(), is_active=False)
+        # Рецепты очищает задача пользователей.
+        soft_delete_recipes(
+            Recipe.objects.filter(author_id__in=user_ids), purge=False)
+        Token.objects.filter(user_id__in=user_ids).delete()
+        return enqueue('purge_users', user_ids=user_ids)
+
+
+def media_files(model, field_name, queryset):
+    """Имена файлов, на которые ссылаются объекты."""
+    return set(queryset.exclude(**{field_name: ''}).exclude(
+        **{f'{field_name}__isnull': True}
+    ).values_list(field_name, flat=True))
+
+
+def delete_unused_files(names):
+    """
+    Удаляет файлы, на которые больше не ссылается ни один объект.
+    Недавно сохранённые файлы пропускаются: их могла повторно загрузить
+    транзакция, ещё не сохранившая ссылку. Их удалит команда gc_media.
+    """
+    used = set()
+    for model, field_name in MEDIA_FIELDS:
+        used |= media_files(model, field_name, model._base_manager.filter(
+            **{f'{field_name}__in': names}))
+    threshold = timezone.now() - timedelta(hours=MEDIA_GC_GRACE_HOURS)
+    deleted = 0
+    for name in set(names) - used:
+        try:
+            if default_storage.get_modified_time(name) > threshold:
+                continue
+        except FileNotFoundError:
+            continue
+        default_storage.delete(name)
+        deleted += 1
+    return deleted
+
+
+def run_stages(stages, report=None):
+    """
+    Удаляет объекты наборов запросов пачками по PURGE_BATCH_SIZE
+    и сообщает о ходе работы, возвращает число удалённых объектов.
+    """
+    total = sum(queryset.count() for _, queryset in stages)
+    done = 0
+    for stage, queryset in stages:
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[
+                :PURGE_BATCH_SIZE])
+            if not pks:
+                break
+            with transaction.atomic():
+                queryset.model._base_manager.filter(pk__in=pks).delete()
+            done += len(pks)
+            if report is not None:
+                report(stage=stage, done=done, total=total)
+    return done
+
+
+def recipe_stages(recipes):
+    """Этапы очистки рецептов: крупные связи удаляются до самих рецептов."""
+    return (
+        ('favorites', Favorite.objects.filter(recipe__in=recipes)),
+        ('shopping_carts', ShoppingCart.objects.filter(recipe__in=recipes)),
+        ('archived_carts', ArchivedShoppingCart.objects.filter(
+            recipe__in=recipes)),
+        ('similar_recipes', RecipeSimilarity.objects.filter(
+            Q(recipe__in=recipes) | Q(similar__in=recipes))),
+        ('recipes', recipes),
+    )
+
+
+def purge_recipes(recipe_ids=None, report=None):
+    """
+    Удаляет помеченные рецепты и их связи. Без recipe_ids
+    очищаются все помеченные рецепты.
+    """
+    recipes = Recipe.all_objects.filter(deleted_at__isnull=False)
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    files = media_files(Recipe, 'image', recipes)
+    deleted = run_stages(recipe_stages(recipes), report)
+    delete_unused_files(files)
+    return deleted
+
+
+def purge_users(user_ids=None, report=None):
+    """
+    Удаляет помеченных пользователей, их рецепты и связи. Без user_ids
+    очищаются все помеченные пользователи.
+    """
+    users = User.all_objects.filter(deleted_at__isnull=False)
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+    recipes = Recipe.all_objects.filter(author__in=users)
+    files = (media_files(Recipe, 'image', recipes)
+             | media_files(User, 'avatar', users))
+    deleted = run_stages((
+        *recipe_stages(recipes),
+        ('user_favorites', Favorite.objects.filter(user__in=users)),
+        ('user_shopping_carts', ShoppingCart.objects.filter(user__in=users)),
+        ('user_archived_carts', ArchivedShoppingCart.objects.filter(
+            user__in=users)),
+        ('user_shopping_lists', ShoppingListItem.objects.filter(
+            user__in=users)),
+        ('subscriptions', Subscription.objects.filter(
+            Q(subscriber__in=users) | Q(author__in=users))),
+        ('users', users),
+    ), report)
+    delete_unused_files(files)
+    return deleted
@@ -0,0 +1,132 @@
+"""
+Очередь фоновых задач в базе данных.
+
+Обработчики регистрируются декоратором task в модулях tasks.py
+приложений и получают объект задачи и её параметры. Строка, которую
+вернул обработчик, сохраняется как результат задачи. Если обработчик
+вернул ContentFile, вместе с содержимым сохраняется имя файла, и
+результат можно скачать. При ошибке задача повторяется с растущей
+задержкой, пока не исчерпаны попытки.
+Долгие обработчики сообщают о ходе работы через report_progress.
+Задачи выполняет команда run_worker, процессов может быть несколько.
+
+Задача, зарегистрированная с интервалом (task(every=...)), периодическая:
+обработчики ставят её в очередь при запуске и проверяют её наличие
+раз в TASK_SCHEDULE_INTERVAL секунд, а выполненная задача ставится
+снова через свой интервал. Условный уникальный индекс не даёт
+поставить второй запуск, пока первый ждёт или выполняется.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .constants import TASK_RETRY_DELAY, TASK_TIMEOUT, TASK_TIMEOUT_ERROR
+from .models import Task
+from .slow_queries import capture_slow_queries
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+# Интервалы периодических задач в секундах по имени задачи
+schedule = {}
+
+
+def task(func=None, *, every=None):
+    """
+    Регистрирует функцию как обработчик фоновой задачи.
+    С интервалом every (в секундах) задача выполняется периодически.
+    """
+    if func is None:
+        return partial(task, every=every)
+    registry[func.__name__] = func
+    if every is not None:
+        schedule[func.__name__] = every
+    return func
+
+
+def enqueue(name, user=None, **payload):
+    """Ставит задачу в очередь."""
+    if name not in registry:
+        raise KeyError(f'Неизвестная задача: {name}')
+    return Task.objects.create(name=name, user=user, payload=payload)
+
+
+def schedule_periodic(names=None, wait=False):
+    """
+    Ставит в очередь периодические задачи, которые ещё не ждут запуска
+    и не выполняются. С wait=True запуск откладывается на интервал
+    задачи. Без names проверяются все периодические задачи.
+    """
+    now = timezone.now()
+    Task.objects.bulk_create([
+        Task(name=name, periodic=True, run_after=now + timedelta(
+            seconds=schedule[name] if wait else 0))
+        for name in (schedule if names is None else names)
+    ], ignore_conflicts=True)
+
+
+def report_progress(task, **progress):
+    """
+    Сохраняет прогресс задачи. Заодно обновляет время изменения,
+    чтобы долгая задача не считалась зависшей.
+    """
+    task.progress = progress
+    task.save(update_fields=['progress', 'updated_at'])
+
+
+def claim_next():
+    """
+    Забирает следующую задачу из очереди.
+    Зависшие задачи упавших обработчиков возвращаются в работу,
+    пока у них остаются попытки, иначе отмечаются упавшими.
+    """
+    now = timezone.now()
+    stale = Q(status=Task.Status.RUNNING,
+              updated_at__lt=now - timedelta(seconds=TASK_TIMEOUT))
+    Task.objects.filter(stale, attempts__gte=F('max_attempts')).update(
+        status=Task.Status.FAILED, error=TASK_TIMEOUT_ERROR, updated_at=now)
+    with transaction.atomic():
+        task = Task.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Task.Status.PENDING, run_after__lte=now)
+            | stale & Q(attempts__lt=F('max_attempts'))
+        ).order_by('run_after', 'id').first()
+        if task is None:
+            return None
+        task.status = Task.Status.RUNNING
+        task.attempts += 1
+        task.save(update_fields=['status', 'attempts', 'updated_at'])
+    return task
+
+
+def run_task(task):
+    """Выполняет задачу и сохраняет результат или ошибку."""
+    try:
+        with capture_slow_queries(f'task {task.name}'):
+            result = registry[task.name](task, **task.payload)
+    except Exception:
+        logger.exception('Ошибка фоновой задачи %s', task.pk)
+        task.error = traceback.format_exc()
+        if task.attempts < task.max_attempts:
+            task.status = Task.Status.PENDING
+            task.run_after = timezone.now() + timedelta(
+                seconds=TASK_RETRY_DELAY * 2 ** (task.attempts - 1))
+        else:
+            task.status = Task.Status.FAILED
+    else:
+        task.status = Task.Status.DONE
+        if isinstance(result, ContentFile):
+            task.result_name = result.name
+            result = result.read()
+        task.result = result or ''
+        task.error = ''
+    task.save()
+    if task.periodic and task.status != Task.Status.PENDING:
+        schedule_periodic([task.name], wait=True)
+    return task
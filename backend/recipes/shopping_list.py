@@ -0,0 +1,192 @@
+"""
+Список покупок, хранимый в готовом виде.
+
+Таблица ShoppingListItem содержит для каждого пользователя суммарное
+количество продуктов по рецептам из его списка покупок. При добавлении
+и удалении рецепта количества меняются на вклад этого рецепта, при
+изменении продуктов рецепта пересчитываются только затронутые строки
+пользователей, добавивших рецепт. Удалённые рецепты перестают
+учитываться сразу, ещё до очистки их строк в корзинах. Выгрузка списка
+читает таблицу по индексу без агрегации.
+
+Очистка списка покупок и архивация заброшенных списков удаляют строки
+ShoppingCart одним запросом без сигналов, поэтому журнал изменений
+и готовый список покупок обновляются здесь же.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Max, Sum, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .changelog import log_changes
+from .constants import (
+    SHOPPING_CART_ARCHIVE_BATCH_SIZE, SHOPPING_CART_ARCHIVE_DAYS
+)
+from .models import (
+    ArchivedShoppingCart, ChangeLog, RecipeIngredients, ShoppingCart,
+    ShoppingListItem, User, delete_rows
+)
+
+
+def lock_users(user_ids):
+    """Блокирует пользователей, упорядочивая изменения их списков."""
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids).values_list('pk', flat=True))
+
+
+def recipes_amounts(recipe_ids):
+    """
+    Возвращает суммарное количество продуктов в рецептах.
+    Вклад удалённых рецептов вычитается при их удалении,
+    поэтому они не учитываются.
+    """
+    return dict(RecipeIngredients.objects.filter(
+        recipe_id__in=recipe_ids, recipe__deleted_at__isnull=True
+    ).values_list('ingredient_id').annotate(total=Sum('amount')).order_by())
+
+
+def change_shopping_list(user_id, recipe_ids, sign):
+    """Прибавляет (sign=1) или вычитает (sign=-1) продукты рецептов."""
+    amounts = recipes_amounts(recipe_ids)
+    if not amounts:
+        return
+    with transaction.atomic():
+        lock_users([user_id])
+        items = ShoppingListItem.objects.filter(user_id=user_id)
+        existing = set(items.filter(
+            ingredient_id__in=amounts).values_list('ingredient_id', flat=True))
+        if existing:
+            items.filter(ingredient_id__in=existing).update(amount=Greatest(
+                Case(*(When(ingredient_id=pk,
+                            then=F('amount') + sign * amounts[pk])
+                       for pk in existing)),
+                0
+            ))
+        if sign > 0:
+            ShoppingListItem.objects.bulk_create(
+                ShoppingListItem(user_id=user_id, ingredient_id=pk,
+                                 amount=amount)
+                for pk, amount in amounts.items() if pk not in existing
+            )
+        else:
+            items.filter(amount=0).delete()
+
+
+def add_to_shopping_list(user_id, recipe_ids):
+    """Добавляет продукты рецептов в список покупок пользователя."""
+    change_shopping_list(user_id, recipe_ids, 1)
+
+
+def remove_from_shopping_list(user_id, recipe_ids):
+    """Вычитает продукты рецептов из списка покупок пользователя."""
+    change_shopping_list(user_id, recipe_ids, -1)
+
+
+def refresh_shopping_lists(user_ids=None, ingredient_ids=None):
+    """
+    Пересчитывает списки покупок по рецептам из корзин.
+    Пересчёт можно ограничить пользователями и продуктами,
+    без аргументов пересчитываются все списки.
+    """
+    items = ShoppingListItem.objects.all()
+    # Условие на корзины задаётся одним фильтром, чтобы values_list
+    # использовал то же соединение, а не добавлял новое.
+    carts = {'recipe__shoppingcarts__isnull': False}
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+        carts = {'recipe__shoppingcarts__user_id__in': user_ids}
+    sources = RecipeIngredients.objects.filter(
+        recipe__deleted_at__isnull=True, **carts)
+    if ingredient_ids is not None:
+        items = items.filter(ingredient_id__in=ingredient_ids)
+        sources = sources.filter(ingredient_id__in=ingredient_ids)
+    totals = sources.values_list(
+        'recipe__shoppingcarts__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    with transaction.atomic():
+        items.delete()
+        return len(ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                              amount=amount)
+             for user_id, ingredient_id, amount in totals),
+            batch_size=1000
+        ))
+
+
+def refresh_recipe_in_shopping_lists(recipe_id, ingredient_ids=None):
+    """Пересчитывает списки покупок, в которые добавлен рецепт."""
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+    if user_ids:
+        refresh_shopping_lists(user_ids, ingredient_ids)
+
+
+def refresh_recipes_in_shopping_lists(recipe_ids):
+    """Пересчитывает продукты рецептов в списках, куда они добавлены."""
+    user_ids = set(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids).values_list('user_id', flat=True))
+    if user_ids:
+        refresh_shopping_lists(user_ids, set(RecipeIngredients.objects.filter(
+            recipe_id__in=recipe_ids).values_list('ingredient_id', flat=True)))
+
+
+def delete_shopping_carts(user_ids):
+    """
+    Удаляет списки покупок пользователей одним запросом и возвращает
+    удалённые строки. Вызывается в транзакции.
+    """
+    lock_users(user_ids)
+    carts = ShoppingCart.objects.filter(user_id__in=user_ids)
+    rows = list(carts.values_list('user_id', 'recipe_id', 'created_at'))
+    if not rows:
+        return rows
+    delete_rows(ShoppingCart, user=user_ids)
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    removed = {}
+    for user_id, recipe_id, _ in rows:
+        removed.setdefault(user_id, []).append(recipe_id)
+    for user_id, recipe_ids in removed.items():
+        log_changes(ChangeLog.Kind.SHOPPING_CART, user_id, recipe_ids,
+                    ChangeLog.Action.DELETE)
+    return rows
+
+
+def clear_shopping_cart(user_id):
+    """Очищает список покупок пользователя, возвращает число рецептов."""
+    with transaction.atomic():
+        return len(delete_shopping_carts([user_id]))
+
+
+def archive_stale_shopping_carts(stale_days=SHOPPING_CART_ARCHIVE_DAYS,
+                                 batch_size=SHOPPING_CART_ARCHIVE_BATCH_SIZE):
+    """
+    Переносит в архив списки покупок, в которые ничего не добавлялось
+    stale_days дней, и возвращает число перенесённых строк.
+    """
+    cutoff = timezone.now() - timedelta(days=stale_days)
+    archived = 0
+    while True:
+        user_ids = list(ShoppingCart.objects.values('user_id').annotate(
+            last_added=Max('created_at')
+        ).filter(last_added__lt=cutoff).order_by('user_id').values_list(
+            'user_id', flat=True)[:batch_size])
+        if not user_ids:
+            return archived
+        with transaction.atomic():
+            # Добавление после выборки делает список снова активным.
+            lock_users(user_ids)
+            active = set(ShoppingCart.objects.filter(
+                user_id__in=user_ids, created_at__gte=cutoff
+            ).values_list('user_id', flat=True))
+            rows = delete_shopping_carts(
+                [pk for pk in user_ids if pk not in active])
+            ArchivedShoppingCart.objects.bulk_create(
+                (ArchivedShoppingCart(user_id=user_id, recipe_id=recipe_id,
+                                      created_at=created_at)
+                 for user_id, recipe_id, created_at in rows),
+                batch_size=1000
+            )
+        archived += len(rows)
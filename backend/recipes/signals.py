@@ -0,0 +1,138 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .changelog import log_changes, log_recipe, log_relation, recipe_author
+from .events import publish_recipe
+from .feed import invalidate_feeds, push_recipe
+from .ingredient_index import invalidate_ingredient_index
+from .models import (
+    ChangeLog, Favorite, Recipe, RecipeIngredients, ShoppingCart, Subscription
+)
+from .popularity import change_favorites_count
+from .shopping_list import (
+    add_to_shopping_list, refresh_recipe_in_shopping_lists,
+    refresh_shopping_lists, remove_from_shopping_list
+)
+
+
+def deleted_directly(origin, model):
+    """Проверяет, что удаление начато с самой модели, а не каскадом."""
+    return getattr(origin, 'model', type(origin)) is model
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    """
+    Добавляет опубликованный рецепт в ленты подписчиков, оповещает их
+    после фиксации транзакции и записывает изменение в журнал.
+    """
+    if created:
+        push_recipe(instance)
+        transaction.on_commit(lambda: publish_recipe(instance))
+    log_recipe(instance)
+    # Продукты рецепта сохраняются через bulk_create без сигналов.
+    transaction.on_commit(invalidate_ingredient_index)
+
+
+@receiver(post_save, sender=RecipeIngredients)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    """
+    Отмечает индекс продуктов устаревшим и пересчитывает списки покупок.
+    Продукт строки мог смениться, поэтому списки пересчитываются целиком.
+    """
+    transaction.on_commit(invalidate_ingredient_index)
+    refresh_recipe_in_shopping_lists(instance.recipe_id)
+    log_changes(ChangeLog.Kind.RECIPE, recipe_author(instance.recipe_id),
+                [instance.recipe_id])
+
+
+@receiver(post_delete, sender=RecipeIngredients)
+def recipe_ingredient_deleted(sender, instance, origin, **kwargs):
+    """Отмечает индекс продуктов устаревшим и пересчитывает списки покупок."""
+    transaction.on_commit(invalidate_ingredient_index)
+    # При удалении рецепта списки пересчитывает recipe_deleted.
+    if deleted_directly(origin, RecipeIngredients):
+        refresh_recipe_in_shopping_lists(
+            instance.recipe_id, [instance.ingredient_id])
+        log_changes(ChangeLog.Kind.RECIPE,
+                    recipe_author(instance.recipe_id), [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """Запоминает списки покупок, в которые добавлен удаляемый рецепт."""
+    instance.shopping_list_users = list(
+        instance.shoppingcarts.values_list('user_id', flat=True))
+    instance.shopping_list_ingredients = list(
+        instance.recipe_ingredients.values_list('ingredient_id', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """
+    Сбрасывает ленты подписчиков автора удалённого рецепта, записывает
+    удаление в журнал и пересчитывает списки покупок с этим рецептом.
+    """
+    invalidate_feeds(Subscription.objects.filter(
+        author_id=instance.author_id
+    ).values_list('subscriber_id', flat=True))
+    log_recipe(instance, ChangeLog.Action.DELETE)
+    if instance.shopping_list_users:
+        refresh_shopping_lists(
+            instance.shopping_list_users, instance.shopping_list_ingredients)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(sender, instance, created, **kwargs):
+    """Добавляет продукты рецепта в список покупок."""
+    if created:
+        add_to_shopping_list(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, origin, **kwargs):
+    """Вычитает продукты рецепта из списка покупок."""
+    # При удалении рецепта списки пересчитывает recipe_deleted,
+    # список удалённого пользователя удаляется вместе с ним.
+    if deleted_directly(origin, ShoppingCart):
+        remove_from_shopping_list(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    """Увеличивает счётчик избранного у рецепта."""
+    if created:
+        change_favorites_count([instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, origin, **kwargs):
+    """Уменьшает счётчик избранного у рецепта."""
+    # Счётчик удаляемого рецепта обновлять незачем.
+    if not deleted_directly(origin, Recipe):
+        change_favorites_count([instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    """Сбрасывает ленту подписчика при изменении его подписок."""
+    invalidate_feeds([instance.subscriber_id])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+def user_relation_saved(sender, instance, created, **kwargs):
+    """Записывает в журнал добавление в избранное, покупки или подписки."""
+    if created:
+        log_relation(instance, ChangeLog.Action.UPSERT)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def user_relation_deleted(sender, instance, **kwargs):
+    """Записывает в журнал удаление из избранного, покупок или подписок."""
+    log_relation(instance, ChangeLog.Action.DELETE)
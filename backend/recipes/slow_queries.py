@@ -0,0 +1,158 @@
+"""
+Запись медленных SQL-запросов.
+
+capture_slow_queries подключает ко всем соединениям обёртку, которая
+замеряет время запросов и запоминает те, что выполнялись дольше
+SLOW_QUERY_THRESHOLD_MS, вместе с источником (вьюсет и действие или
+фоновая задача) и кадрами стека кода проекта. После выхода из блока
+запросы сохраняются в SlowQuery с объединением по отпечатку
+нормализованного текста. План выполнения (EXPLAIN (ANALYZE, BUFFERS)
+в PostgreSQL, EXPLAIN QUERY PLAN в SQLite) снимается для нового
+отпечатка и когда запрос стал медленнее прежнего максимума.
+"""
+
+import hashlib
+import logging
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .constants import SLOW_QUERY_ORIGIN_MAX_LENGTH, SLOW_QUERY_STACK_DEPTH
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+NORMALIZE_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    # Списки IN разной длины дают один отпечаток.
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def fingerprint(sql):
+    """Возвращает нормализованный текст запроса и его отпечаток."""
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    sql = sql.strip()
+    return sql, hashlib.sha1(sql.encode()).hexdigest()
+
+
+def project_stack():
+    """Последние кадры стека, относящиеся к коду проекта."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames[-SLOW_QUERY_STACK_DEPTH:]))
+
+
+def explain(alias, sql, params, many):
+    """Снимает план выполнения запроса или возвращает пустую строку."""
+    connection = connections[alias]
+    if many:
+        return ''
+    if connection.vendor == 'postgresql':
+        # ANALYZE выполняет запрос, поэтому изменяющие запросы
+        # и блокировки только описываются.
+        statement = sql.lstrip().upper()
+        if statement.startswith('SELECT') and 'FOR UPDATE' not in statement:
+            prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+        else:
+            prefix = 'EXPLAIN '
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        return ''
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError:
+        logger.warning('Не удалось получить план запроса', exc_info=True)
+        return ''
+
+
+def record_slow_query(origin, sql, params, many, alias, duration, stack):
+    """Сохраняет медленный запрос, объединяя его с прежними по отпечатку."""
+    normalized, key = fingerprint(sql)
+    changes = {
+        'example': sql,
+        'params': repr(params),
+        'origin': origin[:SLOW_QUERY_ORIGIN_MAX_LENGTH],
+        'stack': stack,
+    }
+    known = SlowQuery.objects.filter(fingerprint=key).values(
+        'max_time', 'plan').first()
+    if known is None:
+        SlowQuery.objects.create(
+            fingerprint=key, sql=normalized, total_time=duration,
+            max_time=duration, plan=explain(alias, sql, params, many),
+            **changes
+        )
+        return
+    if duration > known['max_time'] or not known['plan']:
+        changes['plan'] = explain(alias, sql, params, many)
+    SlowQuery.objects.filter(fingerprint=key).update(
+        count=F('count') + 1,
+        total_time=F('total_time') + duration,
+        max_time=Greatest('max_time', Value(duration)),
+        last_seen=timezone.now(),
+        **changes
+    )
+
+
+class SlowQueryCollector:
+    """Обёртка execute_wrapper, запоминающая медленные запросы."""
+
+    def __init__(self, origin, threshold):
+        self.origin = origin
+        self.threshold = threshold
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - start) * 1000
+        if duration >= self.threshold:
+            self.queries.append((
+                sql, params, many, context['connection'].alias,
+                duration, project_stack()
+            ))
+        return result
+
+
+@contextmanager
+def capture_slow_queries(origin):
+    """
+    Записывает медленные запросы блока. Источник можно уточнить
+    внутри блока через атрибут origin возвращаемого объекта.
+    """
+    collector = SlowQueryCollector(origin, settings.SLOW_QUERY_THRESHOLD_MS)
+    if not collector.threshold:
+        yield collector
+        return
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            yield collector
+    finally:
+        # Обёртки уже сняты: EXPLAIN и запись в SlowQuery не замеряются.
+        for query in collector.queries:
+            try:
+                record_slow_query(collector.origin, *query)
+            except DatabaseError:
+                logger.exception('Не удалось сохранить медленный запрос')
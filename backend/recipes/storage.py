@@ -0,0 +1,96 @@
+"""
+Хранилища медиафайлов с адресацией по содержимому.
+
+Имя файла строится из SHA-256 его содержимого, поэтому одинаковые
+изображения хранятся один раз, а URL файла никогда не меняет своего
+содержимого и может кэшироваться бессрочно. Так как один файл может
+принадлежать нескольким объектам, файлы не удаляются вместе с
+объектами: неиспользуемые файлы удаляет команда gc_media.
+
+Повторная загрузка уже сохранённого файла обновляет время его
+изменения. Очистка не трогает файлы моложе MEDIA_GC_GRACE_HOURS,
+поэтому файл, ссылка на который ещё не зафиксирована, не удаляется.
+"""
+
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    """Возвращает SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedMixin:
+    """Сохраняет файл под именем, вычисленным по его содержимому."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = content_hash(content)
+        name = posixpath.join(
+            posixpath.dirname(name), digest[:2],
+            digest + posixpath.splitext(name)[1].lower()
+        )
+        if self.exists(name):
+            try:
+                self.touch(name)
+                return name
+            except FileNotFoundError:
+                # Файл удалили между проверкой и обновлением.
+                pass
+        return super().save(name, content, max_length=max_length)
+
+    def touch(self, name):
+        """Обновляет время изменения файла."""
+        raise NotImplementedError
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    """Локальное хранилище с адресацией по содержимому."""
+
+    def touch(self, name):
+        os.utime(self.path(name))
+
+
+try:
+    from botocore.exceptions import ClientError
+    from storages.backends.s3 import S3Storage
+    from storages.utils import clean_name
+except ImportError:
+    pass
+else:
+    class ContentAddressedS3Storage(ContentAddressedMixin, S3Storage):
+        """S3-совместимое хранилище с адресацией по содержимому."""
+
+        def touch(self, name):
+            # Время изменения объекта S3 обновляет только копирование
+            # в себя с заменой метаданных, поэтому они копируются явно.
+            key = self._normalize_name(clean_name(name))
+            client = self.connection.meta.client
+            try:
+                head = client.head_object(Bucket=self.bucket_name, Key=key)
+            except ClientError as error:
+                if error.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                    raise FileNotFoundError(name) from error
+                raise
+            client.copy_object(
+                Bucket=self.bucket_name, Key=key,
+                CopySource={'Bucket': self.bucket_name, 'Key': key},
+                MetadataDirective='REPLACE',
+                Metadata=head['Metadata'],
+                ContentType=head['ContentType'],
+                **{field: head[field] for field in (
+                    'CacheControl', 'ContentDisposition', 'ContentEncoding'
+                ) if field in head}
+            )
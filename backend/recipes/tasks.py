@@ -0,0 +1,40 @@
+from functools import partial
+
+from . import purge
+from .changelog import compact_changelog
+from .constants import POPULARITY_UPDATE_INTERVAL
+from .popularity import update_popularity
+from .queue import report_progress, task
+from .shopping_list import archive_stale_shopping_carts
+
+
+@task(every=POPULARITY_UPDATE_INTERVAL)
+def recalculate_popularity(task):
+    """Фоновое обновление популярности рецептов."""
+    return f'Учтено событий: {update_popularity()}'
+
+
+@task
+def compact_sync_log(task):
+    """Фоновое сжатие журнала изменений."""
+    return f'Удалено записей: {compact_changelog()}'
+
+
+@task
+def archive_shopping_carts(task):
+    """Фоновая архивация заброшенных списков покупок."""
+    return f'Перенесено строк: {archive_stale_shopping_carts()}'
+
+
+@task
+def purge_recipes(task, recipe_ids):
+    """Фоновая очистка удалённых рецептов."""
+    deleted = purge.purge_recipes(recipe_ids, partial(report_progress, task))
+    return f'Удалено объектов: {deleted}'
+
+
+@task
+def purge_users(task, user_ids):
+    """Фоновая очистка удалённых пользователей."""
+    deleted = purge.purge_users(user_ids, partial(report_progress, task))
+    return f'Удалено объектов: {deleted}'
@@ -0,0 +1,788 @@
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .constants import (
+    MEDIA_GC_GRACE_HOURS, POPULARITY_FAVORITE_WEIGHT,
+    POPULARITY_HALF_LIFE_DAYS, POPULARITY_LAG_SECONDS,
+    POPULARITY_SHOPPING_CART_WEIGHT, POPULARITY_UPDATE_INTERVAL,
+    SHOPPING_CART_ARCHIVE_DAYS, TASK_MAX_ATTEMPTS, TASK_RETRY_DELAY,
+    TASK_TIMEOUT, TASK_TIMEOUT_ERROR
+)
+from .models import (
+    ArchivedShoppingCart, ChangeLog, Favorite, Ingredient, Recipe,
+    RecipeIngredients, RecipePopularity, RecipeSimilarity, ShoppingCart,
+    ShoppingListItem, SlowQuery, Subscription, Tag, Task, User
+)
+from .popularity import add_log2, update_popularity
+from .queue import (
+    claim_next, enqueue, registry, run_task, schedule_periodic
+)
+from .purge import (
+    delete_unused_files, purge_recipes, purge_users, soft_delete_recipes,
+    soft_delete_users
+)
+from .shopping_list import archive_stale_shopping_carts, clear_shopping_cart
+from .slow_queries import capture_slow_queries, fingerprint, record_slow_query
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class AdminChangeListQueriesTest(TestCase):
+    """Число запросов страниц списков админки не зависит от числа строк."""
+
+    # Страница списка, параметры фильтра и ожидаемое число запросов.
+    CHANGELISTS = (
+        ('user', {}, 5),
+        ('subscription', {}, 5),
+        ('subscription', {'subscriber': 'author'}, 6),
+        ('recipe', {}, 9),
+        ('recipe', {'author': 'author'}, 10),
+        ('ingredient', {}, 6),
+        ('tag', {}, 5),
+        ('favorite', {}, 5),
+        ('shoppingcart', {}, 5),
+        ('archivedshoppingcart', {}, 5),
+        ('recipeingredients', {}, 5),
+        ('task', {}, 6),
+        ('slowquery', {}, 6),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin',
+            first_name='Админ', last_name='Админов')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.rows = 0
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_rows(self, count):
+        """Добавляет по count строк в каждую таблицу из админки."""
+        for number in range(self.rows, self.rows + count):
+            user = User.objects.create_user(
+                username=f'user{number}', email=f'user{number}@example.com',
+                password='user', first_name='Имя', last_name='Фамилия')
+            tag = Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            ingredient = Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г')
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=number + 1, image='recipes/images/recipe.png')
+            recipe.tags.add(tag)
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=10)
+            Favorite.objects.create(user=user, recipe=recipe)
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+            ArchivedShoppingCart.objects.create(
+                user=self.author, recipe=recipe, created_at=timezone.now())
+            Subscription.objects.create(subscriber=self.author, author=user)
+            Task.objects.create(name='rebuild_shopping_lists', user=user)
+            SlowQuery.objects.create(
+                fingerprint=f'{number:040}', sql='SELECT ?',
+                origin='GET api:recipes-list', total_time=600, max_time=600)
+        self.rows += count
+
+    def assert_changelist_queries(self):
+        for model_name, params, queries in self.CHANGELISTS:
+            params = {
+                name: getattr(self, value).pk for name, value in params.items()
+            }
+            with self.subTest(model=model_name, params=params):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        reverse(f'admin:recipes_{model_name}_changelist'),
+                        params)
+                self.assertEqual(response.status_code, 200)
+
+    def test_changelist_queries_do_not_depend_on_rows(self):
+        self.create_rows(2)
+        self.assert_changelist_queries()
+        self.create_rows(5)
+        self.assert_changelist_queries()
+
+
+class SoftDeletedShoppingListTest(TestCase):
+    """Удалённые рецепты сразу исчезают из списков покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г')
+        cls.recipes = []
+        for amount in (100, 50):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {amount}', text='Текст',
+                cooking_time=5, image='recipes/images/recipe.png')
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=amount)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            cls.recipes.append(recipe)
+
+    def amounts(self):
+        return list(ShoppingListItem.objects.filter(
+            user=self.user).values_list('amount', flat=True))
+
+    def test_soft_delete_and_purge_recipe(self):
+        self.assertEqual(self.amounts(), [150])
+        soft_delete_recipes(Recipe.objects.filter(pk=self.recipes[1].pk))
+        self.assertEqual(self.amounts(), [100])
+        purge_recipes([self.recipes[1].pk])
+        self.assertEqual(self.amounts(), [100])
+        self.assertEqual(
+            list(self.user.shoppingcarts.values_list('recipe', flat=True)),
+            [self.recipes[0].pk])
+
+    def test_soft_delete_author(self):
+        soft_delete_users(User.objects.filter(pk=self.author.pk))
+        self.assertEqual(self.amounts(), [])
+
+
+class ShoppingCartCleanupTest(TestCase):
+    """Очистка и архивация списков покупок одним запросом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{number}', email=f'user{number}@example.com',
+                password='user', first_name='Имя', last_name='Фамилия')
+            for number in range(2)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г')
+        cls.recipes = []
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=5, image='recipes/images/recipe.png')
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100)
+            cls.recipes.append(recipe)
+        for user in cls.users:
+            for recipe in cls.recipes:
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    def deleted_from_log(self, user):
+        return set(ChangeLog.objects.filter(
+            user=user, kind=ChangeLog.Kind.SHOPPING_CART,
+            action=ChangeLog.Action.DELETE
+        ).values_list('object_id', flat=True))
+
+    def test_clear_shopping_cart(self):
+        user, other = self.users
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.delete('/api/recipes/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(user.shoppingcarts.exists())
+        self.assertFalse(ShoppingListItem.objects.filter(user=user).exists())
+        self.assertEqual(self.deleted_from_log(user),
+                         {recipe.id for recipe in self.recipes})
+        self.assertEqual(other.shoppingcarts.count(), 2)
+        self.assertEqual(clear_shopping_cart(user.id), 0)
+
+    def test_archive_stale_shopping_carts(self):
+        stale, active = self.users
+        ShoppingCart.objects.filter(user=stale).update(
+            created_at=timezone.now() - timedelta(
+                days=SHOPPING_CART_ARCHIVE_DAYS + 1))
+        # Список с одним свежим рецептом остаётся активным целиком.
+        ShoppingCart.objects.filter(
+            user=active, recipe=self.recipes[0]
+        ).update(created_at=timezone.now() - timedelta(
+            days=SHOPPING_CART_ARCHIVE_DAYS + 1))
+        self.assertEqual(archive_stale_shopping_carts(batch_size=1), 2)
+        self.assertFalse(stale.shoppingcarts.exists())
+        self.assertFalse(ShoppingListItem.objects.filter(user=stale).exists())
+        self.assertEqual(
+            set(ArchivedShoppingCart.objects.values_list('user', 'recipe')),
+            {(stale.id, recipe.id) for recipe in self.recipes})
+        self.assertEqual(self.deleted_from_log(stale),
+                         {recipe.id for recipe in self.recipes})
+        self.assertEqual(active.shoppingcarts.count(), 2)
+        self.assertEqual(archive_stale_shopping_carts(), 0)
+
+
+class SoftDeleteTest(TestCase):
+    """Мягкое удаление рецептов и пользователей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=5,
+            image='recipes/images/recipe.png')
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        Subscription.objects.create(subscriber=cls.user, author=cls.author)
+
+    def test_recipe_delete_hides_recipe_and_enqueues_purge(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.delete(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Recipe.objects.filter(pk=self.recipe.pk).exists())
+        self.assertTrue(
+            Recipe.all_objects.filter(pk=self.recipe.pk).exists())
+        self.assertEqual(
+            client.get(f'/api/recipes/{self.recipe.id}/').status_code, 404)
+        # Связи остаются до фоновой очистки.
+        self.assertTrue(Favorite.objects.filter(recipe=self.recipe).exists())
+        self.assertTrue(ChangeLog.objects.filter(
+            kind=ChangeLog.Kind.RECIPE, object_id=self.recipe.id,
+            action=ChangeLog.Action.DELETE).exists())
+        task = Task.objects.get(name='purge_recipes')
+        self.assertEqual(task.payload, {'recipe_ids': [self.recipe.id]})
+
+    def test_user_delete_hides_user_and_recipes_and_revokes_tokens(self):
+        Token.objects.create(user=self.author)
+        task = soft_delete_users(User.objects.filter(pk=self.author.pk))
+        self.assertEqual(task.name, 'purge_users')
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        author = User.all_objects.get(pk=self.author.pk)
+        self.assertIsNotNone(author.deleted_at)
+        self.assertFalse(author.is_active)
+        self.assertFalse(Token.objects.filter(user=author).exists())
+        self.assertFalse(Recipe.objects.filter(author=author).exists())
+        self.assertTrue(Recipe.all_objects.filter(author=author).exists())
+        # Рецепты очищает задача пользователей.
+        self.assertFalse(Task.objects.filter(name='purge_recipes').exists())
+
+    def test_soft_delete_without_rows(self):
+        self.assertIsNone(soft_delete_recipes(Recipe.objects.none()))
+        self.assertIsNone(soft_delete_users(User.objects.none()))
+
+
+class PurgeTest(TestCase):
+    """Фоновая очистка удалённых рецептов и пользователей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=5, image='recipes/images/recipe.png')
+            for number in range(2)
+        ]
+        for recipe in cls.recipes:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        RecipeSimilarity.objects.create(
+            recipe=cls.recipes[0], similar=cls.recipes[1], score=1)
+        Subscription.objects.create(subscriber=cls.user, author=cls.author)
+
+    def test_purge_recipes_reports_stages(self):
+        recipe = self.recipes[0]
+        soft_delete_recipes(Recipe.objects.filter(pk=recipe.pk))
+        progress = []
+        deleted = purge_recipes(
+            [recipe.pk], lambda **state: progress.append(state))
+        # Избранное, корзина, похожие рецепты и сам рецепт.
+        self.assertEqual(deleted, 4)
+        self.assertEqual(
+            [state['stage'] for state in progress],
+            ['favorites', 'shopping_carts', 'similar_recipes', 'recipes'])
+        self.assertEqual(progress[-1], {
+            'stage': 'recipes', 'done': 4, 'total': 4})
+        self.assertFalse(Recipe.all_objects.filter(pk=recipe.pk).exists())
+        self.assertFalse(RecipeSimilarity.objects.exists())
+        self.assertTrue(Recipe.objects.filter(pk=self.recipes[1].pk).exists())
+
+    def test_purge_recipes_skips_active_recipes(self):
+        self.assertEqual(purge_recipes([self.recipes[0].pk]), 0)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_purge_users(self):
+        soft_delete_users(User.objects.filter(pk=self.author.pk))
+        purge_users([self.author.pk])
+        self.assertFalse(User.all_objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Recipe.all_objects.exists())
+        self.assertFalse(Subscription.objects.exists())
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DeleteUnusedFilesTest(TestCase):
+    """Удаление файлов, на которые больше не ссылаются объекты."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+
+    def save_file(self, content, age_hours=0):
+        name = default_storage.save(
+            'recipes/images/image.png', ContentFile(content))
+        moment = time.time() - age_hours * 60 * 60
+        os.utime(default_storage.path(name), (moment, moment))
+        return name
+
+    def test_deletes_only_old_unreferenced_files(self):
+        old = self.save_file(b'old', MEDIA_GC_GRACE_HOURS + 1)
+        fresh = self.save_file(b'fresh')
+        used = self.save_file(b'used', MEDIA_GC_GRACE_HOURS + 1)
+        Recipe.objects.create(author=self.author, name='Рецепт',
+                              text='Текст', cooking_time=5, image=used)
+        self.assertEqual(delete_unused_files([old, fresh, used]), 1)
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(fresh))
+        self.assertTrue(default_storage.exists(used))
+
+    def test_reupload_refreshes_file(self):
+        name = self.save_file(b'image', MEDIA_GC_GRACE_HOURS + 1)
+        # Та же картинка загружена снова, ссылка ещё не сохранена.
+        self.assertEqual(default_storage.save(
+            'recipes/images/image.png', ContentFile(b'image')), name)
+        self.assertEqual(delete_unused_files([name]), 0)
+        self.assertTrue(default_storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    """Хранение медиафайлов по хэшу содержимого и команда gc_media."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+
+    def save_file(self, content, name='recipes/images/image.png',
+                  age_hours=MEDIA_GC_GRACE_HOURS + 1):
+        name = default_storage.save(name, ContentFile(content))
+        moment = time.time() - age_hours * 60 * 60
+        os.utime(default_storage.path(name), (moment, moment))
+        return name
+
+    def gc_media(self, *args):
+        out = StringIO()
+        call_command('gc_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_same_content_is_stored_once(self):
+        digest = hashlib.sha256(b'image').hexdigest()
+        name = default_storage.save(
+            'recipes/images/photo.PNG', ContentFile(b'image'))
+        self.assertEqual(name, f'recipes/images/{digest[:2]}/{digest}.png')
+        self.assertEqual(default_storage.save(
+            'recipes/images/other.png', ContentFile(b'image')), name)
+        self.assertNotEqual(default_storage.save(
+            'recipes/images/other.png', ContentFile(b'other')), name)
+        self.assertEqual(
+            len(default_storage.listdir(f'recipes/images/{digest[:2]}')[1]),
+            1)
+
+    def test_gc_media(self):
+        unused = self.save_file(b'unused')
+        fresh = self.save_file(b'fresh', age_hours=0)
+        image = self.save_file(b'image')
+        avatar = self.save_file(b'avatar', 'users/images/avatar.png')
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст', cooking_time=5,
+            image=image)
+        self.author.avatar = avatar
+        self.author.save()
+        # Файлы скрытых, но ещё не очищенных объектов не удаляются.
+        soft_delete_recipes(Recipe.objects.filter(pk=recipe.pk), purge=False)
+        self.assertIn(unused, self.gc_media('--dry-run'))
+        self.assertTrue(default_storage.exists(unused))
+        self.assertIn('Неиспользуемых файлов: 1', self.gc_media())
+        self.assertFalse(default_storage.exists(unused))
+        for name in (fresh, image, avatar):
+            self.assertTrue(default_storage.exists(name))
+        self.gc_media('--min-age', '0')
+        self.assertFalse(default_storage.exists(fresh))
+        self.assertTrue(default_storage.exists(image))
+
+
+class PopularityScoreTest(TestCase):
+    """Затухающая оценка популярности в логарифмах."""
+
+    def test_decay(self):
+        moment = timezone.now()
+        popularity = RecipePopularity(
+            log_score=RecipePopularity.log_weight(3, moment))
+        self.assertAlmostEqual(popularity.decayed_score(moment), 3)
+        self.assertAlmostEqual(popularity.decayed_score(
+            moment + timedelta(days=POPULARITY_HALF_LIFE_DAYS)), 1.5)
+
+    def test_far_future_does_not_overflow(self):
+        # 2 ** число полураспадов переполнило бы float уже к 2043 году.
+        moment = datetime(2500, 1, 1, tzinfo=timezone.utc)
+        log_score = add_log2(
+            RecipePopularity.log_weight(1, moment),
+            RecipePopularity.log_weight(1, moment))
+        popularity = RecipePopularity(log_score=log_score)
+        self.assertAlmostEqual(popularity.decayed_score(moment), 2)
+        self.assertEqual(popularity.decayed_score(
+            moment + timedelta(days=365 * 100)), 0)
+
+    def test_add_log2(self):
+        self.assertAlmostEqual(add_log2(3, 1), math.log2(8 + 2))
+        self.assertEqual(add_log2(-math.inf, 5), 5)
+        # Малое слагаемое не теряет точность большого.
+        self.assertEqual(add_log2(5000, 0), 5000)
+
+
+class PopularityUpdateTest(TestCase):
+    """Инкрементальное обновление популярности."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=5, image='recipes/images/recipe.png')
+            for number in range(2)
+        ]
+
+    def add_event(self, model, recipe, moment):
+        relation = model.objects.create(user=self.user, recipe=recipe)
+        model.objects.filter(pk=relation.pk).update(created_at=moment)
+
+    def update(self, moment):
+        with mock.patch('recipes.popularity.timezone.now',
+                        return_value=moment):
+            return update_popularity()
+
+    def test_watermark_and_lag(self):
+        hour_ago = self.now - timedelta(hours=1)
+        self.add_event(Favorite, self.recipes[0], hour_ago)
+        self.add_event(ShoppingCart, self.recipes[0], hour_ago)
+        # Событие моложе задержки учитывается следующим обновлением.
+        recent = self.now - timedelta(seconds=POPULARITY_LAG_SECONDS // 2)
+        self.add_event(Favorite, self.recipes[1], recent)
+
+        self.assertEqual(self.update(self.now), 2)
+        popularity = RecipePopularity.objects.get()
+        self.assertEqual(popularity.recipe, self.recipes[0])
+        self.assertEqual(popularity.updated_at, self.now - timedelta(
+            seconds=POPULARITY_LAG_SECONDS))
+        self.assertAlmostEqual(
+            popularity.decayed_score(hour_ago),
+            POPULARITY_FAVORITE_WEIGHT + POPULARITY_SHOPPING_CART_WEIGHT)
+
+        # Повторное обновление не учитывает события дважды.
+        self.assertEqual(self.update(self.now), 0)
+        later = self.now + timedelta(seconds=POPULARITY_LAG_SECONDS)
+        self.assertEqual(self.update(later), 1)
+        self.assertEqual(RecipePopularity.objects.get(
+            recipe=self.recipes[0]).log_score, popularity.log_score)
+        self.assertAlmostEqual(RecipePopularity.objects.get(
+            recipe=self.recipes[1]).decayed_score(recent),
+            POPULARITY_FAVORITE_WEIGHT)
+
+    def test_recent_event_outranks_old_ones(self):
+        self.add_event(Favorite, self.recipes[0], self.now - timedelta(
+            days=POPULARITY_HALF_LIFE_DAYS * 2))
+        self.add_event(ShoppingCart, self.recipes[0], self.now - timedelta(
+            days=POPULARITY_HALF_LIFE_DAYS * 2))
+        self.add_event(Favorite, self.recipes[1], self.now - timedelta(
+            hours=1))
+        self.update(self.now)
+        self.assertEqual(
+            [popularity.recipe for popularity in
+             RecipePopularity.objects.all()],
+            [self.recipes[1], self.recipes[0]])
+
+
+class PeriodicTaskTest(TestCase):
+    """Периодические фоновые задачи."""
+
+    def queued(self):
+        return Task.objects.filter(
+            name='recalculate_popularity', periodic=True,
+            status=Task.Status.PENDING)
+
+    def test_schedule_does_not_duplicate(self):
+        schedule_periodic()
+        schedule_periodic()
+        self.assertEqual(self.queued().count(), 1)
+
+    def test_task_is_rescheduled_after_run(self):
+        schedule_periodic()
+        task = claim_next()
+        self.assertEqual(task.name, 'recalculate_popularity')
+        # Выполняющаяся задача не ставится второй раз.
+        schedule_periodic()
+        self.assertFalse(self.queued().exists())
+        start = timezone.now()
+        run_task(task)
+        self.assertEqual(task.status, Task.Status.DONE)
+        next_run = self.queued().get()
+        self.assertGreaterEqual(next_run.run_after, start + timedelta(
+            seconds=POPULARITY_UPDATE_INTERVAL))
+        # Следующий запуск ещё не наступил.
+        self.assertIsNone(claim_next())
+
+
+def failing_task(task):
+    raise ValueError('Ошибка обработчика')
+
+
+def file_task(task, filename):
+    return ContentFile('data', name=filename)
+
+
+@mock.patch.dict(registry, {'failing_task': failing_task,
+                            'file_task': file_task})
+class TaskQueueTest(TestCase):
+    """Очередь фоновых задач: повторы, задержки и зависшие задачи."""
+
+    def run_next(self):
+        task = claim_next()
+        self.assertIsNotNone(task)
+        return run_task(task)
+
+    def run_failing(self):
+        with self.assertLogs('recipes.queue', 'ERROR'):
+            return self.run_next()
+
+    def test_retry_with_backoff(self):
+        task = enqueue('failing_task')
+        for attempt in range(1, TASK_MAX_ATTEMPTS):
+            start = timezone.now()
+            task = self.run_failing()
+            self.assertEqual(task.status, Task.Status.PENDING)
+            self.assertEqual(task.attempts, attempt)
+            self.assertIn('Ошибка обработчика', task.error)
+            delay = timedelta(seconds=TASK_RETRY_DELAY * 2 ** (attempt - 1))
+            self.assertGreaterEqual(task.run_after, start + delay)
+            self.assertLessEqual(task.run_after, timezone.now() + delay)
+            # До истечения задержки задача не выдаётся.
+            self.assertIsNone(claim_next())
+            Task.objects.filter(pk=task.pk).update(run_after=start)
+        task = self.run_failing()
+        self.assertEqual(task.status, Task.Status.FAILED)
+        self.assertEqual(task.attempts, TASK_MAX_ATTEMPTS)
+        self.assertIsNone(claim_next())
+
+    def test_file_result(self):
+        task = enqueue('file_task', filename='report.txt')
+        task = self.run_next()
+        self.assertEqual(task.status, Task.Status.DONE)
+        self.assertEqual(task.result_name, 'report.txt')
+        self.assertEqual(task.result, 'data')
+
+    def test_queue_order(self):
+        later = enqueue('file_task', filename='later.txt')
+        Task.objects.filter(pk=later.pk).update(
+            run_after=timezone.now() - timedelta(seconds=1))
+        first = enqueue('file_task', filename='first.txt')
+        second = enqueue('file_task', filename='second.txt')
+        Task.objects.filter(pk__in=[first.pk, second.pk]).update(
+            run_after=timezone.now() - timedelta(seconds=2))
+        self.assertEqual([claim_next().pk for _ in range(3)],
+                         [first.pk, second.pk, later.pk])
+
+    def test_stale_tasks_are_reclaimed(self):
+        retried = enqueue('file_task', filename='retried.txt')
+        exhausted = enqueue('file_task', filename='exhausted.txt')
+        Task.objects.filter(pk=retried.pk).update(
+            status=Task.Status.RUNNING, attempts=1)
+        Task.objects.filter(pk=exhausted.pk).update(
+            status=Task.Status.RUNNING, attempts=TASK_MAX_ATTEMPTS)
+        # Выполняющиеся задачи не выдаются, пока не зависли.
+        self.assertIsNone(claim_next())
+        Task.objects.update(
+            updated_at=timezone.now() - timedelta(seconds=TASK_TIMEOUT + 1))
+        task = claim_next()
+        self.assertEqual(task.pk, retried.pk)
+        self.assertEqual(task.attempts, 2)
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, Task.Status.FAILED)
+        self.assertEqual(exhausted.error, TASK_TIMEOUT_ERROR)
+        self.assertIsNone(claim_next())
+
+
+class RecommendationsTest(TestCase):
+    """Похожие рецепты и рекомендации по избранному."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='author',
+            first_name='Автор', last_name='Авторов')
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='user',
+            first_name='Имя', last_name='Фамилия')
+        flour, egg, salt = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Яйцо', 'Соль'))
+        breakfast = Tag.objects.create(name='Завтрак', slug='breakfast')
+        dinner = Tag.objects.create(name='Ужин', slug='dinner')
+        cls.recipes = []
+        for ingredients, tag in (
+            ((flour, egg), breakfast),
+            ((flour, egg), breakfast),
+            ((flour,), dinner),
+            ((salt,), dinner),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.author, name='Рецепт', text='Текст',
+                cooking_time=5, image='recipes/images/recipe.png')
+            recipe.tags.add(tag)
+            for ingredient in ingredients:
+                RecipeIngredients.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=100)
+            cls.recipes.append(recipe)
+        Favorite.objects.create(user=cls.author, recipe=cls.recipes[0])
+        Favorite.objects.create(user=cls.author, recipe=cls.recipes[1])
+
+    def setUp(self):
+        self.client = APIClient()
+        call_command('build_recommendations', top_k=2, stdout=StringIO())
+
+    def similar(self, recipe_id):
+        return self.client.get(f'/api/recipes/{recipe_id}/similar/')
+
+    def similar_ids(self, recipe):
+        response = self.similar(recipe.id)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_build_recommendations(self):
+        first, second, third, fourth = self.recipes
+        scores = dict(RecipeSimilarity.objects.filter(
+            recipe=first).values_list('similar', 'score'))
+        self.assertEqual(set(scores), {second.id, third.id})
+        self.assertGreater(scores[second.id], scores[third.id])
+        self.assertFalse(RecipeSimilarity.objects.filter(
+            recipe=fourth).exclude(similar=third).exists())
+        self.assertFalse(RecipeSimilarity.objects.filter(
+            recipe=F('similar')).exists())
+        self.assertFalse(RecipeSimilarity.objects.filter(
+            score__lte=0).exists())
+
+    def test_similar(self):
+        first, second, third, fourth = self.recipes
+        self.assertEqual(self.similar_ids(first), [second.id, third.id])
+        self.assertEqual(self.similar_ids(fourth), [third.id])
+        soft_delete_recipes(Recipe.objects.filter(pk=second.pk))
+        self.assertEqual(self.similar_ids(first), [third.id])
+        self.assertEqual(self.similar(second.id).status_code, 404)
+        self.assertEqual(self.similar(fourth.id + 100).status_code, 404)
+
+    def test_recommended(self):
+        first, second, third, _ = self.recipes
+        self.assertEqual(
+            self.client.get('/api/recipes/recommended/').status_code, 401)
+        self.client.force_authenticate(self.user)
+        Favorite.objects.create(user=self.user, recipe=first)
+        response = self.client.get('/api/recipes/recommended/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data],
+                         [second.id, third.id])
+        Favorite.objects.create(user=self.user, recipe=second)
+        response = self.client.get('/api/recipes/recommended/')
+        self.assertEqual([item['id'] for item in response.data], [third.id])
+
+
+class SlowQueryTest(TestCase):
+    """Запись медленных запросов с объединением по отпечатку."""
+
+    def test_fingerprint(self):
+        normalized, key = fingerprint(
+            "SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'a''b'")
+        self.assertEqual(
+            normalized, 'SELECT * FROM t WHERE id IN (...) AND name = ?')
+        self.assertEqual(
+            fingerprint("SELECT  * FROM t WHERE id IN (%s) AND name = %s")[1],
+            key)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=1e-6)
+    def test_capture(self):
+        with capture_slow_queries('test') as collector:
+            list(Tag.objects.filter(id__in=[1]))
+            collector.origin = 'test tags'
+            list(Tag.objects.filter(id__in=[1, 2, 3]))
+        query = SlowQuery.objects.get()
+        self.assertEqual(query.count, 2)
+        self.assertEqual(query.origin, 'test tags')
+        self.assertIn('IN (...)', query.sql)
+        self.assertIn('(1, 2, 3)', query.params)
+        self.assertGreater(query.total_time, query.max_time)
+        self.assertTrue(query.plan)
+        self.assertIn('test_capture', query.stack)
+
+    def test_merge(self):
+        for duration in (700, 900, 800):
+            record_slow_query('test', 'SELECT 1', (), False, 'default',
+                              duration, '')
+        query = SlowQuery.objects.get()
+        self.assertEqual(query.sql, 'SELECT ?')
+        self.assertEqual(
+            (query.count, query.total_time, query.max_time), (3, 2400, 900))
+
+    def test_threshold(self):
+        for threshold in (0, 10 ** 6):
+            with override_settings(SLOW_QUERY_THRESHOLD_MS=threshold):
+                with capture_slow_queries('test'):
+                    list(Tag.objects.all())
+        self.assertFalse(SlowQuery.objects.exists())
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=1e-6)
+    def test_middleware_origin(self):
+        self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+        self.assertIn(
+            'GET api:tag-list',
+            SlowQuery.objects.values_list('origin', flat=True))
@@ -0,0 +1,54 @@
+"""
+Перевод единиц измерения продуктов в базовые.
+
+Обозначения единиц сравниваются без учёта регистра, точек и пробелов,
+поэтому «кг», «Кг.» и «кг» считаются одной единицей. Перевод выполняется
+в SQL выражениями CASE, и количества в разных единицах складываются
+в том же агрегирующем запросе, что и строки списка покупок.
+"""
+
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Lower, Replace
+
+from .constants import UNIT_CONVERSIONS
+
+
+def unit_key(unit):
+    """Приводит обозначение единицы к виду для сравнения."""
+    return unit.lower().replace('.', '').replace(' ', '')
+
+
+def unit_key_expression(field):
+    """SQL-выражение, аналогичное unit_key."""
+    return Lower(Replace(
+        Replace(F(field), Value('.'), Value('')), Value(' '), Value('')))
+
+
+UNITS = {
+    unit_key(unit): conversion
+    for unit, conversion in UNIT_CONVERSIONS.items()
+}
+
+
+def aggregate_in_base_units(queryset, amount='amount',
+                            ingredient='ingredient'):
+    """
+    Суммирует количества продуктов в базовых единицах.
+    Строки объединяются по названию продукта без учёта регистра
+    и базовой единице измерения.
+    """
+    unit = f'{ingredient}__measurement_unit'
+    queryset = queryset.annotate(unit_key=unit_key_expression(unit))
+    return queryset.values(
+        name=Lower(f'{ingredient}__name'),
+        measurement_unit=Case(
+            *(When(unit_key=key, then=Value(base))
+              for key, (base, _) in UNITS.items()),
+            default=F(unit)
+        )
+    ).annotate(amount=Sum(F(amount) * Case(
+        *(When(unit_key=key, then=Value(factor))
+          for key, (_, factor) in UNITS.items()),
+        default=Value(1),
+        output_field=IntegerField()
+    ))).order_by('name', 'measurement_unit')
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404, redirect
+from django.views.decorators.cache import cache_control
 
 from .models import Recipe
 
 
+@cache_control(public=True, max_age=settings.SHORT_LINK_CACHE_MAX_AGE)
 def recipe_redirect(request, pk):
     recipe = get_object_or_404(Recipe, id=pk)
     return redirect(recipe.get_absolute_url())
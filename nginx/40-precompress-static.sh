@@ -0,0 +1,17 @@
+#!/bin/sh
+# Создаёт сжатые копии статических файлов для gzip_static.
+# Пересжимаются только файлы, изменившиеся с прошлого запуска.
+set -e
+
+STATIC_ROOT=${STATIC_ROOT:-/static}
+
+[ -d "$STATIC_ROOT" ] || exit 0
+
+find "$STATIC_ROOT" -type f \
+    \( -name '*.js' -o -name '*.css' -o -name '*.html' -o -name '*.json' \
+       -o -name '*.svg' -o -name '*.txt' -o -name '*.map' \) \
+    | while read -r file; do
+        if [ ! -f "$file.gz" ] || [ "$file" -nt "$file.gz" ]; then
+            gzip -9 -k -f "$file"
+        fi
+    done
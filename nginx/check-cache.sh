@@ -0,0 +1,95 @@
+#!/bin/sh
+# Проверяет заголовки кэширования и кэш nginx на запущенном стеке
+# docker compose: ответы анонимам кэшируются и перепроверяются по ETag,
+# ответы с токеном не кэшируются и не берутся из кэша, клиенты с br
+# получают ответы в Brotli. Запускается в CI (задача cache_check).
+#
+# Запуск: BASE_URL=http://localhost:8000 EMAIL=... PASSWORD=... \
+#         sh nginx/check-cache.sh
+# Вместо EMAIL и PASSWORD можно передать готовый токен в TOKEN.
+set -eu
+
+BASE_URL=${BASE_URL:-http://localhost:8000}
+HEADERS=$(mktemp)
+trap 'rm -f "$HEADERS"' EXIT
+FAILED=0
+
+# Уникальный параметр: первый запрос гарантированно не попадёт в кэш.
+URL="$BASE_URL/api/recipes/?cache_check=$(date +%s)$$"
+
+request() {
+    curl -s -o /dev/null -D "$HEADERS" "$@"
+}
+
+header() {
+    grep -i "^$1:" "$HEADERS" | tail -n 1 | cut -d ' ' -f 2- | tr -d '\r'
+}
+
+status() {
+    head -n 1 "$HEADERS" | cut -d ' ' -f 2
+}
+
+check() {
+    if eval "$2"; then
+        echo "OK    $1"
+    else
+        echo "FAIL  $1"
+        FAILED=1
+    fi
+}
+
+if [ -z "${TOKEN:-}" ]; then
+    TOKEN=$(curl -s -H 'Content-Type: application/json' \
+        -d "{\"email\": \"${EMAIL:?Укажите EMAIL и PASSWORD или TOKEN}\",
+             \"password\": \"${PASSWORD:?Укажите PASSWORD}\"}" \
+        "$BASE_URL/api/auth/token/login/" \
+        | sed -n 's/.*"auth_token": *"\([^"]*\)".*/\1/p')
+fi
+[ -n "$TOKEN" ] || { echo 'Не удалось получить токен'; exit 1; }
+
+echo "Аноним: $URL"
+request "$URL"
+check 'первый запрос не из кэша' '[ "$(header X-Cache-Status)" != HIT ]'
+check 'Cache-Control public с max-age' \
+    'header Cache-Control | grep -q "public" &&
+     header Cache-Control | grep -q "max-age="'
+check 'Vary содержит Authorization' 'header Vary | grep -qi authorization'
+ETAG=$(header ETag)
+check 'есть ETag' '[ -n "$ETAG" ]'
+request "$URL"
+check 'повторный запрос из кэша nginx' '[ "$(header X-Cache-Status)" = HIT ]'
+request -H "If-None-Match: $ETAG" "$URL"
+check 'If-None-Match даёт 304' '[ "$(status)" = 304 ]'
+
+echo "С токеном: $URL"
+for attempt in 1 2; do
+    request -H "Authorization: Token $TOKEN" "$URL"
+    check "запрос $attempt мимо кэша nginx" \
+        '[ "$(header X-Cache-Status)" = BYPASS ]'
+    check "запрос $attempt: Cache-Control private, no-cache" \
+        'header Cache-Control | grep -q private &&
+         header Cache-Control | grep -q no-cache'
+    check "запрос $attempt: Vary содержит Authorization" \
+        'header Vary | grep -qi authorization'
+done
+
+# Список продуктов заведомо длиннее порога сжатия BrotliMiddleware.
+COMPRESSED_URL="$BASE_URL/api/ingredients/?cache_check=$(date +%s)$$"
+echo "Сжатие: $COMPRESSED_URL"
+request -H 'Accept-Encoding: br' "$COMPRESSED_URL"
+check 'клиент с br получает Brotli' '[ "$(header Content-Encoding)" = br ]'
+check 'Vary содержит Accept-Encoding' 'header Vary | grep -qi accept-encoding'
+request -H 'Accept-Encoding: br' "$COMPRESSED_URL"
+check 'Brotli-ответ из кэша nginx' \
+    '[ "$(header X-Cache-Status)" = HIT ] &&
+     [ "$(header Content-Encoding)" = br ]'
+request -H 'Accept-Encoding: gzip' "$COMPRESSED_URL"
+check 'клиент без br получает gzip' '[ "$(header Content-Encoding)" = gzip ]'
+
+echo "Аноним после запросов с токеном: $URL"
+request "$URL"
+check 'ответ из кэша остался публичным' \
+    '[ "$(header X-Cache-Status)" = HIT ] &&
+     ! header Cache-Control | grep -q private'
+
+exit "$FAILED"